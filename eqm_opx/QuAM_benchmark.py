@@ -0,0 +1,227 @@
+"""
+benchmark of the QuAM_utilities macros, without QuantumMachinesManager.
+For a grid of durations, slices and periods it builds a program with each macro and records
+the python build time, the statements/loops/plays in the program, an estimate of the plays
+executed in real time and the length of the generate_qua_script output. The statements are counted on that
+script (public API of qm), parsed with the ast module.
+
+Usage:
+    python -m eqm_opx.QuAM_benchmark --output bench.json
+    python -m eqm_opx.QuAM_benchmark --output bench_new.json --compare bench.json
+version 1.0
+"""
+
+import argparse
+import ast
+import datetime
+import itertools
+import json
+import platform
+import time
+
+from qm import generate_qua_script
+from qm.qua import *
+from quam.components import BasicQuAM, SingleChannel
+from quam.components.pulses import SquarePulse
+
+from . import QuAM_utilities
+from .QuAM_utilities import long_pulse, long_ramp, stroboscopic, add_stroboscopic_chunk, stroboscopic_chunked
+
+_LOOPS = ('for_', 'for_each_', 'while_', 'infinite_loop_')
+_DECLARATIONS = ('declare', 'declare_stream', 'declare_input_stream')
+
+
+def _name(node):
+    """Return the name of the QUA function called by an expression node, None if it is not a call."""
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return node.func.id
+    return None
+
+
+def _literal(node):
+    """Return the int value of a literal number node, None otherwise."""
+    try:
+        return int(ast.literal_eval(node))
+    except (ValueError, TypeError, SyntaxError):
+        return None
+
+
+def _iterations(loop):
+    """Estimate the iterations of a for_(i, a, i < b, i+1) loop call, None if it is not of this form."""
+    if _name(loop) != 'for_' or len(loop.args) != 4:
+        return None
+    _, init, condition, update = loop.args
+    if not (isinstance(condition, ast.Compare) and isinstance(condition.ops[0], (ast.Lt, ast.LtE))
+            and isinstance(update, ast.BinOp) and isinstance(update.op, ast.Add)):
+        return None
+    start, stop, step = _literal(init), _literal(condition.comparators[0]), _literal(update.right)
+    if None in (start, stop, step) or step <= 0:
+        return None
+    stop += isinstance(condition.ops[0], ast.LtE)
+    return max(0, -(-(stop - start) // step))
+
+
+def program_body(script):
+    """Return the statements of the `with program() as prog:` block of a generate_qua_script output (ast nodes)."""
+    for node in ast.parse(script).body:
+        if isinstance(node, ast.With) and _name(node.items[0].context_expr) == 'program':
+            return node.body
+    raise ValueError("The script has no `with program()` block.")
+
+
+def count_statements(statements, multiplier=1):
+    """
+    Walk the statements of a program body, as parsed from the script of generate_qua_script (see program_body).
+    The declarations and the stream processing are not counted.
+
+    Returns:
+    dict with the number of statements, loops and play statements in the program,
+    and the estimated number of plays executed in real time (None if a loop bound is not a literal).
+    """
+    counts = {'statements': 0, 'loops': 0, 'plays': 0, 'executed_plays': 0}
+    for statement in statements:
+        if isinstance(statement, ast.Assign) and _name(statement.value) in _DECLARATIONS:
+            continue
+        if isinstance(statement, ast.With):
+            block = statement.items[0].context_expr
+            if _name(block) == 'stream_processing':
+                continue
+            counts['statements'] += 1
+            inner_multiplier = multiplier
+            if _name(block) in _LOOPS:
+                counts['loops'] += 1
+                iterations = _iterations(block)
+                inner_multiplier = None if multiplier is None or iterations is None else multiplier*iterations
+            inner = count_statements(statement.body, inner_multiplier)
+            for key in ('statements', 'loops', 'plays'):
+                counts[key] += inner[key]
+            if counts['executed_plays'] is not None:
+                counts['executed_plays'] = None if inner['executed_plays'] is None else counts['executed_plays'] + inner['executed_plays']
+            continue
+        counts['statements'] += 1
+        if isinstance(statement, ast.Expr) and _name(statement.value) == 'play':
+            counts['plays'] += 1
+            if counts['executed_plays'] is not None:
+                counts['executed_plays'] = None if multiplier is None else counts['executed_plays'] + multiplier
+    return counts
+
+
+def benchmark_machine():
+    """A small machine with the operations used by the benchmark."""
+    machine = BasicQuAM()
+    machine.channels['ch'] = ch = SingleChannel(opx_output=('con1', 1), intermediate_frequency=100e6)
+    ch.operations['const'] = SquarePulse(length=100, amplitude=0.1)
+    ch.operations['high'] = SquarePulse(length=176, amplitude=0.38)
+    ch.operations['low'] = SquarePulse(length=28, amplitude=0)
+    return machine
+
+
+def measure(build, repeat=3):
+    """
+    Build a program with build() (which emits the macro inside a `with program()` block)
+    and return the metrics. The build time is the best of repeat runs.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with program() as prog:
+            amp_mod = declare_input_stream(fixed, name='amp_mod_input_stream')
+            build(amp_mod)
+        times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    script = generate_qua_script(prog)
+    script_time = time.perf_counter() - start
+    counts = count_statements(program_body(script)) # from the public script, not the internal AST of qm
+    return {'build_time': min(times), 'script_time': script_time, 'script_length': len(script), **counts}
+
+
+def cases(machine):
+    """Yield (macro, parameters, build function) for the benchmark grid."""
+    for time_ns, slices, modulated in itertools.product([1_000_000, 150_150_000, 700_000_000], [None, 10, 100], [False, True]):
+        yield 'long_pulse', {'time': time_ns, 'slices': slices, 'amp_mod': modulated}, \
+            lambda a, t=time_ns, s=slices, m=modulated: long_pulse('const', 'ch', t, slices=s, amp_mod=a if m else None)
+    for time_ns, n_steps in itertools.product([100_000, 10_000_000, 100_000_000], [None, 100, 1000]):
+        yield 'long_ramp', {'time': time_ns, 'n_steps': n_steps}, \
+            lambda a, t=time_ns, n=n_steps: long_ramp('const', 'ch', t, n_steps=n)
+    for periods, delay, modulated in itertools.product([1000, 100_000, 306_000], [0, 384], [False, True]):
+        yield 'stroboscopic', {'periods': periods, 'delay': delay, 'amp_mod': modulated}, \
+            lambda a, p=periods, d=delay, m=modulated: stroboscopic(('high', 'low'), 'ch', p, d, amp_mod=a if m else None)
+    for periods, delay in itertools.product([1000, 100_000, 306_000], [0, 384]):
+        name = f"chunk_{periods}_{delay}"
+        periods_per_chunk = add_stroboscopic_chunk(machine.channels['ch'], name, ('high', 'low'), periods, delay)
+        yield 'stroboscopic_chunked', {'periods': periods, 'delay': delay, 'periods_per_chunk': periods_per_chunk}, \
+            lambda a, n=name, p=periods, k=periods_per_chunk: stroboscopic_chunked(n, 'ch', p, k)
+
+
+def run(repeat=3):
+    """Run the whole grid and return the results as a json-serializable dict."""
+    machine = benchmark_machine()
+    results = []
+    for macro, parameters, build in cases(machine):
+        try:
+            metrics = measure(build, repeat)
+        except ValueError as error: # e.g. slices longer than the maximum pulse length
+            metrics = {'error': str(error)}
+        results.append({'macro': macro, 'parameters': parameters, **metrics})
+    meta = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'QuAM_utilities': getattr(QuAM_utilities, '__doc__', '').strip().splitlines()[-1],
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(old, new, tolerance=0.2):
+    """
+    Compare two benchmark results (dicts as returned by run).
+    Returns the list of regressions: cases present in both where a metric grew by more than tolerance
+    (relative; the build time is noisy, the other metrics are exact).
+    """
+    key = lambda result: (result['macro'], json.dumps(result['parameters'], sort_keys=True))
+    old_results = {key(result): result for result in old['results']}
+    regressions = []
+    for result in new['results']:
+        reference = old_results.get(key(result))
+        if reference is None:
+            continue
+        for metric in ('build_time', 'script_length', 'statements', 'loops', 'plays', 'executed_plays'):
+            before, after = reference.get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            limit = before*(1 + tolerance) if metric == 'build_time' else before
+            if after > limit:
+                regressions.append({'macro': result['macro'], 'parameters': result['parameters'], 'metric': metric, 'before': before, 'after': after})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the QuAM_utilities macros (offline).")
+    parser.add_argument('--output', default='bench.json', help="json file for the results")
+    parser.add_argument('--compare', default=None, help="json file of a previous run to compare with")
+    parser.add_argument('--repeat', type=int, default=3, help="repetitions of each build (the best time is kept)")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="relative tolerance on the build time")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=1)
+    print(f"{'macro':<22}{'parameters':<62}{'build [ms]':>11}{'statements':>11}{'executed plays':>15}{'script':>9}")
+    for result in results['results']:
+        parameters = ', '.join(f"{key}={value}" for key, value in result['parameters'].items())
+        if 'error' in result:
+            print(f"{result['macro']:<22}{parameters:<62} not valid: {result['error']}")
+            continue
+        print(f"{result['macro']:<22}{parameters:<62}{result['build_time']*1e3:>11.2f}{result['statements']:>11}{str(result['executed_plays']):>15}{result['script_length']:>9}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['macro']} {regression['parameters']}: {regression['metric']} {regression['before']} -> {regression['after']}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+content-addressed cache for the configuration generated by QuAM and the QUA programs.
+The configuration is stored under a hash of the channels/operations definition of the machine,
+the programs under a hash of the source of the function which builds them and of its arguments.
+Nothing is regenerated when the hash is already in the cache.
+The programs are stored as the script of generate_qua_script and rebuilt by running it, as qm does to validate
+the script: only the public API of qm is used, so the entries survive an upgrade of qm-qua.
+version 1.0
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import types
+import warnings
+
+from qm import generate_qua_script
+from . import QuAM_utilities
+
+DEFAULT_CACHE_DIR = 'quam_cache'
+DEFAULT_MAX_SIZE = 200*2**20 # bytes
+# markers written by generate_qua_script when the script does not rebuild the same program
+SCRIPT_ERRORS = ('SERIALIZATION WAS NOT COMPLETE', 'SERIALIZATION VALIDATION ERROR')
+
+
+def digest(*inputs):
+    """
+    Return the sha256 hex digest of json-serializable inputs.
+    Objects which are not serializable are represented by their repr.
+    """
+    text = json.dumps(inputs, sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _source(function):
+    """Return the source of a function, or its bytecode and constants when the source is not available."""
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        code = function.__code__
+        return [code.co_code.hex(), code.co_consts, code.co_names]
+
+
+class QuAMCache:
+    """
+    On-disk cache with size-based eviction (least recently used entries are removed first).
+
+    Usage:
+        cache = QuAMCache()
+        qua_config = cache.config(machine)
+        prog = cache.program(build_program, qua_config, number_of_periods_collision, rc_delay_time)
+
+    where build_program(*args, **kwargs) opens the `with program() as prog:` block and returns prog.
+    All the parameters the program depends on must be arguments of build_program (not globals of the notebook),
+    otherwise a change of their value does not change the hash.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        """
+        Inputs:
+        cache_dir (str): the directory of the cache, created if needed.
+        max_size (int): the maximum total size of the cache in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def _read(self, key, suffix):
+        """Return the bytes of an entry (None if missing) and mark it as recently used."""
+        path = self._path(key, suffix)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def _write(self, key, suffix, data):
+        path = self._path(key, suffix)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(data)
+        os.replace(path + '.tmp', path) # atomic, a crash never leaves a truncated entry
+        self.evict(keep=(path,))
+
+    def evict(self, keep=()):
+        """Remove the least recently used entries until the cache is smaller than max_size, except the paths in keep."""
+        keep = {os.path.abspath(path) for path in keep}
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.is_file()]
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if total <= self.max_size:
+                break
+            if os.path.abspath(entry.path) in keep:
+                continue
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def clear(self):
+        """Remove all the entries."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                os.remove(entry.path)
+
+    # --- configuration ---
+    def config_key(self, machine):
+        """Return the hash of the channels and operations of a BasicQuAM machine."""
+        return digest(machine.to_dict())
+
+    def config(self, machine):
+        """Return machine.generate_config(), from the cache if the machine did not change."""
+        key = self.config_key(machine)
+        data = self._read(key, '.config.pkl')
+        if data is not None:
+            return pickle.loads(data)
+        config = machine.generate_config()
+        self._write(key, '.config.pkl', pickle.dumps(config))
+        return config
+
+    # --- programs ---
+    def program_key(self, build, config, *args, **kwargs):
+        """
+        Return the hash of a program: source of the build function and of the QuAM_utilities macros,
+        arguments and configuration.
+        """
+        return digest(_source(build), inspect.getsource(QuAM_utilities), config, args, kwargs)
+
+    def program(self, build, config, *args, **kwargs):
+        """
+        Return the program built by build(*args, **kwargs), deserialized from the cache if available.
+
+        Inputs:
+        build: function returning a QUA program (callable)
+        config: the configuration dictionary the program is used with (dict)
+        args, kwargs: the arguments of build
+        """
+        key = self.program_key(build, config, *args, **kwargs)
+        data = self._read(key, '.qua.py')
+        if data is not None:
+            return load_script(data.decode())
+        return self._build(key, build, config, args, kwargs)[0]
+
+    def script(self, build, config, *args, **kwargs):
+        """Return the generate_qua_script output of the program (useful for debug files)."""
+        key = self.program_key(build, config, *args, **kwargs)
+        data = self._read(key, '.qua.py')
+        if data is not None:
+            return data.decode()
+        return self._build(key, build, config, args, kwargs)[1]
+
+    def _build(self, key, build, config, args, kwargs):
+        """Build a program missing from the cache and store its script. Returns the program and the script."""
+        prog = build(*args, **kwargs)
+        script = generate_qua_script(prog, config)
+        if any(error in script for error in SCRIPT_ERRORS):
+            warnings.warn("generate_qua_script cannot rebuild this program, it is not cached.")
+        else:
+            self._write(key, '.qua.py', script.encode())
+        return prog, script
+
+
+def load_script(script):
+    """Return the program rebuilt by a script of generate_qua_script (the prog variable of the script)."""
+    module = types.ModuleType('qua_script')
+    exec(script, module.__dict__)
+    return module.prog
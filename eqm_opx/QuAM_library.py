@@ -0,0 +1,118 @@
+"""
+pulse library of a machine built from a compact table of square operations, and deduplication of the
+configuration generated by QuAM.
+QuAM writes a pulse and a waveform for every operation of every channel, also when they are identical
+(the zero-amplitude lows, the same continuous pulse on several channels, the debug copies): dedupe_config
+keeps one waveform and one pulse for each distinct content and points all the operations to them.
+version 1.0
+"""
+
+import copy
+import hashlib
+import json
+
+import numpy as np
+from quam.components.pulses import SquarePulse
+
+from .QuAM_utilities import MIN_PULSE_CYCLES, MAX_AMPLITUDE
+
+TABLE_DTYPE = np.dtype([('channel', object), ('operation', object), ('length', np.int64), ('amplitude', np.float64)])
+
+
+def pulse_table(rows):
+    """
+    Return the table of square operations with the lengths rounded to the clock cycle (as round(length/4)*4),
+    computed in one vectorized pass.
+
+    Inputs:
+    rows: the operations as (channel name, operation name, length in ns, amplitude in V) (list of tuples)
+
+    Returns:
+    a numpy structured array with fields channel, operation, length (ns, multiple of 4), amplitude
+    """
+    table = np.zeros(len(rows), dtype=TABLE_DTYPE)
+    if not len(rows):
+        return table
+    channels, operations, lengths, amplitudes = zip(*rows)
+    lengths = np.asarray(lengths, dtype=float)
+    table['channel'] = channels
+    table['operation'] = operations
+    table['length'] = np.round(lengths/4)*4
+    table['amplitude'] = amplitudes
+    short = table['length'] < MIN_PULSE_CYCLES*4
+    if short.any():
+        raise ValueError(f"The operations {list(zip(table['channel'][short], table['operation'][short]))} are shorter than {MIN_PULSE_CYCLES*4} ns.")
+    saturated = np.abs(table['amplitude']) >= MAX_AMPLITUDE
+    if saturated.any():
+        raise ValueError(f"The amplitudes of {list(zip(table['channel'][saturated], table['operation'][saturated]))} are out of the output range of {MAX_AMPLITUDE} V.")
+    keys = list(zip(table['channel'], table['operation']))
+    if len(set(keys)) < len(keys):
+        raise ValueError("An operation is defined twice on the same channel.")
+    return table
+
+
+def add_pulses(machine, rows):
+    """
+    Add the square operations of a table to the channels of a machine.
+
+    Usage:
+        add_pulses(machine, [
+            ('AOM_double_cooler', 'cool_high_pulse_coll', rc_high_time*u.s, cool_square_amplitude_coll_double),
+            ('AOM_double_cooler', 'cool_low_pulse', rc_low_time*u.s, 0),
+            ...])
+        qua_config = dedupe_config(machine.generate_config())
+
+    Inputs:
+    machine: the machine with the channels (BasicQuAM)
+    rows: (channel name, operation name, length in ns, amplitude in V) of every operation (list of tuples), see pulse_table
+
+    Returns:
+    the table of the operations (structured array), see pulse_table
+    """
+    table = pulse_table(rows)
+    missing = set(table['channel']) - set(machine.channels)
+    if missing:
+        raise ValueError(f"The channels {sorted(missing)} are not defined in the machine.")
+    for channel, operation, length, amplitude in table.tolist():
+        machine.channels[channel].operations[operation] = SquarePulse(length=int(length), amplitude=amplitude)
+    return table
+
+
+def _content_key(item):
+    """Key of the content of a waveform or pulse dict, independent of its name."""
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def dedupe_config(config):
+    """
+    Return a copy of the configuration where the identical waveforms and pulses are stored once.
+    The first name of each distinct waveform/pulse is kept and all the references (pulses -> waveforms,
+    elements -> pulses) are rewritten. The operations of the elements keep their names.
+    """
+    config = copy.deepcopy(config)
+
+    def merge(items):
+        names, kept = {}, {}
+        for name, item in items.items():
+            key = _content_key(item)
+            names[name] = kept.setdefault(key, name)
+        return names
+
+    waveform_names = merge(config.get('waveforms', {}))
+    for pulse in config.get('pulses', {}).values():
+        if 'waveforms' in pulse:
+            pulse['waveforms'] = {port: waveform_names.get(name, name) for port, name in pulse['waveforms'].items()}
+    pulse_names = merge(config.get('pulses', {}))
+    for element in config.get('elements', {}).values():
+        element['operations'] = {operation: pulse_names.get(name, name) for operation, name in element.get('operations', {}).items()}
+
+    config['waveforms'] = {name: waveform for name, waveform in config.get('waveforms', {}).items() if waveform_names[name] == name}
+    config['pulses'] = {name: pulse for name, pulse in config.get('pulses', {}).items() if pulse_names[name] == name}
+    return config
+
+
+def config_size(config):
+    """Return the number of pulses, of waveforms and of arbitrary waveform samples of a configuration (dict)."""
+    waveforms = config.get('waveforms', {}).values()
+    return {'pulses': len(config.get('pulses', {})), 'waveforms': len(waveforms),
+            'samples': sum(len(waveform.get('samples', [])) for waveform in waveforms if waveform.get('type') == 'arbitrary')}
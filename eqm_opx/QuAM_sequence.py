@@ -0,0 +1,244 @@
+"""
+declarative description of a shot: a list of phases (loading, gap1, collision, gap2, imaging, ...),
+each declaring once its duration and what every channel plays.
+The clock-rounded lengths and the number of periods of all the phases are computed in a single pass,
+the pulses are registered on the channels (identical pulses are shared) and the QUA statements are emitted
+with the QuAM_utilities macros.
+version 1.0
+"""
+
+import numpy as np
+
+from . import QuAM_utilities
+from .QuAM_utilities import MIN_PULSE_CYCLES
+from quam.components.pulses import SquarePulse
+
+MIN_PULSE_LENGTH = MIN_PULSE_CYCLES*4 # ns
+
+
+class Constant:
+    """
+    Constant amplitude for the whole phase (amplitude=0 for off).
+    amp_mod, frequency: optional names of the QUA variables passed to emit (str)
+    """
+    def __init__(self, amplitude, amp_mod=None, frequency=None):
+        self.amplitude = amplitude
+        self.amp_mod = amp_mod
+        self.frequency = frequency
+
+
+class Ramp:
+    """Ramp from 0 to amplitude over the whole phase, see QuAM_utilities.long_ramp for the shapes."""
+    def __init__(self, amplitude, shape='linear', n_steps=None):
+        self.amplitude = amplitude
+        self.shape = shape
+        self.n_steps = n_steps
+        self.amp_mod = None
+        self.frequency = None
+
+
+class Strobe:
+    """
+    Stroboscopic modulation: each period plays an optional delay and the low part at low_amplitude,
+    and the high part at high_amplitude (delay, high, low).
+    The number of periods is the largest which fits in the phase, the remaining time is played at low_amplitude.
+
+    modulation_frequency: the modulation frequency in Hz (float)
+    duty_cycle: the high fraction of the period (float)
+    delay_fraction: the delay before the high part, as a fraction of the period (float)
+    amp_mod, frequency: optional names of the QUA variables passed to emit, for the amplitude of the high part
+                        and the frequency of the element (str)
+    """
+    def __init__(self, modulation_frequency, duty_cycle, high_amplitude, low_amplitude=0, delay_fraction=0, amp_mod=None, frequency=None):
+        self.modulation_frequency = modulation_frequency
+        self.duty_cycle = duty_cycle
+        self.high_amplitude = high_amplitude
+        self.low_amplitude = low_amplitude
+        self.delay_fraction = delay_fraction
+        self.amp_mod = amp_mod
+        self.frequency = frequency
+
+
+class ShotSequence:
+    """
+    Usage:
+        seq = ShotSequence(machine)
+        seq.phase('loading', tweez_ramp_time, {'AOM_tweez_mod': Ramp(0.07)})
+        seq.phase('plateau', tweez_plateau_time, {'AOM_tweez_mod': Constant(0.07)})
+        seq.phase('collision', coll_time, {
+            'AOM_tweez_mod': Strobe(1.7e6, 0.6, 0, 0.15), # low part first, as ('tweez_low_pulse','tweez_high_pulse_coll')
+            'AOM_double_cooler': Strobe(1.7e6, 0.3, 0.38, delay_fraction=0.65),
+            'AOM_single_cooler': Constant(0.08)})
+        seq.phase('imaging', imag_time, {..., 'AOM_single_cooler': Constant(0.5, amp_mod='cool_amp_imag')})
+        seq.build() # before machine.generate_config()
+        print(seq.describe())
+
+        with program() as prog:
+            wait_for_trigger(...)
+            seq.emit({'cool_amp_imag': input_cool_amp_imag})
+
+    All the channels of a phase last exactly the phase duration (rounded to the clock cycle), and a channel which
+    is not used in a phase waits, so the channels stay aligned without align statements.
+    """
+
+    def __init__(self, machine, prefix='seq'):
+        """
+        Inputs:
+        machine: the BasicQuAM machine with the channels (BasicQuAM)
+        prefix: prefix of the names of the operations added to the channels (str)
+        """
+        self.machine = machine
+        self.prefix = prefix
+        self.phases = []
+        self.table = None
+        self._operations = {} # (element, length, amplitude) -> operation name
+
+    def phase(self, name, duration, channels):
+        """
+        Add a phase.
+        name (str), duration in ns (float), channels: dict element name -> Constant, Ramp or Strobe
+        """
+        self.phases.append((name, duration, channels))
+        self.table = None
+
+    @property
+    def elements(self):
+        """The elements used in at least one phase, in order of appearance."""
+        return list(dict.fromkeys(element for _, _, channels in self.phases for element in channels))
+
+    # --- timing ---
+    def timing_table(self):
+        """
+        Compute the clock-rounded timings of every (phase, element) pair in one vectorized pass.
+
+        Returns:
+        a numpy structured array with fields phase, element, duration, periods, delay, high, low, residual (in ns).
+        For Constant and Ramp the periods are 0 and only duration is used.
+        """
+        rows = [(phase, element, action, duration) for phase, duration, channels in self.phases for element, action in channels.items()]
+        table = np.zeros(len(rows), dtype=[('phase', object), ('element', object), ('duration', np.int64), ('periods', np.int64),
+                                           ('delay', np.int64), ('high', np.int64), ('low', np.int64), ('residual', np.int64)])
+        table['phase'] = [row[0] for row in rows]
+        table['element'] = [row[1] for row in rows]
+        table['duration'] = np.round(np.array([row[3] for row in rows], dtype=float)/4)*4
+
+        strobe = np.array([isinstance(row[2], Strobe) for row in rows], dtype=bool)
+        if strobe.any():
+            actions = [row[2] for row, is_strobe in zip(rows, strobe) if is_strobe]
+            period = 1e9/np.array([action.modulation_frequency for action in actions])
+            duty = np.array([action.duty_cycle for action in actions])
+            delay_fraction = np.array([action.delay_fraction for action in actions])
+            duration = table['duration'][strobe]
+
+            high = np.round(period*duty/4)*4
+            delay = np.round(period*delay_fraction/4)*4
+            low = np.round(period/4)*4 - high - delay
+            total = high + low + delay
+            periods = duration // total
+            residual = duration - periods*total
+            short = (residual > 0) & (residual < MIN_PULSE_LENGTH) # too short to be played: move one period to the residual
+            periods[short] -= 1
+            residual[short] += total[short]
+
+            bad = (high < MIN_PULSE_LENGTH) | (low < MIN_PULSE_LENGTH) | ((delay > 0) & (delay < MIN_PULSE_LENGTH)) | (periods < 1)
+            if bad.any():
+                wrong = [f"{phase}/{element}" for phase, element in zip(table['phase'][strobe][bad], table['element'][strobe][bad])]
+                raise ValueError(f"The stroboscopic timings of {wrong} are shorter than {MIN_PULSE_LENGTH} ns or do not fit in the phase.")
+            for field, values in (('periods', periods), ('delay', delay), ('high', high), ('low', low), ('residual', residual)):
+                table[field][strobe] = values
+        return table
+
+    def check(self):
+        """Raise a ValueError if the channels of a phase do not last the same time."""
+        table = self.table if self.table is not None else self.timing_table()
+        played = np.where(table['periods'] > 0, table['periods']*(table['delay'] + table['high'] + table['low']) + table['residual'], table['duration'])
+        bounds = np.cumsum([len(channels) for _, _, channels in self.phases])[:-1]
+        for (phase, _, _), elements, times in zip(self.phases, np.split(table['element'], bounds), np.split(played, bounds)):
+            if len(set(times)) > 1:
+                raise ValueError(f"The channels of the phase {phase} have different durations: {dict(zip(elements, times))}")
+
+    def describe(self):
+        """Return the timing table as text, for debugging."""
+        table = self.table if self.table is not None else self.timing_table()
+        lines = [f"{'phase':<12}{'element':<22}{'duration':>12}{'periods':>9}{'delay':>7}{'high':>7}{'low':>7}{'residual':>9}"]
+        for row in table:
+            lines.append(f"{row['phase']:<12}{row['element']:<22}{row['duration']:>12}{row['periods']:>9}{row['delay']:>7}{row['high']:>7}{row['low']:>7}{row['residual']:>9}")
+        return '\n'.join(lines)
+
+    # --- pulses ---
+    def _operation(self, element, amplitude, length=MIN_PULSE_LENGTH):
+        """
+        Return the name of a square operation of the element, adding it if needed.
+        Constant segments are played with a duration override, so a single operation per amplitude is needed;
+        the high and low parts of the strobes need their exact length.
+        """
+        key = (element, int(length), float(amplitude))
+        if key not in self._operations:
+            name = f"{self.prefix}_{len([k for k in self._operations if k[0] == element])}"
+            self.machine.channels[element].operations[name] = SquarePulse(length=int(length), amplitude=amplitude)
+            self._operations[key] = name
+        return self._operations[key]
+
+    def build(self):
+        """Compute the timing table, check it and register the operations on the channels. Call it before generate_config."""
+        self.table = self.timing_table()
+        self.check()
+        rows = iter(self.table)
+        self._plan = []
+        for phase, duration, channels in self.phases:
+            steps = {}
+            for element, action in channels.items():
+                row = next(rows)
+                if isinstance(action, Strobe):
+                    high = self._operation(element, action.high_amplitude, row['high'])
+                    low = self._operation(element, action.low_amplitude, row['low'])
+                    rest = self._operation(element, action.low_amplitude)
+                    steps[element] = (action, row, (high, low, rest))
+                else:
+                    steps[element] = (action, row, (self._operation(element, action.amplitude),))
+            self._plan.append((phase, round(duration/4)*4, steps))
+
+    # --- emission ---
+    def emit(self, variables=None, backend=QuAM_utilities):
+        """
+        Emit the statements of the whole sequence. Must be called inside a `with program()` block.
+
+        Inputs:
+        variables: dict name -> QUA variable for the amp_mod and frequency names used in the phases (dict)
+        backend: the module or object providing long_pulse, long_ramp, stroboscopic, play and wait.
+                QuAM_utilities (default) emits QUA, a QuAM_timeline.Timeline renders the sequence offline.
+        """
+        if self.table is None:
+            self.build()
+        variables = variables or {}
+        elements = self.elements
+        for phase, duration, steps in self._plan:
+            idle = [element for element in elements if element not in steps]
+            if idle:
+                backend.wait(duration//4, *idle)
+            for element, (action, row, operations) in steps.items():
+                amp_mod = variables[action.amp_mod] if action.amp_mod is not None else None
+                frequency = variables[action.frequency] if action.frequency is not None else None
+                if isinstance(action, Strobe):
+                    high, low, rest = operations
+                    backend.stroboscopic((high, low), element, int(row['periods']), delay=int(row['delay']), amp_mod=amp_mod, frequency=frequency)
+                    if row['residual']:
+                        backend.play(rest, element, duration=int(row['residual'])//4)
+                elif isinstance(action, Ramp):
+                    backend.long_ramp(operations[0], element, duration, n_steps=action.n_steps, shape=action.shape)
+                else:
+                    backend.long_pulse(operations[0], element, duration, amp_mod=amp_mod, frequency=frequency)
+
+    def render(self, variables=None):
+        """
+        Return a QuAM_timeline.Timeline with the sequence, for plotting and checks without the OPX.
+        variables: dict name -> value of the amp_mod variables (default 1)
+        """
+        from .QuAM_timeline import Timeline
+        if self.table is None:
+            self.build()
+        names = [action.amp_mod for _, _, channels in self.phases for action in channels.values() if action.amp_mod is not None]
+        names += [action.frequency for _, _, channels in self.phases for action in channels.values() if action.frequency is not None]
+        timeline = Timeline(self.machine)
+        self.emit({**dict.fromkeys(names, 1), **(variables or {})}, backend=timeline)
+        return timeline
@@ -0,0 +1,113 @@
+"""
+parameter sweeps run on the controller: the points of an N-dimensional grid (frequency, amplitude factor, delay, ...)
+are iterated in QUA between the triggers, without pause() or input streams, and the index of every point is saved
+to a stream, so that each image can be matched to its point afterwards.
+version 1.0
+"""
+
+import contextlib
+
+import numpy as np
+from qm.qua import *
+
+FIXED_RANGE = (-8, 8) # range of the QUA fixed type
+
+
+class Sweep:
+    """
+    Usage:
+        sweep = Sweep(frequency=np.arange(10000, 200001, 10000), amp_mod=np.linspace(0.5, 1.5, 5))
+        with program() as IO_test:
+            index_stream = declare_stream()
+            with infinite_loop_():
+                with sweep.loop(index_stream) as point:    # point: dict axis name -> QUA variable
+                    wait_for_trigger('test')
+                    update_frequency('test', point['frequency'], keep_phase=True)
+                    play('high_pulse'*amp(point['amp_mod']), 'test')
+                    play('low_pulse', 'test')
+            with stream_processing():
+                index_stream.save_all('sweep_index')
+
+        indices = job.result_handles.get('sweep_index').fetch_all()['value']
+        sweep.point(indices[k])    # the values of the k-th shot, e.g. {'frequency': 30000, 'amp_mod': 0.75}
+
+    The axes with integer values are QUA int, the others QUA fixed. The grid is run in row-major order (the last
+    axis is the fastest), by nested for_ loops which read the values of each axis from a QUA array (the memory is the
+    sum of the axis lengths). With order (e.g. a random permutation, to decorrelate the scan from slow drifts) the
+    points are read from flat QUA arrays of the whole grid with for_each_ (the memory is the number of points times
+    the number of axes). The saved index is always the row-major index of the point in the grid.
+    """
+
+    def __init__(self, order=None, **axes):
+        """
+        Inputs:
+        order: optional order of the points, as row-major indices of the grid (array of int)
+        axes: the values of each axis (name=1D array), in the order of the nesting (the first is the slowest)
+        """
+        if not axes:
+            raise ValueError("The sweep has no axis.")
+        self.axes = {}
+        for name, values in axes.items():
+            values = np.atleast_1d(np.asarray(values))
+            if values.ndim != 1 or len(values) == 0:
+                raise ValueError(f"The values of the axis {name} must be a non-empty 1D array.")
+            if not np.issubdtype(values.dtype, np.integer):
+                values = values.astype(float)
+                if values.min() < FIXED_RANGE[0] or values.max() >= FIXED_RANGE[1]:
+                    raise ValueError(f"The values of the axis {name} are out of the range {FIXED_RANGE} of the QUA fixed type: use integers (e.g. Hz or ns).")
+            self.axes[name] = values
+        self.shape = tuple(len(values) for values in self.axes.values())
+        if order is not None:
+            order = np.asarray(order, dtype=int).ravel()
+            if order.min() < 0 or order.max() >= len(self):
+                raise ValueError(f"The order has indices out of the grid of {len(self)} points.")
+        self.order = order
+        self.index = None # QUA int with the index of the current point, declared by loop
+
+    def __len__(self):
+        return int(np.prod(self.shape))
+
+    def point(self, index):
+        """Return the values of the point with the given row-major index (dict axis name -> value)."""
+        position = np.unravel_index(int(index), self.shape)
+        return {name: values[i].item() for (name, values), i in zip(self.axes.items(), position)}
+
+    def points(self):
+        """Return the points in the order they are played: structured array with the index and the value of each axis."""
+        indices = np.arange(len(self)) if self.order is None else self.order
+        positions = np.unravel_index(indices, self.shape)
+        table = np.zeros(len(indices), dtype=[('index', np.int64)] + [(name, values.dtype) for name, values in self.axes.items()])
+        table['index'] = indices
+        for (name, values), position in zip(self.axes.items(), positions):
+            table[name] = values[position]
+        return table
+
+    @staticmethod
+    def _qua_type(values):
+        return int if np.issubdtype(values.dtype, np.integer) else fixed
+
+    @contextlib.contextmanager
+    def loop(self, stream=None):
+        """
+        Context manager which runs its block once for every point of the grid and yields the dict axis name -> QUA variable.
+        stream: optional QUA stream (declare_stream) where the index of the point is saved at the start of each point.
+        """
+        point = {name: declare(self._qua_type(values)) for name, values in self.axes.items()}
+        self.index = declare(int)
+        with contextlib.ExitStack() as stack:
+            if self.order is not None:
+                table = self.points()
+                columns = [table['index'].tolist()] + [table[name].tolist() for name in self.axes]
+                stack.enter_context(for_each_((self.index, *point.values()), columns))
+            else:
+                assign(self.index, 0)
+                for name, values in self.axes.items():
+                    array = declare(self._qua_type(values), value=values.tolist())
+                    position = declare(int)
+                    stack.enter_context(for_(position, 0, position < len(values), position + 1))
+                    assign(point[name], array[position])
+            if stream is not None:
+                save(self.index, stream)
+            yield point
+            if self.order is None:
+                assign(self.index, self.index + 1)
@@ -0,0 +1,252 @@
+"""
+offline renderer for the sequences written with QuAM_utilities.
+It rebuilds the envelope played on every channel from the configuration dictionary,
+without the OPX server and without the SimulationConfig duration limit.
+version 1.0
+"""
+
+import numpy as np
+from .QuAM_utilities import solve_slices, ramp_table, MAX_PULSE_LENGTH
+
+CLOCK_CYCLE = 4 # ns
+
+
+class Timeline:
+    """
+    Run-length encoded timeline of the amplitude envelopes played on each element.
+
+    The methods mirror the macros of QuAM_utilities (same arguments, same rounding),
+    so that a sequence can be rendered offline by calling them on a Timeline instance:
+
+        tl = Timeline(machine)
+        tl.long_ramp('tweez_step_pulse', 'AOM_tweez_mod', tweez_ramp_time)
+        tl.long_pulse('tweez_plateau_pulse', 'AOM_tweez_mod', tweez_plateau_time)
+        tl.align()
+        tl.stroboscopic(('cool_high_pulse_coll','cool_low_pulse'), 'AOM_double_cooler', number_of_periods_collision, rc_delay_ns)
+        tl.plot()
+
+    Every element stores a list of segments (durations in ns, amplitudes in V), which are
+    built with numpy operations: a stroboscopic sequence of 300k periods is a single np.tile.
+    Real-time variables (amp_mod) cannot be evaluated offline: pass the value you expect instead.
+    """
+
+    def __init__(self, config):
+        """
+        Inputs:
+        config: the configuration dictionary or the BasicQuAM machine which generates it.
+        """
+        if hasattr(config, 'generate_config'):
+            config = config.generate_config()
+        self.config = config
+        self._durations = {element: [] for element in config['elements']}
+        self._amplitudes = {element: [] for element in config['elements']}
+        self._time = {element: 0 for element in config['elements']}
+        self._aligned = 0 # end of the last align() of all the elements: where an element not played yet starts
+
+    # --- configuration lookup ---
+    def pulse(self, operation, element):
+        """
+        Return the (length, samples) of the pulse linked to the operation of an element.
+        samples is a float for constant waveforms and an array for arbitrary ones.
+        """
+        try:
+            pulse_name = self.config['elements'][element]['operations'][operation]
+        except KeyError:
+            raise KeyError(f"Operation {operation} is not defined for the element {element}.")
+        pulse = self.config['pulses'][pulse_name]
+        waveform = self.config['waveforms'][pulse['waveforms']['single']]
+        if waveform['type'] == 'constant':
+            return pulse['length'], float(waveform['sample'])
+        return pulse['length'], np.asarray(waveform['samples'], dtype=float)
+
+    def element_port(self, element):
+        """Return the output port of an element, e.g. ('con1', 1)."""
+        return tuple(self.config['elements'][element]['singleInput']['port'])
+
+    # --- low level ---
+    def _append(self, element, durations, amplitudes):
+        durations = np.asarray(durations, dtype=np.int64).ravel()
+        amplitudes = np.broadcast_to(np.asarray(amplitudes, dtype=float), durations.shape)
+        if not self._durations[element] and self._aligned:
+            self._durations[element].append(np.array([self._aligned], dtype=np.int64))
+            self._amplitudes[element].append(np.zeros(1))
+            self._time[element] = self._aligned
+        self._durations[element].append(durations)
+        self._amplitudes[element].append(amplitudes)
+        self._time[element] += int(durations.sum())
+
+    def _segments(self, operation, element, duration=None, amp_mod=None):
+        """
+        Return the (durations, amplitudes) segments of a single play statement.
+        duration is in clock cycles, as in the play function.
+        """
+        length, samples = self.pulse(operation, element)
+        amp_mod = 1 if amp_mod is None else amp_mod
+        if np.ndim(samples) == 0:
+            if duration is not None:
+                length = int(duration) * CLOCK_CYCLE
+            return np.array([length]), np.array([samples * amp_mod])
+        if duration is not None:
+            raise ValueError(f"The duration of the arbitrary waveform {operation} cannot be changed in real time.")
+        # arbitrary waveform: run-length encode the samples (1 ns each)
+        edges = np.flatnonzero(np.diff(samples)) + 1
+        starts = np.concatenate(([0], edges))
+        durations = np.diff(np.concatenate((starts, [len(samples)])))
+        return durations, samples[starts] * amp_mod
+
+    def play(self, operation, element, duration=None, amp_mod=None):
+        """
+        Play an operation once.
+        duration: the duration in clock cycles (int), as in the play function.
+        amp_mod: the amplitude factor, as in play(operation*amp(amp_mod), element) (float, None for no scaling)
+        """
+        self._append(element, *self._segments(operation, element, duration, amp_mod))
+
+    def wait(self, duration, *elements):
+        """Wait for a duration in clock cycles (int) on the given elements."""
+        for element in elements:
+            self._append(element, [int(duration) * CLOCK_CYCLE], [0.0])
+
+    def played(self):
+        """Return the elements which have segments in the timeline (tuple)."""
+        return tuple(element for element in self._durations if self._durations[element])
+
+    def align(self, *elements):
+        """
+        Align the elements by padding with zero amplitude. Without elements, as align() in QUA: the played elements
+        are padded and the ones not played yet start at the end when they are first played.
+        """
+        if not elements:
+            elements = self.played()
+            if not elements:
+                return
+            self._aligned = max(self._time[element] for element in elements)
+        end = max(self._time[element] for element in elements)
+        for element in elements:
+            if self._time[element] < end:
+                self._append(element, [end - self._time[element]], [0.0])
+
+    # --- macros of QuAM_utilities ---
+    def long_pulse(self, operation, element, time, slices=None, amp_mod=None, max_length=MAX_PULSE_LENGTH, **kwargs):
+        """Render of QuAM_utilities.long_pulse. time is in ns."""
+        slices, slice_cycles, last_cycles = solve_slices(time, slices, max_length)
+        durations, amplitudes = self._segments(operation, element, slice_cycles, amp_mod)
+        self._append(element, np.tile(durations, slices-1), np.tile(amplitudes, slices-1))
+        self.play(operation, element, duration=last_cycles, amp_mod=amp_mod)
+
+    def long_pulse_amp_mod(self, operation, element, time, amp_mod, slices=None, **kwargs):
+        """Render of QuAM_utilities.long_pulse_amp_mod. amp_mod is a float."""
+        self.long_pulse(operation, element, time, slices=slices, amp_mod=amp_mod)
+
+    def long_ramp(self, operation, element, time, step_duration=None, n_steps=None, shape='linear', **kwargs):
+        """Render of QuAM_utilities.long_ramp. time is in ns. Returns the realized duration in ns."""
+        factors, step_cycles, last_cycles = ramp_table(time, n_steps, step_duration, shape)
+        durations = np.full(len(factors), step_cycles*CLOCK_CYCLE)
+        durations[-1] = last_cycles*CLOCK_CYCLE
+        length, sample = self.pulse(operation, element)
+        self._append(element, durations, factors * sample)
+        return int(durations.sum())
+
+    def stroboscopic(self, operations, element, periods, delay=0, amp_mod=None, high_time=None, low_time=None, period_time=None, **kwargs):
+        """Render of QuAM_utilities.stroboscopic. delay, high_time, low_time and period_time are in ns (numbers)."""
+        if period_time is not None:
+            low_time = period_time - high_time - round(delay/4)*4
+        cycles = lambda time: None if time is None else round(time/4)
+        high = self._segments(operations[0], element, duration=cycles(high_time), amp_mod=amp_mod)
+        low = self._segments(operations[1], element, duration=cycles(low_time))
+        period = [high, low]
+        if delay != 0:
+            period.insert(0, self._segments(operations[1], element, duration=round(delay/4)))
+        durations = np.concatenate([segment[0] for segment in period])
+        amplitudes = np.concatenate([segment[1] for segment in period])
+        self._append(element, np.tile(durations, periods), np.tile(amplitudes, periods))
+
+    def stroboscopic_amp_mod(self, operations, element, periods, amp_mod, delay=0, **kwargs):
+        """Render of QuAM_utilities.stroboscopic_amp_mod. amp_mod is a float."""
+        self.stroboscopic(operations, element, periods, delay=delay, amp_mod=amp_mod)
+
+    def stroboscopic_chunked(self, operation, element, periods, periods_per_chunk, amp_mod=None, **kwargs):
+        """Render of QuAM_utilities.stroboscopic_chunked. amp_mod is a float and scales the whole chunk, low pulse included."""
+        n_chunks, tail = divmod(periods, periods_per_chunk)
+        durations, amplitudes = self._segments(operation, element, amp_mod=amp_mod)
+        self._append(element, np.tile(durations, n_chunks), np.tile(amplitudes, n_chunks))
+        if tail:
+            self.play(operation+'_tail', element, amp_mod=amp_mod)
+
+    def long_multitone(self, operation, element, time, length=None, amp_mod=None, **kwargs):
+        """
+        Render of QuAM_utilities.long_multitone. time is in ns (number).
+        The tones are not rendered sample by sample: each repetition is a segment at the peak amplitude of the waveform.
+        """
+        pulse_length, samples = self.pulse(operation, element)
+        if length is not None and length != pulse_length:
+            raise ValueError(f"The waveform of {operation} is {pulse_length} ns long, not {length} ns.")
+        repetitions = int(time // pulse_length)
+        peak = np.abs(samples).max() * (1 if amp_mod is None else amp_mod)
+        self._append(element, np.full(repetitions, pulse_length), peak)
+
+    # --- output ---
+    def duration(self, element=None):
+        """Return the played time in ns of an element (the longest one if element is None)."""
+        if element is None:
+            return max(self._time.values())
+        return self._time[element]
+
+    def envelope(self, element):
+        """
+        Return the run-length encoded envelope of an element, merging consecutive segments with the same amplitude.
+
+        Returns:
+        starts (ndarray): the start time of each segment in ns
+        amplitudes (ndarray): the amplitude of each segment in V
+        The last segment ends at self.duration(element).
+        """
+        if not self._durations[element]:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        durations = np.concatenate(self._durations[element])
+        amplitudes = np.concatenate(self._amplitudes[element])
+        starts = np.concatenate(([0], np.cumsum(durations)[:-1]))
+        # zero-length segments first, so that they do not split two segments with the same amplitude
+        positive = durations > 0
+        starts, amplitudes = starts[positive], amplitudes[positive]
+        keep = np.concatenate(([True], np.diff(amplitudes) != 0))
+        return starts[keep], amplitudes[keep]
+
+    def sample(self, element, times):
+        """Return the amplitude of an element at the given times in ns (array)."""
+        starts, amplitudes = self.envelope(element)
+        times = np.asarray(times)
+        if len(amplitudes) == 0:
+            return np.zeros(times.shape)
+        index = np.searchsorted(starts, times, side='right') - 1
+        values = amplitudes[np.clip(index, 0, None)]
+        return np.where((index >= 0) & (times < self._time[element]), values, 0.0)
+
+    def check_alignment(self, *elements):
+        """
+        Return a dict with the played time of each element if they differ, an empty dict otherwise.
+        Without elements, the played ones are checked (the elements of the configuration never played are ignored).
+        """
+        elements = elements or self.played()
+        times = {element: self._time[element] for element in elements}
+        return times if len(set(times.values())) > 1 else {}
+
+    def plot(self, elements=None, ax=None, time_unit=1e6):
+        """
+        Plot the envelopes as step functions.
+        elements: the elements to plot (all of the played ones if None)
+        time_unit: the unit of the time axis in ns (default ms)
+        """
+        import matplotlib.pyplot as plt
+        if ax is None:
+            ax = plt.figure().add_subplot(111)
+        elements = elements or self.played()
+        for element in elements:
+            starts, amplitudes = self.envelope(element)
+            times = np.append(starts, self._time[element]) / time_unit
+            ax.stairs(amplitudes, times, label=element, baseline=None)
+        unit_name = {1: 'ns', 1e3: 'us', 1e6: 'ms', 1e9: 's'}.get(time_unit, f'{time_unit} ns')
+        ax.set_xlabel(f"Time [{unit_name}]")
+        ax.set_ylabel("Amplitude [V]")
+        ax.legend()
+        return ax
@@ -0,0 +1,580 @@
+"""
+macros for standard sequences used in OPX.
+This is a wrapper of the qua library.
+version 2.0
+"""
+
+from qm.qua import *
+from quam.components import BasicQuAM, SingleChannel, InOutSingleChannel
+from quam.components.pulses import SquarePulse, WaveformPulse, SquareReadoutPulse
+import numpy as np
+import warnings
+
+# budget of samples (1 ns each) for a single precomputed waveform.
+# the OPX waveform memory is shared by all the arbitrary waveforms of the configuration,
+# so keep some margin when more than one chunk is registered.
+MAX_WAVEFORM_SAMPLES = 2**14
+# limits on the duration of a single play statement, in clock cycles (4 ns)
+MIN_PULSE_CYCLES = 4
+MAX_PULSE_CYCLES = 2**24 # conservative, about 67 ms
+MAX_PULSE_LENGTH = MAX_PULSE_CYCLES*4 # ns
+# maximum number of steps of long_ramp, i.e. the length of the QUA array with the amplitude table
+MAX_RAMP_STEPS = 1000
+# full scale of the analog outputs of the OPX+, in V
+MAX_AMPLITUDE = 0.5
+# length in ns of the measurement pulse of the photodiode, repeated during the integration window
+PHOTODIODE_READOUT_LENGTH = 10*1000
+
+def solve_slices(time, slices=None, max_length=MAX_PULSE_LENGTH):
+    """
+    Find how to split a long constant pulse in slices which hit the requested time exactly on the clock.
+    The first slices-1 slices have the same duration, the last one takes the remaining clock cycles.
+
+    Inputs:
+    time (int): the total time in ns. It is rounded to the clock cycle (4 ns) if needed.
+    slices (int): the number of slices. If None, the minimum number such that each slice is shorter than max_length.
+    max_length (int): the maximum duration of a single slice in ns.
+
+    Returns:
+    slices (int): the number of slices
+    slice_cycles (int): the duration of the first slices-1 slices, in clock cycles
+    last_cycles (int): the duration of the last slice, in clock cycles
+    """
+    cycles = round(time/4)
+    if cycles*4 != time:
+        warnings.warn(f"The desired time {time} ns is not a multiple of the clock cycle, {cycles*4} ns will be played.")
+    max_cycles = max_length // 4
+    auto = slices is None
+    if auto:
+        slices = max(1, -(-cycles // max_cycles))
+    slice_cycles = cycles // slices
+    last_cycles = cycles - (slices-1)*slice_cycles
+    while auto and last_cycles > max_cycles: # the remainder does not fit in the last slice
+        slices += 1
+        slice_cycles = cycles // slices
+        last_cycles = cycles - (slices-1)*slice_cycles
+    if slice_cycles < MIN_PULSE_CYCLES:
+        raise ValueError(f"The slices of {slice_cycles*4} ns are shorter than the minimum pulse length ({MIN_PULSE_CYCLES*4} ns), reduce the number of slices.")
+    if last_cycles > max_cycles:
+        raise ValueError(f"The slices of {last_cycles*4} ns are longer than the maximum pulse length ({max_length} ns), increase the number of slices.")
+    return slices, slice_cycles, last_cycles
+
+
+def _is_qua(value):
+    """True for QUA variables and expressions, False for python numbers."""
+    return not isinstance(value, (int, float, np.integer, np.floating))
+
+
+def _cycles(time):
+    """
+    Return the duration in clock cycles of a time in ns.
+    Python numbers are rounded in python (with a warning if not a multiple of the clock cycle), QUA values (int, ns)
+    are converted in real time into a new QUA variable, since play accepts only variables as duration.
+    """
+    if not _is_qua(time):
+        cycles = round(time/4)
+        if cycles*4 != time:
+            warnings.warn(f"The desired time {time} ns is not a multiple of the clock cycle, {cycles*4} ns will be played.")
+        return cycles
+    cycles = declare(int)
+    assign(cycles, time >> 2)
+    return cycles
+
+
+def long_pulse(operation, element, time, slices=None, amp_mod=None, frequency=None, max_length=MAX_PULSE_LENGTH, **kwargs):
+    """
+    Generate a long constant pulse by repeating the same pulse.
+    The number of slices and their duration are chosen by solve_slices, so that the played time is
+    exactly the desired one with the fewest loop iterations.
+
+    Inputs: 
+    operation (str): The constant operation to be played.
+    element (str): The element on which the operation is played.
+    time (int): The total time of the operation in ns. It can be a QUA int variable (e.g. from an input stream),
+            then the slices of max_length are played in a real-time loop until the remaining time fits in a
+            single play; it must be at least MIN_PULSE_CYCLES clock cycles and slices is ignored.
+    slices (int): the number of slices. If None (default), the minimum allowed by max_length.
+    amp_mod: optional QUA variable for the real-time correction factor to the pulse amplitude. 
+            To be used with input streams from the control computer (QUA variable of type fixed)
+    frequency: optional frequency in Hz (int or QUA variable of type int) set with update_frequency before the pulse.
+    max_length (int): the maximum duration of a single slice in ns.
+    kwargs: keyword arguments to pass to the play function
+    """
+    pulse = _modulated(operation, amp_mod)
+    if frequency is not None:
+        update_frequency(element, frequency, keep_phase=True)
+    if _is_qua(time):
+        remaining = _cycles(time)
+        slice_cycles = max_length//4 - MIN_PULSE_CYCLES # the last play gets between MIN_PULSE_CYCLES and max_length
+        with while_(remaining >= slice_cycles + MIN_PULSE_CYCLES):
+            play(pulse, element, duration=slice_cycles, **kwargs)
+            assign(remaining, remaining - slice_cycles)
+        play(pulse, element, duration=remaining, **kwargs)
+        return
+    slices, slice_cycles, last_cycles = solve_slices(time, slices, max_length)
+    if slices > 1:
+        iteration = declare(int, value=0)
+        with for_(iteration, 0, iteration < slices-1, iteration+1):
+            play(pulse, element, duration=slice_cycles, **kwargs)
+    play(pulse, element, duration=last_cycles, **kwargs)
+
+
+def long_pulse_amp_mod(operation, element, time, amp_mod, slices=None, **kwargs):
+    """
+    Same as long_pulse(operation, element, time, amp_mod=amp_mod), kept for the existing notebooks.
+    """
+    long_pulse(operation, element, time, slices=slices, amp_mod=amp_mod, **kwargs)
+
+
+def _modulated(operation, amp_mod):
+    """Return the operation to pass to play, scaled by amp_mod if given."""
+    if amp_mod is None:
+        return operation
+    if isinstance(amp_mod, (int, float)) and not -2 <= amp_mod < 2:
+        warnings.warn(f"The amplitude modulation factor {amp_mod} is not in [-2,2).")
+    return operation*amp(amp_mod)
+
+# ramp shapes for long_ramp: functions of x in [0,1) returning the amplitude factor in [0,1]
+RAMP_SHAPES = {
+    'linear': lambda x: x,
+    'exponential': lambda x: np.expm1(4*x)/np.expm1(4),
+    'tanh': lambda x: (np.tanh(4*(2*x-1)) + np.tanh(4))/(2*np.tanh(4)),
+}
+
+
+def ramp_table(time, n_steps=None, step_duration=None, shape='linear', max_steps=MAX_RAMP_STEPS):
+    """
+    Compute the amplitude table and the step durations of a ramp, see long_ramp.
+
+    Inputs:
+    time (int): the duration of the ramp in ns
+    n_steps (int): the number of steps. If None, it is derived from step_duration.
+    step_duration (int): the duration of a step in ns. If both are None, the ramp has max_steps steps
+                        (or less for short ramps, each step lasting at least the minimum pulse length).
+    shape: the name of a shape in RAMP_SHAPES or a function of x in [0,1) returning the amplitude factor (str or callable)
+    max_steps (int): the maximum number of steps, i.e. the length of the QUA array.
+
+    Returns:
+    factors (ndarray): the amplitude factor of each step
+    step_cycles (int): the duration of the first n_steps-1 steps, in clock cycles
+    last_cycles (int): the duration of the last step, in clock cycles
+    """
+    if n_steps is None and step_duration is not None:
+        n_steps = round(time/step_duration)
+    if n_steps is None:
+        n_steps = min(max_steps, round(time/4) // MIN_PULSE_CYCLES)
+    if n_steps < 1:
+        raise ValueError(f"The ramp of {time} ns has no step: it must last at least the minimum pulse length ({MIN_PULSE_CYCLES*4} ns).")
+    if n_steps > max_steps:
+        raise ValueError(f"The ramp has {n_steps} steps, more than the maximum of {max_steps}: use longer steps.")
+    shape = RAMP_SHAPES[shape] if isinstance(shape, str) else shape
+    factors = np.asarray(shape(np.arange(n_steps)/n_steps), dtype=float)
+    n_steps, step_cycles, last_cycles = solve_slices(time, n_steps)
+    return factors, step_cycles, last_cycles
+
+
+def long_ramp(operation, element, time, step_duration=None, n_steps=None, shape='linear', **kwargs):
+    """
+    Generate a ramp of any length. 
+    The amplitude factors of the steps are precomputed by ramp_table and stored in a QUA array: each step is a single
+    play of the constant operation with amp(factor) and a duration of time/n_steps. The last step takes the remaining
+    clock cycles, so the ramp lasts exactly the requested time.
+    Inputs: 
+    operation (str): the operation linked to the constant pulse which is being discretized. 
+    element: the element played (str)
+    time: the duration of the ramp in ns (int)
+    step_duration: the duration of the steps in ns (int). By default the ramp has up to MAX_RAMP_STEPS steps.
+    n_steps: the number of steps (int), alternative to step_duration
+    shape: 'linear', 'exponential', 'tanh' or a function of x in [0,1) returning the amplitude factor in [-2,2) (str or callable)
+    kwargs: keyword arguments to pass to the play function
+
+    Returns:
+    the realized duration of the ramp in ns (int)
+    """
+    factors, step_cycles, last_cycles = ramp_table(time, n_steps, step_duration, shape)
+    table = declare(fixed, value=factors.tolist())
+    step = declare(int, value=0)
+    with for_(step, 0, step < len(factors)-1, step+1):
+        play(operation*amp(table[step]), element, duration=step_cycles, **kwargs)
+    play(operation*amp(table[len(factors)-1]), element, duration=last_cycles, **kwargs)
+    return ((len(factors)-1)*step_cycles + last_cycles)*4
+
+
+def stroboscopic(operations, element, periods, delay=0, amp_mod=None, frequency=None, high_time=None, low_time=None, period_time=None, **kwargs):
+    """
+    Function to generate the stroboscopic sequence.
+    Inputs: 
+    operations: ORDERED tuple with the high and low operation to play (tuple of str)
+    element: the element played (str)
+    periods: the number of periods to play (int or QUA int variable)
+    delay: the delay time in ns to apply to the beginning of each period (int or QUA int variable).
+        Important: this is only to be used for the repumper/cooler, for which the low pulse is 
+        the second in the tuple. A delay of 0 is skipped, otherwise it must be at least 16 ns: a python value 
+        below raises a ValueError, a QUA value below is played as 16 ns.
+    amp_mod: optional QUA variable for the real-time correction factor to the amplitude of the high pulse. 
+            To be used with input streams from the control computer (QUA variable of type fixed)
+    frequency: optional frequency in Hz (int or QUA variable of type int) set with update_frequency before the sequence.
+    high_time: optional duration in ns of the high pulse, instead of its length in the configuration (int or QUA int variable)
+    low_time: optional duration in ns of the low pulse, instead of its length in the configuration (int or QUA int variable)
+    period_time: optional duration in ns of the whole period (int or QUA int variable). The low time is then derived,
+            in real time if any of the times is a QUA variable, as period_time - delay - high_time (high_time is needed).
+            A low time computed in real time is played for at least 16 ns, the period is then longer than period_time.
+    kwargs: keyword arguments to pass to the play function
+
+    With QUA variables (e.g. from input streams) for the delay and the durations, the same compiled program serves
+    a whole timing scan. The durations are overridden with play(..., duration=...), so the operations must be constant pulses.
+    """
+    high = _modulated(operations[0], amp_mod)
+    if frequency is not None:
+        update_frequency(element, frequency, keep_phase=True)
+    delay_cycles = _cycles(delay)
+    if _is_qua(delay_cycles): # e.g. from an input stream, which is not clamped by the control computer
+        with if_((delay_cycles > 0) & (delay_cycles < MIN_PULSE_CYCLES)):
+            assign(delay_cycles, MIN_PULSE_CYCLES)
+    elif 0 < delay_cycles < MIN_PULSE_CYCLES:
+        raise ValueError(f"The delay {delay_cycles*4} ns is shorter than the minimum pulse length ({MIN_PULSE_CYCLES*4} ns).")
+    high_cycles = None if high_time is None else _cycles(high_time)
+    low_cycles = None if low_time is None else _cycles(low_time)
+    if period_time is not None:
+        if low_time is not None or high_time is None:
+            raise ValueError("With period_time, give high_time and not low_time: the low time is derived.")
+        period_cycles = _cycles(period_time)
+        if any(_is_qua(value) for value in (period_cycles, high_cycles, delay_cycles)):
+            low_cycles = declare(int)
+            assign(low_cycles, period_cycles - high_cycles - delay_cycles)
+            with if_(low_cycles < MIN_PULSE_CYCLES):
+                assign(low_cycles, MIN_PULSE_CYCLES)
+        else:
+            low_cycles = period_cycles - high_cycles - delay_cycles
+            if low_cycles < MIN_PULSE_CYCLES:
+                raise ValueError(f"The low time {low_cycles*4} ns is shorter than the minimum pulse length ({MIN_PULSE_CYCLES*4} ns).")
+
+    iteration = declare(int, value=0)
+    def loop(with_delay):
+        with for_(iteration, 0, iteration < periods, iteration+1):
+            if with_delay:
+                play(operations[1], element, duration=delay_cycles, **kwargs)
+            play(high, element, duration=high_cycles, **kwargs)
+            play(operations[1], element, duration=low_cycles, **kwargs)
+
+    if _is_qua(delay_cycles): # the branch is outside the loop, the periods are not slowed down
+        with if_(delay_cycles > 0):
+            loop(True)
+        with else_():
+            loop(False)
+    else:
+        loop(delay_cycles != 0)
+
+
+def stroboscopic_amp_mod(operations, element, periods, amp_mod, delay=0, **kwargs):
+    """
+    Same as stroboscopic(operations, element, periods, delay, amp_mod=amp_mod), kept for the existing notebooks.
+    """
+    stroboscopic(operations, element, periods, delay=delay, amp_mod=amp_mod, **kwargs)
+
+
+def add_stroboscopic_chunk(channel, name, operations, periods, delay=0, max_samples=MAX_WAVEFORM_SAMPLES):
+    """
+    Register on a channel the arbitrary waveforms used by stroboscopic_chunked.
+    A chunk contains K full periods (optional delay, high and low pulse) in a single waveform, 
+    K being the largest number of periods which fits in max_samples.
+    If periods is not a multiple of K, a second operation name+'_tail' with the remaining periods is added.
+
+    Inputs:
+    channel: the SingleChannel on which the operations are defined (SingleChannel)
+    name: the name of the chunk operation to add (str)
+    operations: ORDERED tuple with the high and low SquarePulse operations of the channel, as in stroboscopic (tuple of str)
+    periods: the total number of periods to play (int)
+    delay: the delay time in ns at the beginning of each period, played with the amplitude of the low pulse (int)
+    max_samples: the maximum length of the chunk waveform in samples (int)
+
+    Returns:
+    periods_per_chunk (int): to be passed to stroboscopic_chunked
+    """
+    if periods < 1:
+        raise ValueError(f"The number of periods must be at least 1, got {periods}.")
+    high = channel.operations[operations[0]]
+    low = channel.operations[operations[1]]
+    segments = [(high.length, high.amplitude), (low.length, low.amplitude)]
+    if delay != 0:
+        segments.insert(0, (_cycles(delay)*4, low.amplitude))
+    period = np.concatenate([np.full(length, amplitude) for length, amplitude in segments])
+    if len(period) > max_samples:
+        raise ValueError(f"One period ({len(period)} ns) does not fit in {max_samples} samples.")
+
+    periods_per_chunk = min(periods, max_samples // len(period))
+    channel.operations[name] = WaveformPulse(waveform_I=np.tile(period, periods_per_chunk).tolist())
+    tail = periods % periods_per_chunk
+    if tail:
+        channel.operations[name+'_tail'] = WaveformPulse(waveform_I=np.tile(period, tail).tolist())
+    return periods_per_chunk
+
+
+def stroboscopic_chunked(operation, element, periods, periods_per_chunk, amp_mod=None, frequency=None, **kwargs):
+    """
+    Stroboscopic sequence played by chunks of several periods, see add_stroboscopic_chunk.
+    It needs periods/periods_per_chunk play statements instead of 2 (or 3 with delay) per period.
+    Without amp_mod it plays the same envelope as stroboscopic. amp_mod scales the whole chunk waveform, low pulse
+    and delay included, while stroboscopic scales only the high pulse: the two match with amp_mod only if the low
+    pulse has zero amplitude.
+
+    Inputs:
+    operation: the chunk operation registered by add_stroboscopic_chunk (str)
+    element: the element played (str)
+    periods: the number of periods to play, must be the same used for add_stroboscopic_chunk (int)
+    periods_per_chunk: the number of periods in a chunk, returned by add_stroboscopic_chunk (int)
+    amp_mod: optional QUA variable for the real-time correction factor to the amplitude of the whole chunk (QUA variable of type fixed)
+    frequency: optional frequency in Hz (int or QUA variable of type int) set with update_frequency before the sequence.
+    kwargs: keyword arguments to pass to the play function
+    """
+    n_chunks, tail = divmod(periods, periods_per_chunk)
+    if frequency is not None:
+        update_frequency(element, frequency, keep_phase=True)
+    iteration = declare(int, value=0)
+    with for_(iteration, 0, iteration < n_chunks, iteration+1):
+        play(_modulated(operation, amp_mod), element, **kwargs)
+    if tail:
+        play(_modulated(operation+'_tail', amp_mod), element, **kwargs)
+
+
+def multitone_waveform(frequencies, amplitudes, length=MAX_WAVEFORM_SAMPLES, phases=None, iterations=200):
+    """
+    Compute a waveform which is the sum of N tones (one per tweezer spot), to be looped seamlessly.
+    The frequencies are rounded to multiples of 1/length, so that every tone makes an integer number of cycles in the
+    waveform and the repetitions join without phase jumps. The phases start from the Schroeder phases (low crest factor
+    for any number of tones) and are refined by clipping the waveform and projecting back on the tones with FFTs.
+
+    Inputs:
+    frequencies: the frequencies of the tones in Hz (array), played with an intermediate frequency of 0
+    amplitudes: the amplitude of each tone in V (array or float)
+    length: the length of the waveform in samples (ns), a multiple of 4 (int). The frequency resolution is 1e9/length Hz.
+    phases: optional phases of the tones in rad (array), used as they are without optimization
+    iterations: the number of clipping iterations of the phase optimization (int, 0 for the Schroeder phases)
+
+    Returns:
+    samples (ndarray): the waveform in V
+    frequencies (ndarray): the frequencies actually played in Hz
+    phases (ndarray): the phases of the tones in rad
+    crest_factor (float): peak/rms of the waveform
+    """
+    if length % 4 or length > MAX_WAVEFORM_SAMPLES:
+        raise ValueError(f"The length {length} of the waveform must be a multiple of 4 and at most {MAX_WAVEFORM_SAMPLES} samples.")
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    amplitudes = np.broadcast_to(np.asarray(amplitudes, dtype=float), frequencies.shape)
+    bins = np.round(frequencies*length*1e-9).astype(int)
+    if bins.min() <= 0 or bins.max() >= length//2:
+        raise ValueError(f"The frequencies must be between {1e9/length:.0f} Hz and the Nyquist frequency 500 MHz.")
+    if len(np.unique(bins)) < len(bins):
+        raise ValueError(f"Two tones are closer than the frequency resolution of {1e9/length:.0f} Hz: increase the length.")
+    realized = bins*1e9/length
+    shift = np.abs(realized - frequencies).max()
+    if shift > 0:
+        warnings.warn(f"The frequencies are rounded to multiples of {1e9/length:.0f} Hz for a seamless loop (max shift {shift:.0f} Hz).")
+
+    def synthesize(phases):
+        spectrum = np.zeros(length//2 + 1, dtype=complex)
+        spectrum[bins] = amplitudes*np.exp(1j*phases)*length/2
+        return np.fft.irfft(spectrum, length)
+
+    if phases is None:
+        power = amplitudes**2/np.sum(amplitudes**2)
+        k = np.arange(len(bins))
+        # Schroeder phases for arbitrary amplitudes: phi_k = -2 pi sum_{l<k} (k-l) p_l
+        phases = -2*np.pi*np.array([np.sum((i - k[:i])*power[:i]) for i in k])
+        best, best_peak = phases, np.abs(synthesize(phases)).max()
+        for _ in range(iterations):
+            samples = synthesize(phases)
+            limit = 0.9*np.abs(samples).max()
+            phases = np.angle(np.fft.rfft(np.clip(samples, -limit, limit))[bins])
+            peak = np.abs(synthesize(phases)).max()
+            if peak < best_peak:
+                best, best_peak = phases, peak
+        phases = best
+    phases = np.broadcast_to(np.asarray(phases, dtype=float), frequencies.shape)
+    samples = synthesize(phases)
+    crest_factor = np.abs(samples).max()/np.sqrt(np.mean(samples**2))
+    return samples, realized, phases, crest_factor
+
+
+def add_multitone(channel, name, frequencies, amplitudes, length=MAX_WAVEFORM_SAMPLES, **kwargs):
+    """
+    Register on a single channel an operation with the multi-tone waveform of a tweezer array, see multitone_waveform.
+    The channel must have intermediate_frequency=0: the tones are in the waveform itself, so any number of spots uses
+    one element and one output instead of one SingleChannel per spot.
+
+    Inputs:
+    channel: the SingleChannel of the tweezer AOM (SingleChannel)
+    name: the name of the operation to add (str)
+    frequencies, amplitudes, length: see multitone_waveform
+    kwargs: keyword arguments of multitone_waveform (phases, iterations)
+
+    Returns:
+    the frequencies actually played in Hz (ndarray)
+    """
+    if channel.intermediate_frequency:
+        warnings.warn(f"The intermediate frequency of the channel is {channel.intermediate_frequency} Hz: the tones are shifted by it.")
+    samples, realized, phases, crest_factor = multitone_waveform(frequencies, amplitudes, length, **kwargs)
+    peak = np.abs(samples).max()
+    if peak >= MAX_AMPLITUDE:
+        raise ValueError(f"The peak of the waveform is {peak:.3f} V (crest factor {crest_factor:.2f}), above the output range of {MAX_AMPLITUDE} V: reduce the amplitudes.")
+    channel.operations[name] = WaveformPulse(waveform_I=samples.tolist())
+    return realized
+
+
+def long_multitone(operation, element, time, length, amp_mod=None, frequency=None, **kwargs):
+    """
+    Play the waveform registered by add_multitone for a given time, repeating it in a real-time loop as long_pulse does.
+    The played time is the largest multiple of the waveform length which fits in time (the tones stay continuous).
+
+    Inputs:
+    operation: the operation registered by add_multitone (str)
+    element: the element played (str)
+    time: the duration in ns (int or QUA int variable)
+    length: the length in ns of the waveform, as given to add_multitone (int)
+    amp_mod: optional QUA variable for the real-time correction factor of all the tones (QUA variable of type fixed)
+    frequency: optional intermediate frequency in Hz set before the pulse, shifting all the tones (int or QUA variable of type int)
+    kwargs: keyword arguments to pass to the play function
+
+    Returns:
+    the number of repetitions (int), None if time is a QUA variable
+    """
+    if length % 4 or length > MAX_WAVEFORM_SAMPLES:
+        raise ValueError(f"The length {length} of the waveform must be a multiple of 4 and at most {MAX_WAVEFORM_SAMPLES} samples.")
+    if frequency is not None:
+        update_frequency(element, frequency, keep_phase=True)
+    played = declare(int, value=0)
+    if _is_qua(time):
+        # the loop counts the played ns, so time needs no division in real time
+        with for_(played, 0, played + length <= time, played + length):
+            play(_modulated(operation, amp_mod), element, **kwargs)
+        return None
+    repetitions = int(time // length)
+    if repetitions*length != time:
+        warnings.warn(f"The time {time} ns is not a multiple of the waveform length, {repetitions*length} ns will be played.")
+    with for_(played, 0, played < repetitions, played + 1):
+        play(_modulated(operation, amp_mod), element, **kwargs)
+    return repetitions
+
+
+def add_photodiode(machine, name='photodiode', opx_input=('con1', 1), opx_output=('con1', 10), length=PHOTODIODE_READOUT_LENGTH, time_of_flight=24):
+    """
+    Add a channel which reads a photodiode (or any fluorescence signal) on an analog input of the OPX, with a
+    'readout' measurement operation of the given length. The OPX elements need an output: opx_output must be a free
+    analog output, the readout pulse plays 0 V on it.
+
+    Inputs:
+    machine: the machine (BasicQuAM)
+    name: the name of the channel (str)
+    opx_input: the analog input of the signal, 1 or 2 (tuple)
+    opx_output: a free analog output (tuple)
+    length: the length of one integration in ns (int), see photodiode_measure
+    time_of_flight: the delay in ns between the start of the pulse and the start of the acquisition (int, at least 24)
+
+    Returns:
+    the channel (InOutSingleChannel)
+    """
+    if length % 4 or length < MIN_PULSE_CYCLES*4:
+        raise ValueError(f"The readout length {length} ns must be a multiple of 4 ns and at least {MIN_PULSE_CYCLES*4} ns.")
+    channel = InOutSingleChannel(opx_output=opx_output, opx_input=opx_input, intermediate_frequency=0, time_of_flight=time_of_flight)
+    machine.channels[name] = channel
+    channel.operations['readout'] = SquareReadoutPulse(length=length, amplitude=0) # constant integration weights: the mean of the signal
+    return channel
+
+
+def photodiode_measure(element, time, signal, operation='readout', length=PHOTODIODE_READOUT_LENGTH):
+    """
+    Integrate the signal of the analog input of a photodiode channel (see add_photodiode) during a window, e.g. the
+    imaging pulses played at the same time on the other elements, and assign its mean in V to signal.
+    The measurement pulse is repeated in a real-time loop as long_pulse does: only the result is kept, not the samples.
+
+    Inputs:
+    element: the photodiode element (str)
+    time: the duration of the window in ns (int), rounded to a multiple of length
+    signal: the QUA variable of type fixed which receives the mean voltage
+    operation: the measurement operation (str)
+    length: the length of the measurement pulse in ns (int)
+
+    Returns:
+    the number of integrations (int)
+    """
+    repetitions = max(round(time/length), 1)
+    if repetitions*length != time:
+        warnings.warn(f"The window of {time} ns is not a multiple of the readout length, {repetitions*length} ns will be integrated.")
+    chunk = declare(fixed)
+    iteration = declare(int)
+    assign(signal, 0)
+    with for_(iteration, 0, iteration < repetitions, iteration+1):
+        measure(operation, element, None, integration.full('iw1', chunk, 'out1'))
+        assign(signal, signal + chunk*(2**12/length/repetitions)) # integration.full gives 2^-12 V per sample
+    return repetitions
+
+
+def photodiode_shot(element, time, signal_stream, occupancy_stream=None, threshold=0., **kwargs):
+    """
+    Measure the photodiode during a window (see photodiode_measure), save the mean voltage to signal_stream and,
+    with occupancy_stream, save whether it is above threshold (the tweezer is occupied).
+    Returns the QUA variables of the signal (fixed) and of the occupancy (bool), e.g. for feedback in the same shot.
+    """
+    signal = declare(fixed)
+    occupied = declare(bool)
+    photodiode_measure(element, time, signal, **kwargs)
+    assign(occupied, signal > threshold)
+    save(signal, signal_stream)
+    if occupancy_stream is not None:
+        save(occupied, occupancy_stream)
+    return signal, occupied
+
+
+def histogram_bins(edges):
+    """[lower, upper] of each bin of a histogram from the bin edges (array), as needed by the histogram of stream_processing."""
+    edges = np.asarray(edges, dtype=float)
+    return [[float(low), float(high)] for low, high in zip(edges[:-1], edges[1:])]
+
+
+def photodiode_processing(signal_stream, occupancy_stream=None, shots=None, edges=None, name='photodiode'):
+    """
+    Reduce the photodiode results on the controller, to be called in stream_processing(): the host fetches a few
+    numbers instead of one value per shot.
+
+    Results:
+    <name>_mean: the mean signal of all the shots (V)
+    <name>_histogram: the number of shots in each bin of edges (with edges)
+    <name>_occupancy: the fraction of shots above the threshold (with occupancy_stream)
+    <name>_set_mean, <name>_set_occupancy: the same, for every group of shots consecutive shots, all saved (with shots),
+    e.g. the shots of one parameter set
+
+    See photodiode_results for the same reduction in numpy (offline tests).
+    """
+    signal_stream.average().save(f'{name}_mean')
+    if edges is not None:
+        signal_stream.histogram(histogram_bins(edges)).save(f'{name}_histogram')
+    if shots is not None:
+        signal_stream.buffer(shots).map(FUNCTIONS.average()).save_all(f'{name}_set_mean')
+    if occupancy_stream is not None:
+        occupancy_stream.boolean_to_int().average().save(f'{name}_occupancy')
+        if shots is not None:
+            occupancy_stream.boolean_to_int().buffer(shots).map(FUNCTIONS.average()).save_all(f'{name}_set_occupancy')
+
+
+def photodiode_results(signals, threshold=0., shots=None, edges=None, name='photodiode', occupancy=True):
+    """
+    The results of photodiode_processing computed on the host from the signal of every shot (array, V): dict result
+    name -> value, as fetched from the result handles (the save_all results are arrays with the field 'value').
+    The bins of the histogram include the lower edge and exclude the upper one.
+    """
+    signals = np.asarray(signals, dtype=float)
+    occupied = (signals > threshold).astype(float)
+    results = {f'{name}_mean': signals.mean() if len(signals) else np.nan}
+    if edges is not None:
+        bins = np.array(histogram_bins(edges))
+        results[f'{name}_histogram'] = ((signals[:, None] >= bins[:, 0]) & (signals[:, None] < bins[:, 1])).sum(axis=0)
+    if occupancy:
+        results[f'{name}_occupancy'] = occupied.mean() if len(signals) else np.nan
+    if shots is not None:
+        complete = len(signals)//shots*shots
+        groups = [('set_mean', signals)] + ([('set_occupancy', occupied)] if occupancy else [])
+        for suffix, values in groups:
+            table = np.zeros(complete//shots, dtype=[('value', float)])
+            table['value'] = values[:complete].reshape(-1, shots).mean(axis=1)
+            results[f'{name}_{suffix}'] = table
+    return results
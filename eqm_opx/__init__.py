@@ -0,0 +1,27 @@
+"""
+lab code for the OPX and the M-LOOP scans: QuAM/QUA macros (QuAM_*), image analysis, watchers of the Andor images
+and of the M-LOOP files, and the optimization interface.
+The submodules are imported when they are first used (eqm_opx.image_utilities, ...), so importing the package does
+not import QUA, matplotlib or M-LOOP: a headless watcher pays only for what it uses.
+
+Usage:
+    from eqm_opx.QuAM_utilities import *
+    from eqm_opx.image_utilities import Photometry
+version 1.0
+"""
+
+import importlib
+
+__all__ = [
+    'QuAM_utilities', 'QuAM_library', 'QuAM_sweep', 'QuAM_timeline', 'QuAM_sequence', 'QuAM_cache', 'QuAM_benchmark',
+    'image_utilities', 'fits_arrival', 'run_log', 'latency', 'lattice_calibration', 'cost_averaging',
+    'image_watcher', 'stream_pusher', 'mloop_interface', 'supervisor', 'batch_reprocess', 'fake_opx',
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f'.{name}', __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
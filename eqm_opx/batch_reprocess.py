@@ -0,0 +1,210 @@
+"""
+batch re-analysis of the images of a finished day, e.g. with a new roi, rotation angle or background region.
+All the runs under a directory (R*_AndorAbs.fts and R*_AndorAbs2.fts, paired by run) are measured by a pool of
+processes working on chunks of runs, and the counts are written to one table with a row per run.
+The table is written while the chunks complete: an interrupted reprocessing restarts from the runs not in the table.
+
+Usage:
+    eqm-reprocess X:\\2024\\2024-12-18 -o fluo_2024_12_18.csv --angle -3 --crop 177:217,162:217
+    eqm-reprocess X:\\2024\\2024-12-18 --calibration lattice_calibration.json --date 2024-12-18
+version 1.0
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import glob
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+
+from .image_utilities import Photometry, RotatedCrop, get_image_shape, tweezer_rois
+from .lattice_calibration import load_calibration, photometry_from_calibration
+from .run_log import run_number
+
+PAIR = ('AndorAbs.fts', 'AndorAbs2.fts')
+
+_photometry = None # the Photometry of a worker process
+
+
+def find_runs(directory, pair=PAIR):
+    """
+    Return the runs of a directory (searched recursively), sorted by run number:
+    list of (name, first image path or None, second image path or None), name being e.g. '<subdir>/R00012'.
+    """
+    runs = {}
+    for index, suffix in enumerate(pair):
+        for path in glob.glob(os.path.join(directory, '**', f'R*_{suffix}'), recursive=True):
+            name = os.path.relpath(path, directory)[:-len(suffix)-1].replace(os.sep, '/')
+            runs.setdefault(name, [None, None])[index] = path
+    return sorted(((name, *paths) for name, paths in runs.items()), key=lambda run: (os.path.dirname(run[0]), run_number(run[0]+'_'), run[0]))
+
+
+def _init_worker(photometry):
+    global _photometry
+    _photometry = photometry
+
+
+def _measure(path):
+    """(norm_fluo, sum_fluo, sum_bkg) of an image, NaN if the image is missing or cannot be read."""
+    n = len(_photometry.rois)
+    if path is None:
+        return (np.full(n, np.nan),)*3
+    try:
+        return _photometry.load(path)
+    except Exception as error:
+        warnings.warn(f"Analysis of {path} failed: {error!r}")
+        return (np.full(n, np.nan),)*3
+
+
+def _process_chunk(runs):
+    """Measure a chunk of runs in a worker process and return their rows (see Reprocessor.columns)."""
+    rows = []
+    for name, first, second in runs:
+        row = [name, run_number(name+'_'), max(os.path.getmtime(path) for path in (first, second) if path is not None)]
+        for path in (first, second):
+            for counts in _measure(path):
+                row += list(counts)
+        rows.append(row)
+    return rows
+
+
+class Reprocessor:
+    """
+    Usage:
+        photometry = Photometry(*tweezer_rois(n_tweezers=2, lcrop=5), RotatedCrop(-3, (slice(177, 217), slice(162, 217))))
+        table = Reprocessor(photometry, 'fluo_2024_12_18.csv').run(r"X:\\2024\\2024-12-18")
+        data = pandas.read_csv('fluo_2024_12_18.csv', sep='\\t')
+
+    The table has one row per run: name, run, file_time, then net/raw/bkg of each tweezer for the first image (_1)
+    and the second image (_2). The analysis parameters are saved next to the table (.json): a table made with
+    different parameters is not resumed, delete it or choose another output.
+    """
+
+    def __init__(self, photometry, output, parameters=None, workers=None, chunk_size=64):
+        """
+        Inputs:
+        photometry: the Photometry of the images (Photometry)
+        output: the path of the table (tab-separated text)
+        parameters: the description of the analysis (dict, json serializable), checked when resuming
+        workers: the number of processes (int, default the number of cpus)
+        chunk_size: the number of runs of a work unit (int)
+        """
+        self.photometry = photometry
+        self.output = output
+        self.parameters = parameters or {}
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        n = len(photometry.rois)
+        self.columns = ['name', 'run', 'file_time'] + [f'{kind}{i}_{image}' for image in (1, 2) for kind in ('net', 'raw', 'bkg') for i in range(n)]
+
+    def done(self):
+        """Return the names of the runs already in the table."""
+        if not os.path.exists(self.output):
+            return set()
+        with open(self.output, newline='') as file:
+            return {row['name'] for row in csv.DictReader(file, delimiter='\t')}
+
+    def _check_parameters(self):
+        path = os.path.splitext(self.output)[0] + '.json'
+        if os.path.exists(path) and os.path.exists(self.output):
+            with open(path) as file:
+                previous = json.load(file)
+            if previous != json.loads(json.dumps(self.parameters)):
+                raise ValueError(f"{self.output} was made with different parameters ({previous}): delete it or choose another output.")
+        with open(path, 'w') as file:
+            json.dump(self.parameters, file, indent=1)
+
+    def run(self, directory, progress=True):
+        """
+        Measure the runs of the directory not yet in the table and append them to it.
+        At the end the table is sorted by run. Returns the number of runs measured.
+        """
+        self._check_parameters()
+        done = self.done()
+        runs = [run for run in find_runs(directory) if run[0] not in done]
+        unpaired = sum(first is None or second is None for _, first, second in runs)
+        if unpaired:
+            warnings.warn(f"{unpaired} runs have only one image, the counts of the other one are NaN.")
+        if runs and self.photometry.shape is None: # the weights are built once here, not in every worker
+            self.photometry.compile(get_image_shape(next(path for path in runs[0][1:] if path is not None)))
+        chunks = [runs[i:i+self.chunk_size] for i in range(0, len(runs), self.chunk_size)]
+        start, measured = time.time(), 0
+        new = not os.path.exists(self.output)
+        with open(self.output, 'a', newline='') as file:
+            writer = csv.writer(file, delimiter='\t')
+            if new:
+                writer.writerow(self.columns)
+            with concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.photometry,)) as executor:
+                futures = [executor.submit(_process_chunk, chunk) for chunk in chunks]
+                for future in concurrent.futures.as_completed(futures):
+                    rows = future.result()
+                    writer.writerows(rows)
+                    file.flush() # a complete chunk is never lost
+                    measured += len(rows)
+                    if progress:
+                        elapsed = time.time() - start
+                        print(f"\r{measured}/{len(runs)} runs, {2*measured/elapsed:.0f} images/s", end='', flush=True)
+        if progress and runs:
+            print()
+        self.sort()
+        return measured
+
+    def sort(self):
+        """Rewrite the table sorted by run."""
+        with open(self.output, newline='') as file:
+            reader = csv.reader(file, delimiter='\t')
+            header = next(reader)
+            rows = sorted(reader, key=lambda row: (os.path.dirname(row[0]), int(row[1]), row[0]))
+        with open(self.output, 'w', newline='') as file:
+            writer = csv.writer(file, delimiter='\t')
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def parse_slice(text):
+    """'177:217' -> slice(177, 217)"""
+    start, stop = text.split(':')
+    return slice(int(start), int(stop))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the fluorescence of all the runs of a directory into one table.")
+    parser.add_argument('directory', help="the directory of the images, searched recursively")
+    parser.add_argument('-o', '--output', default=None, help="the table (default fluo_<directory name>.csv)")
+    parser.add_argument('--angle', type=float, default=-3, help="rotation angle in degrees")
+    parser.add_argument('--crop', default='177:217,162:217', help="crop of the rotated image, rows,columns")
+    parser.add_argument('--n-tweezers', type=int, default=2)
+    parser.add_argument('--lcrop', type=int, default=5, help="size of the rois in pixels")
+    parser.add_argument('--x0', type=int, default=20)
+    parser.add_argument('--y0', type=int, default=12)
+    parser.add_argument('--spacing', type=int, default=8)
+    parser.add_argument('--bkg-shift', type=int, default=None, help="shift of the background rois in pixels (default 3*lcrop)")
+    parser.add_argument('--calibration', default=None, help="a lattice calibration file, replaces the geometry options (see lattice_calibration)")
+    parser.add_argument('--date', default=None, help="the date of the calibration entry, YYYY-MM-DD (default today)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=64)
+    args = parser.parse_args(argv)
+
+    output = args.output or f"fluo_{os.path.basename(os.path.normpath(args.directory))}.csv"
+    if args.calibration is not None:
+        calibration = load_calibration(args.calibration, args.date)
+        if calibration is None:
+            raise ValueError(f"{args.calibration} has no calibration for {args.date or 'today'}.")
+        photometry = photometry_from_calibration(calibration)
+        parameters = {key: calibration[key] for key in ('angle', 'crop', 'rois', 'rois_bkg')}
+    else:
+        crop = tuple(parse_slice(part) for part in args.crop.split(','))
+        rois, rois_bkg = tweezer_rois(args.n_tweezers, args.lcrop, args.x0, args.y0, args.spacing, args.bkg_shift)
+        photometry = Photometry(rois, rois_bkg, RotatedCrop(args.angle, crop))
+        parameters = {'angle': args.angle, 'crop': args.crop, 'rois': rois, 'rois_bkg': rois_bkg}
+    start = time.time()
+    measured = Reprocessor(photometry, output, parameters, args.workers, args.chunk_size).run(args.directory)
+    print(f"{measured} runs measured in {time.time()-start:.1f} s, table {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+averaging of several shots with the same parameters before a cost is reported to M-LOOP.
+The counts of every tweezer are accumulated with a streaming mean and variance (Welford): the cost is reported as
+soon as its standard error is below the target, or after max_shots, with the standard error as uncer.
+Shots far from the previous ones (a lost image, a cosmic ray, a laser unlocked during the shot) are not averaged,
+and a parameter set with too many of them is reported as bad. The outliers are searched on the background only,
+with the median and the median absolute deviation of all the shots seen: the counts of single atoms are bimodal
+(loaded or empty), so any test on the tweezers would reject the ordinary alternation and bias the cost toward the
+state of the first shots.
+version 1.0
+"""
+
+import numpy as np
+
+
+class ShotAverager:
+    """
+    Usage:
+        averager = ShotAverager(n_tweezers=2, tweezer=1, target=0.05, max_shots=20)
+        interface = OPXInterface(job, streams, averager=averager)    # get_next_cost_dict averages the shots of each set
+    or by hand:
+        averager.reset()
+        while not averager.done:
+            averager.add(sum_fluo, sum_bkg)    # counts of each tweezer of a shot, and their background
+        cost_dict = averager.result()    # {'cost': - mean counts of the tweezer, 'uncer': standard error, 'bad': ..., 'shots': ...}
+    """
+
+    def __init__(self, n_tweezers=2, tweezer=1, min_shots=3, max_shots=20, target=0.05, target_uncer=None,
+                 outlier_sigma=5, max_outliers=0.3):
+        """
+        Inputs:
+        n_tweezers: the number of tweezers (int)
+        tweezer: the index of the tweezer of the cost: cost = - mean counts, as ImageCostHandler (int)
+        min_shots: the shots taken before the target is checked and the outliers are searched (int, at least 2)
+        max_shots: the maximum number of shots of a parameter set (int)
+        target: the standard error of the cost to reach, relative to the cost (float)
+        target_uncer: the standard error to reach in counts, replaces target (float)
+        outlier_sigma: a shot whose background is further than outlier_sigma robust standard deviations (1.4826 MAD,
+                       at least the shot noise) from the median of the previous shots is an outlier (float)
+        max_outliers: the fraction of outlier shots above which the set is bad (float)
+        """
+        if min_shots < 2 or max_shots < min_shots:
+            raise ValueError(f"Need 2 <= min_shots <= max_shots, got min_shots={min_shots}, max_shots={max_shots}.")
+        self.n_tweezers = n_tweezers
+        self.tweezer = tweezer
+        self.min_shots = min_shots
+        self.max_shots = max_shots
+        self.target = target
+        self.target_uncer = target_uncer
+        self.outlier_sigma = outlier_sigma
+        self.max_outliers = max_outliers
+        self.reset()
+
+    def reset(self):
+        """Start a new parameter set."""
+        self.n = 0
+        self.mean = np.zeros(self.n_tweezers)
+        self._m2 = np.zeros(self.n_tweezers) # sum of the squared deviations from the mean
+        self.outliers = 0
+        self._backgrounds = [] # the finite backgrounds of all the shots, outliers included
+
+    @property
+    def shots(self):
+        """The number of shots taken, outliers included."""
+        return self.n + self.outliers
+
+    @property
+    def std(self):
+        """The standard deviation of the counts of each tweezer between the shots."""
+        return np.sqrt(self._m2/(self.n - 1)) if self.n > 1 else np.full(self.n_tweezers, np.inf)
+
+    @property
+    def uncer(self):
+        """The standard error of the cost."""
+        return self.std[self.tweezer]/np.sqrt(self.n) if self.n > 1 else np.inf
+
+    @property
+    def done(self):
+        """True when the cost is precise enough or max_shots were taken."""
+        if self.shots >= self.max_shots:
+            return True
+        if self.n < self.min_shots:
+            return False
+        target = self.target_uncer if self.target_uncer is not None else self.target*abs(self.mean[self.tweezer])
+        return self.uncer <= target
+
+    def is_outlier(self, background):
+        """True if background is further than outlier_sigma robust standard deviations from the median of the previous shots."""
+        if len(self._backgrounds) < self.min_shots:
+            return False
+        backgrounds = np.array(self._backgrounds)
+        median = np.median(backgrounds)
+        # standard deviation for gaussian noise; the MAD of a few shots can be much smaller, not the shot noise
+        scale = max(1.4826*np.median(np.abs(backgrounds - median)), np.sqrt(abs(median)))
+        return abs(background - median) > self.outlier_sigma*scale
+
+    def add(self, counts, background=None):
+        """
+        Add the counts of a shot (array of n_tweezers, None for a lost shot) and their background (float or array,
+        summed), on which the outliers are searched. Without background only the lost shots are outliers.
+        Returns False if the shot is an outlier and was not averaged.
+        """
+        if counts is None:
+            self.outliers += 1
+            return False
+        counts = np.asarray(counts, dtype=float)
+        if not np.all(np.isfinite(counts)):
+            self.outliers += 1
+            return False
+        if background is not None:
+            background = float(np.sum(background))
+            if not np.isfinite(background): # not kept, a NaN would make the median NaN for the rest of the set
+                self.outliers += 1
+                return False
+            outlier = self.is_outlier(background)
+            self._backgrounds.append(background)
+            if outlier:
+                self.outliers += 1
+                return False
+        self.n += 1
+        delta = counts - self.mean
+        self.mean += delta/self.n
+        self._m2 += delta*(counts - self.mean)
+        return True
+
+    def result(self):
+        """Return the cost dict of the parameter set for M-LOOP: cost, uncer, bad, and the statistics of the shots."""
+        bad = self.n < 2 or self.outliers > self.max_outliers*self.shots
+        return {'cost': -self.mean[self.tweezer] if self.n else 0., 'uncer': float(self.uncer) if self.n > 1 else 0., 'bad': bool(bad),
+                'shots': self.shots, 'outliers': self.outliers, 'mean': self.mean.tolist(), 'std': self.std.tolist()}
@@ -0,0 +1,343 @@
+"""
+hardware-free stand-in for the OPX and the Andor camera, to run the optimization loop on a laptop.
+FakeQuantumMachinesManager has the methods used by the notebooks (open_qm, execute, push_to_input_stream, halt, close):
+the job records the pushed values with their time and, for every complete set of input stream values, writes the two
+images of a shot (R*_AndorAbs.fts and R*_AndorAbs2.fts) in the watched directory, at a fixed shot rate.
+The atom signal of the images depends on the pushed values through a signal function, and the photodiode results
+reduced on the controller (photodiode_processing of QuAM_utilities) and the values of input streams saved with
+every shot (e.g. the parameter index, see OPXInterface) are served by job.result_handles.
+
+Usage:
+    eqm-fake-opx --shots 50 --period 0.1
+runs the supervisor, the photometry and the stream pusher against the fake job and prints throughput and latency.
+version 1.0
+"""
+
+import argparse
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from .image_utilities import RotatedCrop, tweezer_rois
+from .latency import recorder
+
+FRAME_SHAPE = (512, 512)
+STREAM_PATTERN = re.compile(r"declare_input_stream\(\w+, '([^']+)'")
+
+
+def gaussian_signal(optimum, widths, peak=1.0):
+    """
+    Return a signal function for FakeQuantumMachinesManager: peak*exp(-sum(((value-optimum)/width)^2)/2).
+    optimum, widths: dict input stream name -> value (streams not in the dict do not change the signal)
+    """
+    def signal(values):
+        exponent = sum(((values[name] - optimum[name])/widths[name])**2 for name in optimum if name in values)
+        return peak*np.exp(-exponent/2)
+    return signal
+
+
+def input_stream_names(program):
+    """Return the names of the input streams declared in a QUA program."""
+    from qm import generate_qua_script
+    return STREAM_PATTERN.findall(generate_qua_script(program))
+
+
+class FrameGenerator:
+    """
+    Synthetic Andor frames: a background with Poisson noise and a gaussian spot on each tweezer, placed so that the
+    rois of tweezer_rois fall on them after the rotation and crop of the image handler.
+    """
+
+    def __init__(self, shape=FRAME_SHAPE, n_tweezers=2, rotate_crop=None, background=500, atom_counts=3000, sigma=1.2, seed=None):
+        """
+        Inputs:
+        shape: the frame shape (rows, columns)
+        n_tweezers: the number of tweezers (int)
+        rotate_crop: the RotatedCrop of the image analysis (default: the one of read_image_mloop)
+        background: the mean background counts per pixel (float)
+        atom_counts: the total counts of a spot for a signal of 1 (float)
+        sigma: the width of the spots in pixels (float)
+        """
+        self.shape = shape
+        self.background = background
+        self.atom_counts = atom_counts
+        self.sigma = sigma
+        self.rng = np.random.default_rng(seed)
+        rotate_crop = rotate_crop or RotatedCrop(-3, (slice(177, 217), slice(162, 217)))
+        rotate_crop.prepare(shape)
+        start = np.array([rotate_crop.window[0].start, rotate_crop.window[1].start])
+        rois, _ = tweezer_rois(n_tweezers)
+        # centre of each roi in the crop -> coordinates in the frame
+        self.centers = np.array([rotate_crop.coordinates[:, y + l//2, x + l//2] + start for x, y, l in rois.values()])
+        rows, columns = np.indices(shape)
+        self._rows, self._columns = rows, columns
+
+    def frame(self, signals):
+        """Return a frame (uint16) with the signal of each tweezer (array, in units of atom_counts)."""
+        image = np.full(self.shape, float(self.background))
+        for (row, column), signal in zip(self.centers, signals):
+            window = (slice(max(int(row)-6, 0), int(row)+7), slice(max(int(column)-6, 0), int(column)+7))
+            distance2 = (self._rows[window] - row)**2 + (self._columns[window] - column)**2
+            image[window] += signal*self.atom_counts*np.exp(-distance2/(2*self.sigma**2))/(2*np.pi*self.sigma**2)
+        return np.clip(self.rng.poisson(image), 0, 2**16-1).astype(np.uint16)
+
+
+class FakeResult:
+    """Stand-in of a result handle: the value of a saved result, computed when it is fetched."""
+
+    def __init__(self, handles, name):
+        self.handles = handles
+        self.name = name
+
+    def fetch_all(self):
+        return self.handles.results().get(self.name)
+
+    def fetch(self, item, flat_struct=False):
+        return self.fetch_all()[item]
+
+    def count_so_far(self):
+        value = self.fetch_all()
+        if self.name in self.handles.job.saves or isinstance(value, np.ndarray) and value.dtype.names:
+            return len(value)
+        return int(value is not None)
+
+    def wait_for_values(self, count=1, timeout=10):
+        end = time.time() + timeout
+        while self.count_so_far() < count:
+            if time.time() > end:
+                raise TimeoutError(f"{self.name} has {self.count_so_far()} values after {timeout} s.")
+            time.sleep(0.01)
+
+
+class FakeResultHandles:
+    """
+    Stand-in of job.result_handles: get(name).fetch_all() returns what the OPX would return, for the photodiode
+    results reduced on the controller (see photodiode_processing in QuAM_utilities), computed with photodiode_results
+    from the photodiode signal of the shots taken so far, and for the input streams saved with every shot (save_all).
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+    def results(self):
+        shots = list(self.job.shots)
+        results = {name: np.array([shot['values'][stream] for shot in shots]) for name, stream in self.job.saves.items()}
+        manager = self.job.manager
+        if manager.photodiode is not None:
+            from .QuAM_utilities import photodiode_results # QUA is imported only for the photodiode
+            results.update(photodiode_results([shot['photodiode'] for shot in shots], **manager.photodiode_processing))
+        return results
+
+    def get(self, name):
+        return FakeResult(self, name)
+
+    def keys(self):
+        return list(self.results())
+
+    def is_processing(self):
+        return not self.job.is_halted()
+
+    def wait_for_all_values(self, timeout=None):
+        self.job._thread.join(timeout)
+        return self.job.is_halted()
+
+
+class FakeJob:
+    """The running job: records the pushes and runs the shots in a thread."""
+
+    def __init__(self, manager, streams, saves=None):
+        self.manager = manager
+        self.streams = streams
+        self.saves = saves or {} # result name -> input stream saved with every shot
+        self.pushes = [] # (time, stream, value)
+        self.shots = [] # dict(run, start, values, images, photodiode)
+        self.result_handles = FakeResultHandles(self)
+        self._queues = {name: queue.Queue() for name in streams}
+        self._halted = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def push_to_input_stream(self, stream_name, data):
+        if stream_name not in self._queues:
+            raise KeyError(f"The program has no input stream {stream_name}.")
+        self.pushes.append((time.time(), stream_name, data))
+        self._queues[stream_name].put(data)
+
+    def halt(self):
+        self._halted.set()
+        self._thread.join(timeout=1)
+        return True
+
+    def is_halted(self):
+        return self._halted.is_set()
+
+    def _next(self, name):
+        """Wait for the next value of a stream, as advance_input_stream. None when the job is halted."""
+        while not self._halted.is_set():
+            try:
+                return self._queues[name].get(timeout=0.05)
+            except queue.Empty:
+                continue
+        return None
+
+    def _run(self):
+        manager = self.manager
+        next_start = time.time()
+        while not self._halted.is_set():
+            values = {}
+            for name in self.streams:
+                values[name] = self._next(name)
+                if values[name] is None:
+                    return
+            time.sleep(max(next_start - time.time(), 0)) # the trigger of the next shot
+            start = time.time()
+            next_start = start + manager.shot_period
+            run = manager.next_run
+            manager.next_run += 1
+            signal = manager.signal(values) if manager.signal is not None else 1.0
+            signals = np.broadcast_to(signal, (len(manager.frames.centers),))
+            time.sleep(manager.exposure_delay) # sequence and exposure before the first image
+            images = []
+            for suffix, image_signals in (('AndorAbs', signals*manager.first_image_fraction), ('AndorAbs2', signals)):
+                path = os.path.join(manager.image_dir, f"R{run:05d}_{suffix}.fts")
+                fits.PrimaryHDU(manager.frames.frame(image_signals)).writeto(path, overwrite=True)
+                images.append(path)
+            photodiode = manager.photodiode(values) if manager.photodiode is not None else None
+            recorder.record('shot', start, run=run, index=len(self.shots)) # the n-th shot takes the n-th pushed values
+            self.shots.append({'run': run, 'start': start, 'values': values, 'images': images, 'photodiode': photodiode})
+
+
+class FakeQuantumMachine:
+    def __init__(self, manager, config):
+        self.manager = manager
+        self.config = config
+        self.jobs = []
+        self.closed = False
+
+    def get_config(self):
+        return self.config
+
+    def execute(self, program, streams=None, saves=None):
+        """
+        Start a fake job. streams: the names of the input streams advanced at each shot
+        (default: all the input streams declared in the program).
+        saves: dict result name -> input stream whose value the program saves with every shot (save_all)
+        """
+        streams = streams if streams is not None else input_stream_names(program)
+        job = FakeJob(self.manager, streams, saves)
+        self.jobs.append(job)
+        return job
+
+    def close(self):
+        for job in self.jobs:
+            job.halt()
+        self.closed = True
+
+
+class FakeQuantumMachinesManager:
+    """
+    Usage:
+        qmm = FakeQuantumMachinesManager(image_dir, shot_period=0.5,
+                                         signal=gaussian_signal({'cool_amp_imag_input_stream': 1.2}, {'cool_amp_imag_input_stream': 0.3}))
+        qm = qmm.open_qm(qua_config)
+        job = qm.execute(det_amp_optimization_streams)
+    and then the notebooks as with the OPX, watching image_dir instead of the camera directory.
+    """
+
+    def __init__(self, image_dir=None, shot_period=1.0, signal=None, exposure_delay=0.0, first_image_fraction=1.0, frames=None, first_run=0,
+                 photodiode=None, photodiode_processing=None):
+        """
+        Inputs:
+        image_dir: the directory where the images are written (default: a new temporary directory)
+        shot_period: the minimum time in s between two shots, i.e. the natural cycle of the experiment (float)
+        signal: function of the dict stream name -> pushed value returning the atom signal (float, or one per tweezer).
+                None for a constant signal of 1.
+        exposure_delay: time in s between the start of a shot and its images (float)
+        first_image_fraction: signal of the first image relative to the second one (float)
+        frames: the FrameGenerator (default FrameGenerator())
+        first_run: the number of the first run (int)
+        photodiode: function of the dict stream name -> pushed value returning the mean photodiode voltage of a shot,
+                    noise included (float). None without photodiode results
+        photodiode_processing: the keyword arguments of photodiode_results (threshold, shots, edges, name), as given
+                    to photodiode_processing in the program
+        """
+        self.image_dir = image_dir or tempfile.mkdtemp(prefix='fake_opx_')
+        os.makedirs(self.image_dir, exist_ok=True)
+        self.shot_period = shot_period
+        self.signal = signal
+        self.exposure_delay = exposure_delay
+        self.first_image_fraction = first_image_fraction
+        self.frames = frames or FrameGenerator()
+        self.next_run = first_run
+        self.photodiode = photodiode
+        self.photodiode_processing = photodiode_processing or {}
+
+    def open_qm(self, config, **kwargs):
+        return FakeQuantumMachine(self, config)
+
+    def close_all_quantum_machines(self):
+        pass
+
+
+def main():
+    from .cost_averaging import ShotAverager
+    from .mloop_interface import OPXInterface
+    from .supervisor import Supervisor
+
+    parser = argparse.ArgumentParser(description="Optimization loop against the fake OPX: throughput and latency.")
+    parser.add_argument('--shots', type=int, default=50, help="number of parameter sets to measure")
+    parser.add_argument('--period', type=float, default=0.1, help="shot period in s")
+    parser.add_argument('--workers', type=int, default=0, help="photometry processes (0: thread)")
+    parser.add_argument('--max-shots', type=int, default=0, help="average up to max-shots shots of each set (0: one shot), see cost_averaging")
+    parser.add_argument('--target', type=float, default=0.05, help="relative standard error of the averaged cost")
+    args = parser.parse_args()
+
+    stream = 'cool_amp_imag_input_stream'
+    qmm = FakeQuantumMachinesManager(shot_period=args.period, signal=gaussian_signal({stream: 1.0}, {stream: 0.3}))
+    qm = qmm.open_qm({})
+    first_run = qmm.next_run # the run of the first shot
+    job = qm.execute(None, streams=[stream, 'param_index_input_stream'], saves={'param_index': 'param_index_input_stream'})
+    averager = ShotAverager(min_shots=min(3, args.max_shots), max_shots=args.max_shots, target=args.target) if args.max_shots > 1 else None
+    interface = OPXInterface(job, [(stream, float)], timeout=10, index_stream='param_index_input_stream',
+                             first_run=first_run, averager=averager)
+    report = interface.report
+    interface.report = lambda cost, **extra: report(cost, received=time.time(), **extra)
+    params = [[value] for value in np.linspace(0.5, 1.5, args.shots)]
+
+    start = time.time()
+    if averager is not None:
+        optimize = lambda: [interface.average(values) for values in params]
+    else:
+        optimize = lambda: interface.evaluate(params)
+    results = Supervisor(qm, job, interface, qmm.image_dir, workers=args.workers).run_forever(optimize)
+    elapsed = time.time() - start
+    measured = [result for result in results if not result.get('bad')]
+    if not measured:
+        print(f"No cost received in {elapsed:.2f} s.")
+        return
+    costs = [result['cost'] if not result.get('bad') else np.inf for result in results]
+    if averager is not None:
+        shots = [result['shots'] for result in results]
+        print(f"{len(job.shots)} shots in {elapsed:.2f} s for {len(params)} sets: {np.mean(shots):.1f} shots per set (max {args.max_shots}), "
+              f"median uncer {np.median([result['uncer'] for result in measured]):.0f}, {sum(result['outliers'] for result in results)} outliers")
+        print(f"{len(results)-len(measured)} bad sets, best parameter {params[int(np.argmin(costs))][0]:.3f} (optimum 1.0)")
+        recorder.print_summary()
+        return
+    # the streams are FIFO: the n-th push and the n-th shot belong to the n-th set
+    pushes = [push for push in job.pushes if push[1] == stream]
+    push_latency = np.array([result['received'] - pushes[result['index']][0] for result in measured])
+    shot_latency = np.array([result['received'] - job.shots[result['index']]['start'] for result in measured])
+    print(f"{len(job.shots)} shots in {elapsed:.2f} s: {len(job.shots)/elapsed:.2f} shots/s (shot period {args.period} s)")
+    print(f"latency push -> cost: median {np.median(push_latency)*1e3:.1f} ms, max {push_latency.max()*1e3:.1f} ms")
+    print(f"latency shot -> cost: median {np.median(shot_latency)*1e3:.1f} ms, max {shot_latency.max()*1e3:.1f} ms")
+    print(f"{len(results)-len(measured)} bad runs, best parameter {params[int(np.argmin(costs))][0]:.3f} (optimum 1.0)")
+    recorder.print_summary()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+detection of the Andor images (.fts files) which are completely written.
+A file is ready when its header is complete (END card) and the file is as long as the header plus the data block
+given by BITPIX and NAXISn. The check reads only the header, so it is cheap enough to be repeated on every
+watchdog event (created, modified, closed) and by a polling thread for the files which are not complete yet
+(e.g. on network shares, where the modification events may not arrive).
+version 1.0
+"""
+
+import collections
+import os
+import queue
+import re
+import threading
+import time
+import warnings
+
+from watchdog.events import PatternMatchingEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+from .latency import recorder
+from .run_log import run_number
+
+BLOCK = 2880 # bytes of a FITS block
+CARD = 80 # bytes of a header card
+RUN_PATTERN = re.compile(r'(R\d+)_AndorAbs2?\.fts$', re.IGNORECASE)
+
+
+def fits_expected_size(path, padded=True):
+    """
+    Return the size in bytes the FITS file will have when complete (header and data of the primary HDU, with the
+    padding of the data to a multiple of 2880 bytes if padded), or None if the header is not complete yet.
+    """
+    try:
+        with open(path, 'rb') as file:
+            header = b''
+            while True:
+                block = file.read(BLOCK)
+                if len(block) < BLOCK:
+                    return None
+                header += block
+                cards = [block[i:i+CARD] for i in range(0, BLOCK, CARD)]
+                if any(card.rstrip() == b'END' for card in cards):
+                    break
+    except OSError: # e.g. still locked by the camera software on Windows
+        return None
+    values = {}
+    for i in range(0, len(header), CARD):
+        key, _, value = header[i:i+CARD].decode('ascii', 'replace').partition('=')
+        values[key.strip()] = value.split('/')[0].strip()
+    try:
+        bitpix = abs(int(values['BITPIX']))
+        axes = [int(values[f'NAXIS{i+1}']) for i in range(int(values['NAXIS']))]
+    except (KeyError, ValueError):
+        return None
+    data = bitpix//8
+    for axis in axes:
+        data *= axis
+    data = data if axes else 0
+    if padded:
+        data = -(-data//BLOCK)*BLOCK # the writer pads the last block after the data
+    return len(header) + data
+
+
+def fits_complete(path, padded=True):
+    """True if the header and the data of the FITS file are completely written (with the final padding if padded)."""
+    expected = fits_expected_size(path, padded)
+    if expected is None:
+        return False
+    try:
+        return os.path.getsize(path) >= expected
+    except OSError:
+        return False
+
+
+def run_key(path):
+    """Return the run of an image path, e.g. 'R00012' for .../R00012_AndorAbs2.fts (None if not an Andor image)."""
+    match = RUN_PATTERN.search(os.path.basename(path))
+    return match.group(1) if match else None
+
+
+def make_observer(polling=False, interval=1):
+    """Return a watchdog observer: native events, or polling every interval s (for network shares such as X:)."""
+    return PollingObserver(timeout=interval) if polling else Observer()
+
+
+class FitsArrivalHandler(PatternMatchingEventHandler):
+    """
+    Watchdog handler which calls on_ready(path) once for every image, as soon as it is completely written,
+    and on_pair(path1, path2) when both images of a run (R*_AndorAbs.fts and R*_AndorAbs2.fts) are ready.
+    Subclasses override on_ready and/or on_pair.
+
+    The files which are not complete at their first event are checked again at each event and by a polling
+    thread every poll_interval s. After timeout s a file is reported with a warning if only the final padding
+    is missing (a writer which does not pad), and dropped with a warning otherwise.
+    The completed files are queued and on_ready/on_pair are called by a single dispatcher thread, one image at a
+    time in the order they were completed, whichever thread (watchdog or poller) found them complete.
+
+        observer = make_observer(polling=True)    # polling for network shares
+        observer.schedule(handler, path=path_to_watch, recursive=True)
+        observer.start()
+    """
+
+    def __init__(self, patterns=('R*_AndorAbs.fts', 'R*_AndorAbs2.fts'), poll_interval=0.01, timeout=10, pair=('AndorAbs.fts', 'AndorAbs2.fts'),
+                 keep=60):
+        """
+        Inputs:
+        patterns: the files to watch (list of str)
+        poll_interval: the interval in s between two checks of an incomplete file (float)
+        timeout: the time in s after which an incomplete file is dropped (float)
+        pair: the suffixes of the first and second image of a run (tuple of str, None to disable the pairing)
+        keep: the time in s during which the later events of a reported file are ignored (float); a file written
+              again after that is reported again
+        """
+        super().__init__(patterns=list(patterns), ignore_directories=True, case_sensitive=False)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.pair = pair
+        self.keep = keep
+        self.pending = {} # path -> time of the first event
+        self.ready = collections.OrderedDict() # path -> time it was reported, oldest first
+        self.runs = {} # run -> {suffix: path} of the runs with one image ready (used by the dispatcher only)
+        self._queue = queue.Queue() # the completed paths, in order
+        self._lock = threading.Lock()
+        self._poller = None
+        self._dispatcher = None
+
+    # --- hooks ---
+    def on_ready(self, path):
+        """Called once for each completed image, in the dispatcher thread."""
+
+    def on_pair(self, first, second):
+        """Called once for each run when both its images are ready."""
+
+    # --- events ---
+    def on_created(self, event):
+        self.check(event.src_path)
+
+    def on_modified(self, event):
+        self.check(event.src_path)
+
+    def on_closed(self, event):
+        self.check(event.src_path)
+
+    def on_moved(self, event):
+        self.check(event.dest_path) # written elsewhere and renamed
+
+    def check(self, path):
+        """Queue the file if it is complete, otherwise keep it for the polling thread."""
+        with self._lock:
+            if path in self.ready:
+                return
+        complete = fits_complete(path) # the file is read outside the lock
+        with self._lock:
+            if path in self.ready: # completed meanwhile by another thread
+                return
+            if complete:
+                first = self.pending.pop(path, None)
+                self._enqueue(path)
+            else:
+                self.pending.setdefault(path, time.monotonic())
+                if self._poller is None: # cleared by _poll under the same lock when it stops
+                    self._poller = threading.Thread(target=self._poll, daemon=True)
+                    self._poller.start()
+        if complete:
+            now = time.time()
+            start = now if first is None else now - (time.monotonic() - first) # first event -> complete
+            recorder.record('write', start, now, run=run_number(path))
+
+    def _enqueue(self, path):
+        """Mark a path as ready and queue it for the dispatcher (called under the lock)."""
+        now = time.monotonic()
+        self.ready[path] = now
+        while self.ready and now - next(iter(self.ready.values())) > self.keep:
+            self.ready.popitem(last=False)
+        self._queue.put(path)
+        if self._dispatcher is None: # cleared by _dispatch under the same lock when it stops
+            self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            try:
+                path = self._queue.get(timeout=1)
+            except queue.Empty:
+                with self._lock:
+                    if self._queue.empty():
+                        self._dispatcher = None
+                        return
+                continue
+            try:
+                self._report(path)
+            except Exception as error: # a failed image must not stop the next ones
+                warnings.warn(f"The analysis of {path} failed: {error!r}")
+
+    def _report(self, path):
+        self.on_ready(path)
+        if self.pair is None:
+            return
+        run = run_key(path)
+        suffix = next((suffix for suffix in sorted(self.pair, key=len, reverse=True) if path.lower().endswith(suffix.lower())), None)
+        if run is None or suffix is None:
+            return
+        images = self.runs.setdefault((os.path.dirname(path), run), {})
+        images[suffix] = path
+        if len(images) == len(self.pair):
+            del self.runs[(os.path.dirname(path), run)]
+            self.on_pair(images[self.pair[0]], images[self.pair[1]])
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self.pending:
+                    self._poller = None
+                    return
+                paths = list(self.pending.items())
+            for path, first in paths:
+                if time.monotonic() - first <= self.timeout:
+                    self.check(path)
+                    continue
+                unpadded = fits_complete(path, padded=False)
+                with self._lock:
+                    if self.pending.pop(path, None) is None:
+                        continue
+                    if unpadded:
+                        self._enqueue(path)
+                if unpadded:
+                    warnings.warn(f"{path} has no padding after {self.timeout} s, it is analysed as it is.")
+                else:
+                    warnings.warn(f"{path} is still incomplete after {self.timeout} s, it is not analysed.")
@@ -0,0 +1,281 @@
+"""
+functions for the analysis of the Andor images (.fts files) produced during the optimization.
+astropy and scipy are imported by the functions which use them, at the first image: importing this module is cheap,
+so the watchers start in a fraction of a second.
+version 1.0
+"""
+
+import numpy as np
+
+
+def get_image_from_file(path, window=None):
+    """
+    read a .fts file and return a numpy array with data.
+    The file is memory-mapped and the scaling (BZERO/BSCALE) is applied only to the pixels which are read,
+    so reading a small window does not load the whole frame.
+
+    Params: path: the path of the image
+            window: optional (row slice, column slice) to read only a part of the frame
+    """
+    from astropy.io import fits
+    with fits.open(path, memmap=True, do_not_scale_image_data=True) as hdul:
+        header = hdul[0].header
+        data = hdul[0].data if window is None else hdul[0].data[window]
+        image = np.array(data, dtype=float) # copy: the memory map is closed with the file
+    bscale, bzero = header.get('BSCALE', 1), header.get('BZERO', 0)
+    if bscale != 1:
+        image *= bscale
+    if bzero != 0:
+        image += bzero
+    return image
+
+
+def get_image_shape(path):
+    """Return the (rows, columns) of the frame in a .fts file, reading only the header."""
+    from astropy.io import fits
+    header = fits.getheader(path)
+    return header['NAXIS2'], header['NAXIS1']
+
+
+def rotation_geometry(angle, shape):
+    """
+    Geometry of ndimage.rotate(image, angle) (reshape=True) for a frame of the given shape:
+    a pixel q (row, column) of the rotated image comes from the point rot_matrix @ q + offset of the frame.
+    Returns rot_matrix (2x2), offset (2,) and the shape of the rotated image.
+    """
+    from scipy import special
+    c, s = special.cosdg(angle), special.sindg(angle)
+    rot_matrix = np.array([[c, s], [-s, c]])
+    in_plane_shape = np.asarray(shape)
+    iy, ix = in_plane_shape
+    out_bounds = rot_matrix @ [[0, 0, iy, iy], [0, ix, 0, ix]]
+    out_plane_shape = (np.ptp(out_bounds, axis=1) + 0.5).astype(int)
+    offset = (in_plane_shape - 1)/2 - rot_matrix @ ((out_plane_shape - 1)/2)
+    return rot_matrix, offset, out_plane_shape
+
+
+def to_rotated(points, angle, shape):
+    """Return the (row, column) coordinates in ndimage.rotate(image, angle) of points (N, 2) of a frame of the given shape."""
+    rot_matrix, offset, _ = rotation_geometry(angle, shape)
+    return (np.asarray(points, dtype=float) - offset) @ rot_matrix # rot_matrix.T @ (p - offset) for every point
+
+
+class RotatedCrop:
+    """
+    Equivalent of ndimage.rotate(image, angle)[crop], computed only on the pixels of the crop.
+
+    The coordinates in the original frame of the crop pixels are computed once (same geometry as
+    ndimage.rotate with reshape=True) and cached, together with the window of the frame they fall in
+    (plus some padding for the spline interpolation). Each image then costs the read of the window and
+    the interpolation of the crop pixels, instead of the rotation of the full frame.
+
+    Usage:
+        rotate_crop = RotatedCrop(-3, (slice(177, 217), slice(162, 217)))
+        image_rot = rotate_crop.load(path)     # reads only the window from the file
+        image_rot = rotate_crop(image)          # or from an image already in memory
+    """
+
+    def __init__(self, angle, crop, order=3, pad=8):
+        """
+        Params: angle (float): rotation angle in degrees, as in ndimage.rotate
+                crop (tuple of slices): the crop of the rotated image
+                order (int): spline order of the interpolation (3 as ndimage.rotate, 1 is faster)
+                pad (int): pixels added around the window, to make the spline prefilter independent of the window borders
+        """
+        self.angle = angle
+        self.crop = crop
+        self.order = order
+        self.pad = pad
+        self.shape = None
+
+    def prepare(self, shape):
+        """Compute the window and the coordinates for a frame of the given shape."""
+        rot_matrix, offset, out_plane_shape = rotation_geometry(self.angle, shape)
+        in_plane_shape = np.asarray(shape)
+
+        rows = range(*self.crop[0].indices(out_plane_shape[0]))
+        columns = range(*self.crop[1].indices(out_plane_shape[1]))
+        grid = np.stack(np.meshgrid(rows, columns, indexing='ij')).reshape(2, -1)
+        coordinates = rot_matrix @ grid + offset[:, None]
+
+        start = np.clip(np.floor(coordinates.min(axis=1)).astype(int) - self.pad, 0, in_plane_shape)
+        stop = np.clip(np.ceil(coordinates.max(axis=1)).astype(int) + self.pad + 1, 0, in_plane_shape)
+        self.window = (slice(start[0], stop[0]), slice(start[1], stop[1]))
+        self.coordinates = (coordinates - start[:, None]).reshape(2, len(rows), len(columns))
+        self.shape = tuple(shape)
+
+    def __call__(self, image, window_only=False):
+        """
+        Return the rotated crop of an image.
+        window_only: True if image is already the window self.window of the frame (as read by load)
+        """
+        if not window_only:
+            if self.shape != np.shape(image):
+                self.prepare(np.shape(image))
+            image = image[self.window]
+        from scipy import ndimage
+        return ndimage.map_coordinates(np.asarray(image, dtype=float), self.coordinates, order=self.order, mode='constant', cval=0.0)
+
+    def load(self, path):
+        """Read from a .fts file only the window needed for the crop and return the rotated crop."""
+        if self.shape is None:
+            self.prepare(get_image_shape(path))
+        return self(get_image_from_file(path, self.window), window_only=True)
+
+    @property
+    def window_shape(self):
+        return tuple(s.stop - s.start for s in self.window)
+
+    @property
+    def crop_shape(self):
+        return self.coordinates.shape[1:]
+
+    def matrix(self, threshold=1e-6):
+        """
+        Return the interpolation as a sparse matrix T, such that self(window, window_only=True).ravel() == T @ window.ravel().
+        The columns are obtained by interpolating the unit images of the window, weights smaller than threshold are dropped.
+        prepare() must have been called (or an image loaded).
+        """
+        from scipy import ndimage, sparse
+        window_shape = self.window_shape
+        unit = np.zeros(window_shape)
+        rows, columns, weights = [], [], []
+        for pixel in range(unit.size):
+            unit.flat[pixel] = 1
+            column = ndimage.map_coordinates(unit, self.coordinates, order=self.order, mode='constant', cval=0.0).ravel()
+            unit.flat[pixel] = 0
+            nonzero = np.flatnonzero(np.abs(column) > threshold)
+            rows.append(nonzero)
+            columns.append(np.full(len(nonzero), pixel))
+            weights.append(column[nonzero])
+        n_crop = int(np.prod(self.crop_shape))
+        return sparse.csr_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(columns))), shape=(n_crop, unit.size))
+
+
+def tweezer_rois(n_tweezers=2, lcrop=5, x0=20, y0=12, spacing=8, bkg_shift=None):
+    """
+    Return the rois of the tweezers and of their background, as dicts key -> [x0, y0, lcrop] (x is the column).
+    Tweezer i is at [x0+i*spacing, y0], its background bkg_shift pixels below (default 3*lcrop).
+    The defaults are the ones used for the two tweezers in the crop [177:217,162:217] of the rotated image.
+    """
+    bkg_shift = 3*lcrop if bkg_shift is None else bkg_shift
+    rois = {f'{i}': [x0+i*spacing, y0, lcrop] for i in range(n_tweezers)}
+    rois_bkg = {f'{i}': [x0+i*spacing, y0+bkg_shift, lcrop] for i in range(n_tweezers)}
+    return rois, rois_bkg
+
+
+def roi_weights(rois, shape):
+    """
+    Return the sparse matrix (n_rois x n_pixels) which sums the pixels of each roi of an image of the given shape
+    (flattened in row-major order). Rois partially outside the image are clipped, as numpy slicing does.
+    """
+    from scipy import sparse
+    rows, columns = [], []
+    for k, (x, y, lcrop) in enumerate(rois.values()):
+        grid = np.mgrid[y:min(y+lcrop, shape[0]), x:min(x+lcrop, shape[1])].reshape(2, -1)
+        columns.append(np.ravel_multi_index(grid, shape))
+        rows.append(np.full(grid.shape[1], k))
+    rows, columns = np.concatenate(rows), np.concatenate(columns)
+    return sparse.csr_matrix((np.ones(len(rows)), (rows, columns)), shape=(len(rois), int(np.prod(shape))))
+
+
+class Photometry:
+    """
+    Counts in the tweezer and background rois, computed as a single sparse matrix product.
+
+    The roi sums (signal and background) are compiled once in a sparse weight matrix. If a RotatedCrop is given,
+    the rotation interpolation is included in the matrix, so the counts are computed directly from the raw pixels
+    of the window, without building the rotated image.
+    A stack of frames (n_frames, rows, columns) is processed with one matrix-matrix product.
+
+    Usage:
+        rois, rois_bkg = tweezer_rois(n_tweezers=2, lcrop=5)
+        photometry = Photometry(rois, rois_bkg, RotatedCrop(-3, (slice(177, 217), slice(162, 217))))
+        norm_fluo, sum_fluo, sum_bkg = photometry.load(path)
+    """
+
+    def __init__(self, rois, rois_bkg, transform=None):
+        """
+        Params: rois, rois_bkg (dict): key -> [x0, y0, lcrop] of the tweezers and of their background (same keys)
+                transform (RotatedCrop): optional rotation and crop to apply to the frames. Without it, the images
+                                         passed are the ones on which the rois are defined.
+        """
+        self.rois = rois
+        self.rois_bkg = rois_bkg
+        self.transform = transform
+        self.weights = None
+        self.shape = None
+
+    def compile(self, shape):
+        """Build the weight matrix for frames of the given shape (the full frame if a transform is used)."""
+        from scipy import sparse
+        if self.transform is None:
+            self.weights = sparse.vstack([roi_weights(self.rois, shape), roi_weights(self.rois_bkg, shape)]).tocsr()
+        else:
+            self.transform.prepare(shape)
+            crop_shape = self.transform.crop_shape
+            roi_matrix = sparse.vstack([roi_weights(self.rois, crop_shape), roi_weights(self.rois_bkg, crop_shape)])
+            self.weights = (roi_matrix @ self.transform.matrix()).tocsr()
+        self.shape = tuple(shape)
+
+    def counts(self, pixels):
+        """pixels: (n_pixels,) or (n_pixels, n_frames), as returned by read -> norm_fluo, sum_fluo, sum_bkg"""
+        counts = self.weights @ pixels
+        n = len(self.rois)
+        sum_fluo, sum_bkg = counts[:n].T, counts[n:].T
+        return sum_fluo - sum_bkg, sum_fluo, sum_bkg
+
+    def __call__(self, images):
+        """
+        Return (norm_fluo, sum_fluo, sum_bkg) of an image (rows, columns), arrays of length n_tweezers,
+        or of a stack of images (n_frames, rows, columns), arrays of shape (n_frames, n_tweezers).
+        """
+        images = np.asarray(images, dtype=float)
+        shape = images.shape[-2:]
+        if self.shape != shape:
+            self.compile(shape)
+        if self.transform is not None:
+            images = images[(..., *self.transform.window)]
+        if images.ndim == 2:
+            return self.counts(images.ravel())
+        return self.counts(images.reshape(len(images), -1).T)
+
+    def read(self, path):
+        """Return the pixels of a .fts file which enter the counts (flattened), reading only the window of the transform."""
+        if self.transform is None:
+            image = get_image_from_file(path)
+            if self.shape != image.shape:
+                self.compile(image.shape)
+            return image.ravel()
+        if self.shape is None:
+            self.compile(get_image_shape(path))
+        return get_image_from_file(path, self.transform.window).ravel()
+
+    def load(self, path):
+        """Return (norm_fluo, sum_fluo, sum_bkg) of a .fts file, reading only the pixels needed."""
+        return self.counts(self.read(path))
+
+def plot_rois(image_rot, rois, rois_bkg, ax=None):
+    """
+    Show the rotated image with the tweezer rois (red) and background rois (black).
+
+    Params: image_rot (ndarray)
+            rois, rois_bkg (dict): key -> [x0, y0, lcrop]
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib import patches
+
+    lx, ly = np.shape(image_rot)
+    if ax is None:
+        ax = plt.figure().add_subplot(111)
+    for key, (x0, y0, lcrop) in rois.items():
+        ax.add_patch(patches.Rectangle((x0, y0), lcrop, lcrop, edgecolor='red', facecolor="none"))
+        ax.text(x0+2, y0+lcrop+4, key, color='k', fontsize=16)
+    for key, (x0, y0, lcrop) in rois_bkg.items():
+        ax.add_patch(patches.Rectangle((x0, y0), lcrop, lcrop, edgecolor='black', facecolor="none"))
+    ax_plt = ax.imshow(image_rot, extent=(0, ly, lx, 0))
+    im_ratio = image_rot.shape[0]/image_rot.shape[1]
+    plt.colorbar(ax_plt, fraction=0.047*im_ratio) #fix the colorbar
+    ax.set_axis_off()
+    plt.tight_layout()
+    return ax
@@ -0,0 +1,115 @@
+"""
+headless image watcher for the M-LOOP scans: the counts of every Andor image are appended to the run logs and the
+cost of every shot is written to exp_output.txt, as the handler of read_image_mloop does, without the plots.
+Only numpy and watchdog are imported at startup (astropy and scipy at the first image), so after a crash in the
+middle of a scan the watcher is back in a fraction of a second and the run logs continue where they stopped.
+
+Usage:
+    eqm-watch-images X:\\2024\\2024-12-18 --save-path fluo_2024_12_18 --polling 0.5
+version 1.0
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from .fits_arrival import FitsArrivalHandler, make_observer
+from .latency import recorder
+from .lattice_calibration import CALIBRATION_FILE, load_photometry
+from .run_log import RunLog, run_number
+
+PAIR = ('AndorAbs.fts', 'AndorAbs2.fts')
+
+
+class ImageWatcher(FitsArrivalHandler):
+    """
+    Usage:
+        watcher = ImageWatcher(save_path='fluo_2024_12_18')
+        observer = make_observer(polling=True)
+        observer.schedule(watcher, path=path_to_images, recursive=True)
+        observer.start()
+    """
+
+    def __init__(self, save_path=None, output='exp_output.txt', tweezer=1, n_tweezers=2, calibration=CALIBRATION_FILE, date=None,
+                 cost_suffix='AndorAbs2.fts', verbose=True):
+        """
+        Inputs:
+        save_path: the path of the run logs without suffix, <save_path>_1.runlog and _2.runlog (str, None for no logs)
+        output: the cost file read by M-LOOP (str, None for no cost)
+        tweezer: the index of the tweezer of the cost: cost = - raw counts (int)
+        n_tweezers: the number of tweezers if there is no calibration (int)
+        calibration, date: the lattice calibration file and the date of the entry, see lattice_calibration.load_photometry
+        cost_suffix: the images which give a cost (str)
+        verbose: print the counts of every image (bool)
+        """
+        super().__init__(patterns=[f'R*_{suffix}' for suffix in PAIR])
+        self.photometry = load_photometry(calibration, date, n_tweezers) # read once at startup
+        self.output = output
+        self.tweezer = tweezer
+        self.cost_suffix = cost_suffix
+        self.verbose = verbose
+        n_tweezers = len(self.photometry.rois)
+        self.logs = {}
+        if save_path is not None:
+            self.logs = {suffix: RunLog(f'{save_path}_{i+1}.runlog', n_tweezers) for i, suffix in enumerate(PAIR)}
+        self.costs_written = 0
+
+    def on_ready(self, path):
+        run = run_number(path)
+        with recorder.span('photometry', run=run):
+            norm_fluo, sum_fluo, sum_bkg = self.photometry.load(path)
+        if self.verbose:
+            print(f"{os.path.basename(path)}: net {norm_fluo.round(1).tolist()}, raw {sum_fluo.round(1).tolist()}, bkg {sum_bkg.round(1).tolist()}")
+        suffix = next((suffix for suffix in sorted(self.logs, key=len, reverse=True) if path.endswith(suffix)), None)
+        if suffix is not None:
+            with recorder.span('log', run=run):
+                self.logs[suffix].append(path[:-4], norm_fluo, sum_fluo, sum_bkg, file_time=os.path.getmtime(path))
+        if self.output is not None and path.endswith(self.cost_suffix):
+            with recorder.span('cost', run=run, index=self.costs_written), open(self.output, 'w') as file:
+                file.write(f"cost = - {sum_fluo[self.tweezer]}\n")
+            self.costs_written += 1
+
+
+def warm_up():
+    # astropy and scipy are imported after the start, in the background, so the first image does not wait for them
+    from astropy.io import fits
+    from scipy import ndimage, sparse, special
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the Andor images of a directory as they arrive and write the M-LOOP cost.")
+    parser.add_argument('directory', help="the directory of the images, watched recursively")
+    parser.add_argument('--save-path', default=None, help="the run logs, <save-path>_1.runlog and _2.runlog")
+    parser.add_argument('--output', default='exp_output.txt', help="the cost file of M-LOOP ('' for no cost)")
+    parser.add_argument('--tweezer', type=int, default=1, help="the tweezer of the cost")
+    parser.add_argument('--n-tweezers', type=int, default=2, help="number of tweezers without calibration")
+    parser.add_argument('--calibration', default=CALIBRATION_FILE, help="the lattice calibration file (see eqm-calibrate)")
+    parser.add_argument('--date', default=None, help="the date of the calibration entry, YYYY-MM-DD (default today)")
+    parser.add_argument('--polling', type=float, default=None, help="poll the directory every POLLING s, for network shares")
+    parser.add_argument('--latency', default=None, help="export the latency spans to this file on exit (.npz or text)")
+    parser.add_argument('--quiet', action='store_true', help="do not print the counts of every image")
+    args = parser.parse_args(argv)
+
+    watcher = ImageWatcher(args.save_path, args.output or None, args.tweezer, args.n_tweezers, args.calibration, args.date, verbose=not args.quiet)
+    observer = make_observer(polling=args.polling is not None, interval=args.polling or 1)
+    observer.schedule(watcher, path=args.directory, recursive=True)
+    observer.start()
+    threading.Thread(target=warm_up, daemon=True).start()
+    print(f"Watching {args.directory}, {len(watcher.photometry.rois)} tweezers (Ctrl-C to stop)")
+    try:
+        while observer.is_alive():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        for log in watcher.logs.values():
+            log.to_csv(log.path.replace('.runlog', '.csv'))
+        if args.latency:
+            recorder.export(args.latency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+per-shot latency spans of the feedback loop: optimizer, push of the parameters, image write, FITS read,
+photometry, logs, plots and cost.
+Every span is a (stage, run, index, start, stop) record in a fixed-size ring buffer, written without allocations,
+so the instrumentation can stay on during the scans. run is the number of the image (R00012 -> 12) and index
+the number of the pushed parameter set: the spans with both link the two, so all the stages of a shot
+can be put side by side (by_run).
+version 1.0
+"""
+
+import itertools
+import threading
+import time
+
+import numpy as np
+
+SPAN_DTYPE = np.dtype([('stage', np.int16), ('run', np.int64), ('index', np.int64), ('start', np.float64), ('stop', np.float64)])
+
+
+class _Span:
+    """Context manager of SpanRecorder.span."""
+    __slots__ = ('recorder', 'stage', 'run', 'index', 'start')
+
+    def __init__(self, recorder, stage, run, index):
+        self.recorder, self.stage, self.run, self.index = recorder, stage, run, index
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.stage, self.start, time.time(), self.run, self.index)
+
+
+class SpanRecorder:
+    """
+    Usage:
+        from eqm_opx.latency import recorder
+        with recorder.span('read', run=12):
+            image = fits.getdata(path)
+        recorder.record('push', start, run=-1, index=3)    # already measured span
+        recorder.print_summary()
+        recorder.export('latency.csv')
+
+    The times are time.time() (s), comparable between the processes of the photometry pool and the host.
+    run and index are -1 when unknown.
+    """
+
+    def __init__(self, size=2**16, enabled=True):
+        """
+        Inputs:
+        size: the number of spans kept, the oldest ones are overwritten (int)
+        enabled: False to make record a no-op
+        """
+        self.size = size
+        self.enabled = enabled
+        self.stages = [] # stage id -> name
+        self._ids = {}
+        self._buffer = np.zeros(size, dtype=SPAN_DTYPE)
+        self._counter = itertools.count() # next() is atomic in CPython: no lock on the hot path
+        self._written = 0
+        self._lock = threading.Lock() # only for the registration of new stages
+
+    def _stage_id(self, stage):
+        stage_id = self._ids.get(stage)
+        if stage_id is None:
+            with self._lock:
+                stage_id = self._ids.setdefault(stage, len(self.stages))
+                if stage_id == len(self.stages):
+                    self.stages.append(stage)
+        return stage_id
+
+    def record(self, stage, start, stop=None, run=-1, index=-1):
+        """Record a span of a stage (str) from start to stop (time.time(), default now)."""
+        if not self.enabled:
+            return
+        stop = time.time() if stop is None else stop
+        n = next(self._counter)
+        self._buffer[n % self.size] = (self._stage_id(stage), run, index, start, stop)
+        self._written = max(self._written, n+1)
+
+    def span(self, stage, run=-1, index=-1):
+        """Context manager which records the time spent in its block."""
+        return _Span(self, stage, run, index)
+
+    @classmethod
+    def load(cls, *paths, size=2**16):
+        """Return a recorder with the spans exported (.npz) by several processes, e.g. the image handler and the stream pusher."""
+        merged = cls(size)
+        for path in paths:
+            with np.load(path) as data:
+                stages = data['stages'].tolist()
+                for stage_id, run, index, start, stop in data['spans'].tolist():
+                    merged.record(stages[stage_id], start, stop, run, index)
+        return merged
+
+    def clear(self):
+        self._counter = itertools.count()
+        self._written = 0
+
+    def __len__(self):
+        return min(self._written, self.size)
+
+    def spans(self):
+        """Return the recorded spans (structured array, oldest first)."""
+        n = self._written
+        if n <= self.size:
+            return self._buffer[:n].copy()
+        return np.roll(self._buffer, -(n % self.size)).copy()
+
+    def summary(self):
+        """Return a dict stage -> {'count', 'p50', 'p95', 'max'} of the durations in ms."""
+        spans = self.spans()
+        durations = (spans['stop'] - spans['start'])*1e3
+        summary = {}
+        for stage_id, stage in enumerate(self.stages):
+            values = durations[spans['stage'] == stage_id]
+            if len(values):
+                p50, p95 = np.percentile(values, [50, 95])
+                summary[stage] = {'count': len(values), 'p50': p50, 'p95': p95, 'max': values.max()}
+        return summary
+
+    def print_summary(self):
+        print(f"{'stage':<14}{'count':>8}{'p50 [ms]':>12}{'p95 [ms]':>12}{'max [ms]':>12}")
+        for stage, values in self.summary().items():
+            print(f"{stage:<14}{values['count']:>8}{values['p50']:>12.2f}{values['p95']:>12.2f}{values['max']:>12.2f}")
+
+    def by_run(self):
+        """
+        Return the stages of every shot: dict run -> {stage: (start, stop)}, with the first start and the last stop
+        of the spans of the stage. The spans with only an index are assigned to the run linked to that index.
+        """
+        spans = self.spans()
+        linked = (spans['run'] >= 0) & (spans['index'] >= 0)
+        runs_of_index = dict(zip(spans['index'][linked].tolist(), spans['run'][linked].tolist()))
+        table = {}
+        for stage_id, run, index, start, stop in spans.tolist():
+            run = run if run >= 0 else runs_of_index.get(index, -1)
+            if run < 0:
+                continue
+            stages = table.setdefault(run, {})
+            stage = self.stages[stage_id]
+            first, last = stages.get(stage, (start, stop))
+            stages[stage] = (min(first, start), max(last, stop))
+        return table
+
+    def export(self, path):
+        """
+        Write the spans for plotting: .npz (structured array and stage names) or tab-separated text
+        (stage, run, index, start [s], duration [ms]).
+        """
+        spans = self.spans()
+        if path.endswith('.npz'):
+            np.savez(path, spans=spans, stages=np.array(self.stages))
+            return
+        with open(path, 'w') as file:
+            file.write("stage\trun\tindex\tstart\tduration_ms\n")
+            for stage_id, run, index, start, stop in spans.tolist():
+                file.write(f"{self.stages[stage_id]}\t{run}\t{index}\t{start:.6f}\t{(stop-start)*1e3:.3f}\n")
+
+
+recorder = SpanRecorder() # shared by the handlers of this process
@@ -0,0 +1,279 @@
+"""
+calibration of the tweezer array on the Andor images: rotation angle, spacing and origin of the lattice
+are fitted on the peaks of an averaged stack of frames, and give the crop of the rotated image, the tweezer rois
+and the background rois used by Photometry.
+The geometry is saved in a calibration file, one entry per date, which the live analysis loads once at startup
+(load_photometry) instead of the hand-tuned rotation, crop and rois.
+
+Usage:
+    eqm-calibrate X:\\2024\\2024-12-18 --last 200 --sites 2
+version 1.0
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import warnings
+
+import numpy as np
+
+from .image_utilities import Photometry, RotatedCrop, get_image_from_file, to_rotated, tweezer_rois
+
+CALIBRATION_FILE = 'lattice_calibration.json'
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def default_photometry(n_tweezers=2):
+    """The hand-tuned geometry of read_image_mloop: rotation of -3 deg, crop [177:217,162:217], rois of tweezer_rois."""
+    return Photometry(*tweezer_rois(n_tweezers, lcrop=5), RotatedCrop(-3, (slice(177, 217), slice(162, 217))))
+
+
+def average_frames(frames):
+    """Return the mean of a stack of frames: list of .fts paths or array (n_frames, rows, columns)."""
+    if isinstance(frames, np.ndarray):
+        return frames.mean(axis=0)
+    total = None
+    for path in frames:
+        image = get_image_from_file(path)
+        total = image if total is None else total + image
+    if total is None:
+        raise ValueError("No frame to average.")
+    return total/len(frames)
+
+
+def find_peaks(image, sigma=1.0, min_distance=3, threshold=None, max_peaks=None):
+    """
+    Find the spots of an image: local maxima of the smoothed image above a threshold, with a subpixel position
+    interpolated on the 3x3 pixels around each maximum.
+
+    Inputs:
+    image: the averaged frame (2D array)
+    sigma: the width in pixels of the gaussian smoothing (float)
+    min_distance: the minimum distance in pixels between two peaks (int)
+    threshold: the minimum height above the median of the smoothed image (default 8 robust standard deviations)
+    max_peaks: keep only the brightest max_peaks peaks (int)
+
+    Returns:
+    positions (N, 2): the (row, column) of the peaks, brightest first
+    heights (N,): their height above the median
+    """
+    from scipy import ndimage
+    smooth = ndimage.gaussian_filter(np.asarray(image, dtype=float), sigma)
+    smooth -= np.median(smooth)
+    if threshold is None:
+        threshold = 8*1.4826*np.median(np.abs(smooth)) # robust standard deviation of the background
+    maxima = (smooth == ndimage.maximum_filter(smooth, size=2*min_distance+1)) & (smooth > threshold)
+    maxima[[0, -1], :] = False # no centroid on the border
+    maxima[:, [0, -1]] = False
+    rows, columns = np.nonzero(maxima)
+    heights = smooth[rows, columns]
+    order = np.argsort(heights)[::-1][:max_peaks]
+    rows, columns, heights = rows[order], columns[order], heights[order]
+    # gaussian interpolation of the 3x3 neighbourhood of all the peaks at once: the vertex of the parabola through
+    # the log of the row and column profiles, exact for a gaussian spot (the centroid is biased towards the pixel)
+    offsets = np.arange(-1, 2)
+    patches = smooth[rows[:, None, None] + offsets[None, :, None], columns[:, None, None] + offsets[None, None, :]]
+    positions = np.stack([rows, columns], axis=1).astype(float)
+    for axis, profile in enumerate((patches.sum(axis=2), patches.sum(axis=1))):
+        low, center, high = np.log(np.clip(profile, 1e-3*heights[:, None], None)).T
+        curvature = low - 2*center + high
+        positions[:, axis] += np.clip(np.where(curvature < 0, (low - high)/(2*curvature), 0), -0.5, 0.5)
+    return positions, heights
+
+
+def fit_lattice(positions, shape):
+    """
+    Fit a rectangular lattice to the peak positions of a frame.
+
+    Inputs:
+    positions: the (row, column) of the peaks in the frame (N, 2)
+    shape: the shape of the frame
+
+    Returns:
+    a dict with
+    angle: the angle in degrees of ndimage.rotate which makes the rows of the lattice horizontal
+    spacing: the (row, column) spacing in pixels of the rotated image (row spacing 0 for a single row)
+    origin: the (row, column) of the site (0, 0) in the rotated image
+    sites: the (row, column) of every peak in the rotated image (N, 2), and indices: their (row, column) lattice indices
+    residual: the rms distance in pixels between the peaks and the fitted sites
+    """
+    from scipy import spatial
+    positions = np.asarray(positions, dtype=float)
+    if len(positions) < 2:
+        raise ValueError("At least two peaks are needed to fit the lattice.")
+    # direction to the nearest neighbour of every peak, folded in [-45, 45) deg (rows and columns are equivalent)
+    _, neighbours = spatial.cKDTree(positions).query(positions, k=2)
+    vectors = positions[neighbours[:, 1]] - positions
+    angles = np.degrees(np.arctan2(vectors[:, 0], vectors[:, 1]))
+    angles = (angles + 45) % 90 - 45
+    angle = float(np.median(angles))
+
+    sites = to_rotated(positions, angle, shape)
+    rotated_vectors = sites[neighbours[:, 1]] - sites
+    horizontal = np.abs(rotated_vectors[:, 1]) >= np.abs(rotated_vectors[:, 0])
+    spacing = np.zeros(2)
+    spacing[1] = np.median(np.abs(rotated_vectors[horizontal, 1]))
+    if (~horizontal).any():
+        spacing[0] = np.median(np.abs(rotated_vectors[~horizontal, 0]))
+    elif np.ptp(sites[:, 0]) > spacing[1]/2:
+        spacing[0] = np.median(np.abs(np.diff(np.sort(sites[:, 0]))[np.diff(np.sort(sites[:, 0])) > spacing[1]/2]))
+
+    # lattice indices and least squares refinement of origin and spacing along each axis
+    reference = sites[np.argmin(sites.sum(axis=1))]
+    indices = np.zeros(sites.shape, dtype=int)
+    origin = reference.copy()
+    for axis in range(2):
+        if spacing[axis] == 0:
+            origin[axis] = sites[:, axis].mean()
+            continue
+        indices[:, axis] = np.round((sites[:, axis] - reference[axis])/spacing[axis])
+        indices[:, axis] -= indices[:, axis].min()
+        if np.ptp(indices[:, axis]) > 0:
+            spacing[axis], origin[axis] = np.polyfit(indices[:, axis], sites[:, axis], 1)
+        else:
+            origin[axis] = sites[:, axis].mean()
+    fitted = origin + indices*spacing
+    residual = float(np.sqrt(np.mean(np.sum((fitted - sites)**2, axis=1))))
+    return {'angle': angle, 'spacing': spacing.tolist(), 'origin': origin.tolist(), 'sites': sites, 'indices': indices, 'residual': residual}
+
+
+def lattice_rois(lattice, lcrop=5, bkg_shift=None, margin=4):
+    """
+    Return the geometry for Photometry: crop of the rotated image and rois of the fitted sites (and of their background).
+    The background roi of a site is in its column, bkg_shift pixels below the last row of the lattice: on a 2D lattice
+    the rows are closer than bkg_shift, and a roi below its own site would fall on the tweezers of another row.
+
+    Inputs:
+    lattice: the result of fit_lattice
+    lcrop: the size of the rois in pixels (int)
+    bkg_shift: the shift in pixels of the background rois below the last row of tweezer rois (int, default 3*lcrop as tweezer_rois)
+    margin: pixels added around the rois in the crop (int)
+
+    Returns:
+    crop (tuple of slices), rois, rois_bkg (dicts key -> [x0, y0, lcrop], x is the column), keys sorted by row then column
+    """
+    bkg_shift = 3*lcrop if bkg_shift is None else bkg_shift
+    indices = np.unique(lattice['indices'], axis=0) # sorted by row, then column
+    centers = np.asarray(lattice['origin']) + indices*np.asarray(lattice['spacing'])
+    corners = np.round(centers - lcrop//2).astype(int) # top-left pixel of each roi in the rotated image
+    low = corners.min(axis=0) - margin
+    high = corners.max(axis=0) + lcrop + margin
+    high[0] += bkg_shift # room for the background rois below the last row
+    if low.min() < 0:
+        raise ValueError("The rois are too close to the border of the rotated image, reduce the margin.")
+    crop = (slice(int(low[0]), int(high[0])), slice(int(low[1]), int(high[1])))
+    rois = {f'{i}': [int(x - low[1]), int(y - low[0]), lcrop] for i, (y, x) in enumerate(corners)}
+    bottom = corners[:, 0].max() # the last row
+    rois_bkg = {f'{i}': [int(x - low[1]), int(bottom - low[0] + bkg_shift), lcrop] for i, (y, x) in enumerate(corners)}
+    overlapping = overlapping_rois(rois, rois_bkg)
+    if overlapping:
+        raise ValueError(f"The background rois of the sites {overlapping} overlap a tweezer roi, increase bkg_shift.")
+    return crop, rois, rois_bkg
+
+
+def overlapping_rois(rois, rois_bkg):
+    """Return the keys of the background rois which overlap any of the tweezer rois (rois as [x0, y0, lcrop])."""
+    tweezers = np.array(list(rois.values()))
+    overlapping = []
+    for key, (x, y, lcrop) in rois_bkg.items():
+        # two squares overlap if they overlap along both axes
+        if np.any((x < tweezers[:, 0] + tweezers[:, 2]) & (tweezers[:, 0] < x + lcrop) &
+                  (y < tweezers[:, 1] + tweezers[:, 2]) & (tweezers[:, 1] < y + lcrop)):
+            overlapping.append(key)
+    return overlapping
+
+
+def calibrate(frames, n_sites=None, lcrop=5, bkg_shift=None, sigma=1.0, min_distance=3, threshold=None):
+    """
+    Calibrate the tweezer array on a stack of frames.
+
+    Inputs:
+    frames: list of .fts paths or array (n_frames, rows, columns), e.g. the images of a loading scan
+    n_sites: the number of tweezers (int, default all the peaks found)
+    lcrop, bkg_shift: see lattice_rois
+    sigma, min_distance, threshold: see find_peaks
+
+    Returns:
+    the calibration entry (dict, json serializable): angle, crop, rois, rois_bkg, spacing, origin, residual, frame_shape
+    """
+    image = average_frames(frames)
+    positions, heights = find_peaks(image, sigma, min_distance, threshold, n_sites)
+    if n_sites is not None and len(positions) < n_sites:
+        raise ValueError(f"Only {len(positions)} peaks found for {n_sites} tweezers: lower the threshold or average more frames.")
+    lattice = fit_lattice(positions, image.shape)
+    if lattice['residual'] > 1:
+        warnings.warn(f"The peaks are {lattice['residual']:.2f} pixels away from a regular lattice on average.")
+    crop, rois, rois_bkg = lattice_rois(lattice, lcrop, bkg_shift)
+    return {'angle': lattice['angle'], 'crop': [[crop[0].start, crop[0].stop], [crop[1].start, crop[1].stop]],
+            'rois': rois, 'rois_bkg': rois_bkg, 'spacing': lattice['spacing'], 'origin': lattice['origin'],
+            'residual': lattice['residual'], 'frame_shape': list(image.shape), 'n_frames': len(frames),
+            'created': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def save_calibration(calibration, path=CALIBRATION_FILE, date=None):
+    """Store a calibration entry in the file under its date (default today), replacing the one of the same date."""
+    date = date or datetime.date.today().strftime(DATE_FORMAT)
+    entries = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            entries = json.load(file)
+    entries[date] = calibration
+    with open(path, 'w') as file:
+        json.dump(dict(sorted(entries.items())), file, indent=1)
+    return date
+
+
+def load_calibration(path=CALIBRATION_FILE, date=None):
+    """
+    Return the calibration of a date (default today) from the file: the entry of that date, or the latest before it.
+    Returns None if there is no such entry.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        entries = json.load(file)
+    date = date or datetime.date.today().strftime(DATE_FORMAT)
+    dates = [entry_date for entry_date in sorted(entries) if entry_date <= date]
+    return entries[dates[-1]] if dates else None
+
+
+def photometry_from_calibration(calibration):
+    """Return the Photometry of a calibration entry."""
+    crop = tuple(slice(*bounds) for bounds in calibration['crop'])
+    return Photometry(calibration['rois'], calibration['rois_bkg'], RotatedCrop(calibration['angle'], crop))
+
+
+def load_photometry(path=CALIBRATION_FILE, date=None, n_tweezers=2):
+    """
+    Return the Photometry of the calibration of a date (default today), see load_calibration,
+    or the hand-tuned default_photometry(n_tweezers) if the file has no entry for it.
+    """
+    calibration = load_calibration(path, date)
+    if calibration is None:
+        return default_photometry(n_tweezers)
+    return photometry_from_calibration(calibration)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the tweezer lattice on the averaged images of a directory and save the rois.")
+    parser.add_argument('directory', help="the directory of the images")
+    parser.add_argument('--pattern', default='R*_AndorAbs2.fts', help="the images to average")
+    parser.add_argument('--last', type=int, default=200, help="number of images to average (the most recent ones)")
+    parser.add_argument('--sites', type=int, default=None, help="number of tweezers (default all the peaks found)")
+    parser.add_argument('--lcrop', type=int, default=5, help="size of the rois in pixels")
+    parser.add_argument('--bkg-shift', type=int, default=None, help="shift of the background rois in pixels (default 3*lcrop)")
+    parser.add_argument('-o', '--output', default=CALIBRATION_FILE, help="the calibration file")
+    parser.add_argument('--date', default=None, help="the date of the entry, YYYY-MM-DD (default today)")
+    args = parser.parse_args(argv)
+
+    paths = sorted(glob.glob(os.path.join(args.directory, '**', args.pattern), recursive=True), key=os.path.getmtime)[-args.last:]
+    calibration = calibrate(paths, args.sites, args.lcrop, args.bkg_shift)
+    date = save_calibration(calibration, args.output, args.date)
+    print(f"{len(calibration['rois'])} tweezers, angle {calibration['angle']:.2f} deg, spacing {np.round(calibration['spacing'], 2).tolist()} px, "
+          f"residual {calibration['residual']:.2f} px, saved in {args.output} for {date}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+in-process interface between M-LOOP, the running OPX job and the image analysis.
+M-LOOP calls the interface directly: the parameters are pushed to the input streams of the job and the cost is
+taken from an in-memory queue filled by the image analysis, without exp_input.txt/exp_output.txt, fixed sleeps and eval.
+version 1.0
+"""
+
+import collections
+import queue
+import threading
+import time
+import warnings
+
+import numpy as np
+import mloop.interfaces as mli
+from .fits_arrival import FitsArrivalHandler
+from .lattice_calibration import load_photometry
+from .latency import recorder
+from .run_log import run_number
+
+
+class OptimizationStopped(Exception):
+    """Raised in the optimizer thread when the interface is stopped (e.g. on shutdown of the supervisor)."""
+
+
+class OPXInterface(mli.Interface):
+    """
+    Usage (see QuAM_optimiz_imaging_det_amp):
+        job = qm.execute(det_amp_optimization_streams)
+        interface = OPXInterface(job, [
+            ('cool_amp_imag_input_stream', lambda amplitude: float(amplitude/config_cool_amp_imag)),
+            ('repump_amp_imag_input_stream', lambda amplitude: float(amplitude/config_repump_amp_imag)),
+            ('cool_double_rf_input_stream', int),
+            ('repump_double_rf_input_stream', int)])
+        # the image analysis calls interface.report(cost) for each shot, e.g. with an ImageCostHandler
+        controller = run_optimization(interface, 'exp_config.txt')
+
+    The streams are given in the order of the M-LOOP parameters (param_names of the configuration).
+
+    Matching: every pushed set has an index. With index_stream, the index is pushed to that int input stream and
+    the program saves it with the shot, so the cost of the n-th image is matched to the index the OPX actually used
+    for the n-th shot (read back from the index_result stream), e.g.
+        input_index = declare_input_stream(int, name='param_index_input_stream')
+        index_stream = declare_stream()
+        ...
+        advance_input_stream(input_index)
+        save(input_index, index_stream)
+        ...
+        with stream_processing():
+            index_stream.save_all('param_index')
+    The costs of sets which are not awaited any more (e.g. images arriving after a timeout) are then dropped and
+    the next costs are still matched to the right parameters. The image of a cost is matched to its shot by the run
+    number of its name (R00012_AndorAbs2.fts is the shot 12 - first_run), so a lost image does not shift the next
+    ones; the indices saved by the program are fetched incrementally, only the new ones at each shot.
+    Without index_stream the costs are matched in push order, which is only right as long as no image is lost.
+
+    Prefetch: evaluate(list of parameter sets) pushes all the sets at once, so the OPX does not wait for the host
+    between their shots. The costs of a differential evolution generation can be measured with scipy:
+        differential_evolution(None, bounds, workers=interface.population_map, updating='deferred', popsize=...)
+    and average pushes the first min_shots shots of a set together. M-LOOP controllers ask one set at a time and
+    wait for its cost, so get_next_cost_dict has no prefetch without the averager.
+
+    Averaging: with averager (cost_averaging.ShotAverager) every set is measured on several shots, until the
+    standard error of the cost reaches the target or max_shots: M-LOOP gets the mean cost with its uncer, and bad
+    when too many shots were outliers. The costs must be reported with the counts of the tweezers and their
+    background, report(cost, counts=sum_fluo, bkg=sum_bkg), as ImageCostHandler and the Supervisor do.
+    """
+
+    def __init__(self, job, streams, timeout=60, index_stream=None, index_result='param_index', first_run=None, averager=None, **kwargs):
+        """
+        Inputs:
+        job: the running job, with the push_to_input_stream method (RunningQmJob)
+        streams: for each M-LOOP parameter, the (name of the input stream, conversion of the value to push) (list of tuples)
+        timeout: the maximum time in s to wait for the cost of a shot, after which the run is reported as bad (float)
+        index_stream: optional name of an int input stream which receives the index of each pushed set (str)
+        index_result: the name of the stream where the program saves the index of every shot (str), with index_stream
+        first_run: the run number of the image of the first shot of the job (int, default the run of the first
+                   image reported, which must then not be lost), with index_stream
+        averager: optional ShotAverager, to average several shots of each set (see average)
+        kwargs: keyword arguments of mloop.interfaces.Interface
+        """
+        super().__init__(**kwargs)
+        self.job = job
+        self.streams = streams
+        self.timeout = timeout
+        self.index_stream = index_stream
+        self.index_result = index_result
+        self.averager = averager
+        self.costs = queue.Queue()
+        self.pending = collections.deque() # indices pushed and not yet measured, in push order (without index_stream)
+        self.pushed = 0
+        self.reported = 0 # shots reported so far
+        self.first_run = first_run
+        self._indices = [] # the indices saved by the program, fetched so far
+        self._fetch_lock = threading.Lock()
+        self.stopped = False
+        self._returned = None # end of the last evaluate: the optimizer works until the next one
+        self._lock = threading.Lock()
+
+    def push(self, params):
+        """Push a set of parameters to the input streams of the job and return its index."""
+        if len(params) != len(self.streams):
+            raise ValueError(f"{len(params)} parameters for {len(self.streams)} input streams.")
+        with self._lock:
+            index = self.pushed
+            self.pushed += 1
+            if self.index_stream is None:
+                self.pending.append(index)
+        with recorder.span('push', index=index):
+            for (name, convert), value in zip(self.streams, params):
+                self.job.push_to_input_stream(name, convert(value))
+            if self.index_stream is not None:
+                self.job.push_to_input_stream(self.index_stream, index)
+        return index
+
+    def shot_index(self, shot):
+        """Wait for the index saved by the program with the given shot (counted from 0) and return it."""
+        with self._fetch_lock:
+            if shot >= len(self._indices): # fetch only the values saved since the last call
+                handle = self.job.result_handles.get(self.index_result)
+                handle.wait_for_values(shot + 1, timeout=self.timeout)
+                values = handle.fetch(slice(len(self._indices), handle.count_so_far()), flat_struct=True)
+                self._indices.extend(int(value) for value in np.ravel(values))
+            return self._indices[shot]
+
+    def shot_of(self, image):
+        """Return the shot of an image from its run number, None if the name has no run number."""
+        run = run_number(image) if image is not None else -1
+        if run < 0:
+            return None
+        with self._lock:
+            if self.first_run is None:
+                self.first_run = run
+        shot = run - self.first_run
+        if shot < 0:
+            raise ValueError(f"The run {run} of {image} is before the first run {self.first_run}.")
+        return shot
+
+    def report(self, cost, uncer=0, bad=False, **extra):
+        """
+        Called by the image analysis with the cost of each shot, in the order of the shots (thread-safe).
+        The cost is tagged with the index of its set, which is returned: the index saved by the program with the
+        shot of the image (with index_stream, extra['image'] is the path of the image, without it the shots are
+        counted), or else the oldest set not yet measured (None if nothing was pushed).
+        """
+        with self._lock:
+            shot = self.reported
+            self.reported += 1
+            if self.index_stream is None:
+                index = self.pending.popleft() if self.pending else None
+        if self.index_stream is not None:
+            try:
+                run_shot = self.shot_of(extra.get('image'))
+                shot = shot if run_shot is None else run_shot
+                index = self.shot_index(shot)
+            except Exception as error: # e.g. the index of the shot was not saved in time
+                warnings.warn(f"No index for the shot {shot}: {error}")
+                index = None
+        self.costs.put({'cost': cost, 'uncer': uncer, 'bad': bad, 'index': index, **extra})
+        return index
+
+    def stop(self):
+        """Stop the optimization: the optimizer waiting for a cost gets OptimizationStopped (M-LOOP then ends)."""
+        self.stopped = True
+        self.costs.put(None) # wakes up the waiting evaluate
+
+    def evaluate(self, params_list):
+        """
+        Measure the costs of a list of parameter sets, all pushed at once.
+        Returns the list of cost dicts in the order of params_list ({'bad': True} for the shots lost after a timeout).
+        The sets which timed out stay stale: their costs are dropped if they arrive later.
+        """
+        if self.stopped:
+            raise OptimizationStopped()
+        if self._returned is not None:
+            recorder.record('optimizer', self._returned, index=self.pushed)
+        order = [self.push(params) for params in params_list]
+        results = {}
+        while len(results) < len(order):
+            try:
+                cost = self.costs.get(timeout=self.timeout)
+            except queue.Empty:
+                warnings.warn(f"No cost received in {self.timeout} s, the missing runs are reported as bad.")
+                break
+            if cost is None:
+                raise OptimizationStopped()
+            if cost['index'] not in order or cost['index'] in results: # stale set, or run before the parameters were pushed
+                warnings.warn(f"Discarded the cost of the parameter set {cost['index']}.")
+                continue
+            results[cost['index']] = cost
+        self._returned = time.time()
+        return [results.get(index, {'bad': True, 'index': index}) for index in order]
+
+    def average(self, params):
+        """
+        Measure a set of parameters on several shots with the averager and return its cost dict (see ShotAverager.result).
+        The first min_shots shots are pushed together, then one at a time until the averager is done.
+        """
+        averager = self.averager
+        averager.reset()
+        while not averager.done:
+            shots = max(averager.min_shots - averager.shots, 1)
+            for cost in self.evaluate([params]*shots):
+                if cost.get('bad'):
+                    averager.add(None)
+                elif 'counts' not in cost:
+                    raise ValueError("The averager needs the counts of the tweezers: report(cost, counts=...).")
+                else:
+                    averager.add(cost['counts'], cost.get('bkg'))
+        return averager.result()
+
+    def population_map(self, function, population):
+        """
+        Map-like callable for the workers argument of scipy.optimize.differential_evolution: measures the costs of
+        a whole generation at once (function is not used), or set by set with the averager. Bad runs have an infinite cost.
+        """
+        if self.averager is not None:
+            costs = [self.average(params) for params in population]
+        else:
+            costs = self.evaluate(list(population))
+        return [np.inf if cost.get('bad') else cost['cost'] for cost in costs]
+
+    def get_next_cost_dict(self, params_dict):
+        """Push the parameters and wait for the cost of the shot, or of the shots with the averager (called by M-LOOP)."""
+        if self.averager is not None:
+            return self.average(params_dict['params'])
+        return self.evaluate([params_dict['params']])[0]
+
+
+class ImageCostHandler(FitsArrivalHandler):
+    """
+    Watchdog handler which computes the cost of each shot from the second image (R*_AndorAbs2.fts), once completely written,
+    and reports it to an OPXInterface: cost = - counts of a tweezer, as written in exp_output.txt by read_image_mloop.
+
+        observer = Observer()
+        observer.schedule(ImageCostHandler(interface), path=path_to_images, recursive=True)
+        observer.start()
+    """
+
+    def __init__(self, interface, patterns=('R*_AndorAbs2.fts',), tweezer=1, photometry=None):
+        """
+        Inputs:
+        interface: the OPXInterface (or any object with a report(cost) method)
+        patterns: the images which give a cost (list of str)
+        tweezer: the index of the tweezer whose raw counts are maximized (int)
+        photometry: the Photometry of the images (default: the calibration of today, see lattice_calibration.load_photometry)
+        """
+        super().__init__(patterns=patterns)
+        self.interface = interface
+        self.tweezer = tweezer
+        if photometry is None:
+            photometry = load_photometry() # read once at startup
+        self.photometry = photometry
+
+    def on_ready(self, path):
+        run = run_number(path)
+        with recorder.span('photometry', run=run):
+            norm_fluo, sum_fluo, sum_bkg = self.photometry.load(path)
+        start = time.time()
+        index = self.interface.report(-sum_fluo[self.tweezer], image=path, counts=sum_fluo.tolist(), bkg=sum_bkg.tolist())
+        recorder.record('report', start, run=run, index=-1 if index is None else index)
+
+
+def run_optimization(interface, config_file='exp_config.txt', **options):
+    """
+    Run M-LOOP in this process with the options of an M-LOOP configuration file (as used by the m-loop command).
+    options override the ones of the file. Returns the controller when the optimization is over.
+    """
+    import mloop.controllers as mlc
+    import mloop.utilities as mlu
+    config = mlu.get_dict_from_file(config_file, 'txt')
+    config.pop('interface_type', None) # the interface is this object, not the file interface
+    config.update(options)
+    controller = mlc.create_controller(interface, **config)
+    controller.optimize()
+    return controller
@@ -0,0 +1,185 @@
+"""
+append-only binary log of the fluorescence counts measured on each image.
+Every run is a fixed-width record appended at the end of the file, so writing a run and reading the
+new runs cost the same after 10 or after 50000 runs. The file is read back with a memory map and
+can be exported to the tab-separated csv written by the image handler.
+version 1.0
+"""
+
+import csv
+import datetime
+import json
+import os
+import re
+import time
+import warnings
+
+import numpy as np
+
+MAGIC = b'RUNLOG1\n'
+HEADER_SIZE = 256 # bytes: MAGIC + json description of the records, padded with spaces
+NAME_LENGTH = 128 # characters kept of the run name
+CSV_TIME_FORMAT = "%d_%m_%H:%M:%S"
+RUN_PATTERN = re.compile(r'R(\d+)_')
+
+
+def record_dtype(n_tweezers):
+    """
+    The fixed-width record of a run:
+    run: the run number parsed from the file name (R<run>_AndorAbs.fts, -1 if not found)
+    name: the file name without extension
+    time: the time the image was processed, file_time: the modification time of the image (unix time, s)
+    net, raw, bkg: the net (raw - bkg), raw and background counts of each tweezer
+    """
+    return np.dtype([('run', '<i8'), ('name', f'S{NAME_LENGTH}'), ('time', '<f8'), ('file_time', '<f8'),
+                     ('net', '<f8', (n_tweezers,)), ('raw', '<f8', (n_tweezers,)), ('bkg', '<f8', (n_tweezers,))])
+
+
+def run_number(name):
+    """Return the run number of an image name such as R00012_AndorAbs, -1 if not found."""
+    match = RUN_PATTERN.search(os.path.basename(name))
+    return int(match.group(1)) if match else -1
+
+
+class RunLog:
+    """
+    Usage:
+        log = RunLog(save_path+'_1.runlog', n_tweezers=2)
+        log.append(event_name, norm_fluo, sum_fluo, sum_bkg)
+        records = log.read()             # structured array, records['net'][:, 0] are the counts of tweezer 0
+        log.to_csv(save_path+'_1.csv')   # same columns as the csv of the image handler
+
+    The file can be reopened to continue a scan: the records are appended after the existing ones.
+    """
+
+    def __init__(self, path, n_tweezers=2):
+        """
+        Inputs:
+        path (str): the file of the log, created if it does not exist
+        n_tweezers (int): the number of tweezers of each record (must match the existing file)
+        """
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as file:
+                header = file.read(HEADER_SIZE)
+            if not header.startswith(MAGIC):
+                raise ValueError(f"{path} is not a run log.")
+            description = json.loads(header[len(MAGIC):].decode())
+            if description['n_tweezers'] != n_tweezers:
+                raise ValueError(f"{path} has {description['n_tweezers']} tweezers, not {n_tweezers}.")
+            self.n_tweezers = n_tweezers
+            self.dtype = record_dtype(n_tweezers)
+            partial = (os.path.getsize(path) - HEADER_SIZE) % self.dtype.itemsize
+            if partial: # the last write was interrupted: drop the incomplete record
+                warnings.warn(f"Removing an incomplete record of {partial} bytes at the end of {path}.")
+                os.truncate(path, os.path.getsize(path) - partial)
+        else:
+            self.n_tweezers = n_tweezers
+            self.dtype = record_dtype(n_tweezers)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            description = json.dumps({'n_tweezers': n_tweezers, 'name_length': NAME_LENGTH, 'itemsize': self.dtype.itemsize}).encode()
+            with open(path, 'wb') as file:
+                file.write((MAGIC + description).ljust(HEADER_SIZE, b' '))
+
+    def __len__(self):
+        return (os.path.getsize(self.path) - HEADER_SIZE) // self.dtype.itemsize
+
+    def append(self, name, net, raw, bkg, timestamp=None, file_time=None):
+        """
+        Append the record of a run.
+
+        Inputs:
+        name (str): the image name, e.g. the path without .fts (truncated to NAME_LENGTH characters)
+        net, raw, bkg (arrays of length n_tweezers): the counts
+        timestamp (float): unix time of the processing (default now)
+        file_time (float): unix time of the image (default nan)
+        """
+        record = np.zeros(1, dtype=self.dtype)
+        record['run'] = run_number(name)
+        record['name'] = os.fsencode(name)[-NAME_LENGTH:]
+        record['time'] = time.time() if timestamp is None else timestamp
+        record['file_time'] = np.nan if file_time is None else file_time
+        record['net'], record['raw'], record['bkg'] = net, raw, bkg
+        with open(self.path, 'ab') as file:
+            file.write(record.tobytes())
+
+    def read(self, start=0, stop=None):
+        """Return the records [start:stop] as a structured array (a copy: the file stays free for appending)."""
+        n = len(self)
+        start, stop, _ = slice(start, stop).indices(n)
+        if stop <= start:
+            return np.zeros(0, dtype=self.dtype)
+        records = np.memmap(self.path, dtype=self.dtype, mode='r', offset=HEADER_SIZE + start*self.dtype.itemsize, shape=(stop - start,))
+        data = np.array(records)
+        del records
+        return data
+
+    def to_csv(self, path, start=0):
+        """
+        Export the records to a tab-separated csv with the columns of the image handler:
+        name, time, net counts, raw counts, background counts (one column per tweezer each).
+        """
+        records = self.read(start)
+        with open(path, mode='w', newline='') as file:
+            writer = csv.writer(file, delimiter='\t')
+            for record in records:
+                event_time = datetime.datetime.fromtimestamp(record['time']).strftime(CSV_TIME_FORMAT)
+                writer.writerow([os.fsdecode(record['name']), event_time, *record['net'], *record['raw'], *record['bkg']])
+
+
+class LivePlot:
+    """
+    Plot of the raw counts of each tweezer and of the background of tweezer 0 against the run index
+    (as plot_fluo of read_image_mloop), updated with the new records only.
+    The last window runs are plotted point by point and the runs before them decimated to at most window points,
+    so an update costs the same after 1000 or 100000 runs while the whole scan stays visible.
+
+    The figure is not registered with pyplot, so plt.show() does not close it. In a notebook:
+        live = LivePlot(log)
+        display(live.update())
+    """
+
+    def __init__(self, log, window=2000, history=True, bkg=True, figsize=(10, 6)):
+        """
+        Inputs:
+        log (RunLog)
+        window (int): the number of last runs plotted point by point (None for all; the drawing time then grows with the runs)
+        history (bool): plot the runs before the window, decimated to at most window points (False to plot only the window)
+        bkg (bool): plot the background of tweezer 0
+        """
+        from matplotlib.figure import Figure
+        self.log = log
+        self.window = window
+        self.history = history
+        self.figure = Figure(figsize=figsize)
+        self.ax = self.figure.add_subplot(111)
+        self.lines = [self.ax.plot([], [], linestyle='-', label=f'tweezer {i}')[0] for i in range(log.n_tweezers)]
+        self.bkg_line = self.ax.plot([], [], linestyle='-', label='background', color='grey')[0] if bkg else None
+        self.ax.set_xlabel('Run index')
+        self.ax.set_ylabel('Fluo counts')
+        self.ax.legend()
+        self.count = 0
+        self._values = np.zeros((1024, log.n_tweezers + 1)) # raw counts and background of tweezer 0, grown by doubling
+
+    def update(self):
+        """Read the records appended since the last update, update the lines and return the figure."""
+        new = self.log.read(self.count)
+        if len(new):
+            if self.count + len(new) > len(self._values):
+                values = np.zeros((2*(self.count + len(new)), self._values.shape[1]))
+                values[:self.count] = self._values[:self.count]
+                self._values = values
+            self._values[self.count:self.count+len(new), :-1] = new['raw']
+            self._values[self.count:self.count+len(new), -1] = new['bkg'][:, 0]
+            self.count += len(new)
+            start = 0 if self.window is None else max(0, self.count - self.window)
+            index = np.arange(start, self.count)
+            if self.history and start > 0:
+                index = np.concatenate([np.arange(0, start, -(-start//self.window)), index]) # every stride-th old run
+            for i, line in enumerate(self.lines):
+                line.set_data(index, self._values[index, i])
+            if self.bkg_line is not None:
+                self.bkg_line.set_data(index, self._values[index, -1])
+            self.ax.relim()
+            self.ax.autoscale_view()
+        return self.figure
@@ -0,0 +1,185 @@
+"""
+headless stream pusher for the M-LOOP scans: every parameter set written by M-LOOP in exp_input.txt is pushed to
+the input streams of the running OPX job, as the InputEventHandler of the optimization notebooks does.
+The watcher starts at once (only numpy and watchdog are imported) and the connection to the job is made in the
+background, so after a crash the pusher is back in a fraction of a second and the first push waits for the job.
+A parameter file left by M-LOOP while the pusher was down is pushed at startup.
+
+Usage:
+    eqm-push-streams . --host 192.168.88.249 --stream imag_rc_delay_input_stream:clock:5000
+version 1.0
+"""
+
+import argparse
+import ast
+import os
+import threading
+import time
+
+import numpy as np
+from watchdog.events import PatternMatchingEventHandler
+from watchdog.observers import Observer
+
+from .latency import recorder
+
+CONVERTERS = {'int': lambda x: int(round(x)), 'float': float, 'clock': lambda x: int(round(x/4))*4} # clock: multiple of 4 ns
+
+
+def read_parameters(path, timeout=2, poll_interval=0.01):
+    """
+    Read the parameters of an M-LOOP input file such as "params=array([5.e-01, 1.e+05])", without eval.
+    The file is read again until it is complete (M-LOOP may still be writing it).
+
+    Returns:
+    parameters (np.ndarray)
+    """
+    stop = time.time() + timeout
+    while True:
+        with open(path, 'r') as file:
+            line = file.readline().strip()
+        value = line.split('=', 1)[-1].strip()
+        if value.startswith('array(') and value.endswith(')'):
+            value = value[len('array('):-1]
+        try:
+            return np.array(ast.literal_eval(value), dtype=float).ravel()
+        except (ValueError, SyntaxError):
+            if time.time() > stop:
+                raise ValueError(f"cannot read the parameters of {path}: {line!r}")
+            time.sleep(poll_interval)
+
+
+def parse_stream(spec):
+    """
+    Parse a stream given as NAME[:TYPE[:SCALE]]: TYPE is int, float or clock (rounded to a multiple of 4 ns) and
+    the parameter is multiplied by SCALE before the conversion, e.g. imag_rc_delay_input_stream:clock:5000 pushes
+    a fraction of a 5 us period in ns. clock does not enforce the 16 ns minimum of a pulse: stroboscopic plays a
+    nonzero delay below it as 16 ns.
+
+    Returns:
+    name, converter, scale
+    """
+    parts = spec.split(':')
+    name = parts[0]
+    kind = parts[1] if len(parts) > 1 else 'float'
+    scale = parts[2] if len(parts) > 2 else 1
+    if kind not in CONVERTERS:
+        raise ValueError(f"unknown stream type {kind!r}, use one of {list(CONVERTERS)}")
+    return name, CONVERTERS[kind], float(scale)
+
+
+def connect(host, port=None, qm_id=None, poll_interval=1):
+    """
+    Wait for a running job on the OPX and return it: the job of qm_id, or of the last open quantum machine.
+    qm is imported here, so the pusher starts without the cost of importing QUA.
+    """
+    from qm import QuantumMachinesManager
+    qmm = QuantumMachinesManager(host=host, port=port)
+    while True:
+        ids = [qm_id] if qm_id is not None else qmm.list_open_qms()
+        if ids:
+            job = qmm.get_qm(ids[-1]).get_running_job()
+            if job is not None:
+                return job
+        time.sleep(poll_interval)
+
+
+class StreamPusher(PatternMatchingEventHandler):
+    """
+    Usage:
+        pusher = StreamPusher([('imag_rc_delay_input_stream', CONVERTERS['clock'], 5000)], job=job)
+        observer = Observer()
+        observer.schedule(pusher, path='.', recursive=False)
+        observer.start()
+    """
+
+    def __init__(self, streams, job=None, patterns=('exp_input.txt',), remove=True, verbose=True):
+        """
+        Inputs:
+        streams: one (name, converter, scale) per parameter, in the order of M-LOOP (see parse_stream)
+        job: the running job, or None to set it later with set_job (the pushes wait for it)
+        patterns: the input files of M-LOOP (list of str)
+        remove: remove the input file after reading it, as M-LOOP expects (bool)
+        verbose: print the pushed values (bool)
+        """
+        super().__init__(patterns=list(patterns), ignore_directories=True, case_sensitive=False)
+        self.streams = streams
+        self.remove = remove
+        self.verbose = verbose
+        self.job = job
+        self._ready = threading.Event()
+        if job is not None:
+            self._ready.set()
+        self._lock = threading.Lock()
+        self.pushed = 0 # index of the next parameter set, see latency
+
+    def set_job(self, job):
+        self.job = job
+        self._ready.set()
+
+    def on_created(self, event):
+        self.push_file(event.src_path)
+
+    def on_moved(self, event):
+        self.push_file(event.dest_path)
+
+    def push_file(self, path):
+        with self._lock: # one parameter set at a time, in the order of the files
+            if not os.path.exists(path):
+                return
+            start = time.time()
+            parameters = read_parameters(path)
+            if self.remove:
+                os.remove(path)
+            recorder.record('input', start, index=self.pushed)
+            if len(parameters) != len(self.streams):
+                raise ValueError(f"{len(parameters)} parameters for {len(self.streams)} streams")
+            values = [convert(value*scale) for value, (_, convert, scale) in zip(parameters, self.streams)]
+            self._ready.wait()
+            with recorder.span('push', index=self.pushed):
+                for (name, _, _), value in zip(self.streams, values):
+                    self.job.push_to_input_stream(name, value)
+            if self.verbose:
+                print(f"{self.pushed}: " + ", ".join(f"{name} = {value}" for (name, _, _), value in zip(self.streams, values)))
+            self.pushed += 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Push the parameters written by M-LOOP to the input streams of the running OPX job.")
+    parser.add_argument('directory', nargs='?', default='.', help="the directory of exp_input.txt")
+    parser.add_argument('--host', required=True, help="the address of the OPX")
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--qm-id', default=None, help="the quantum machine of the job (default the last open one)")
+    parser.add_argument('--stream', action='append', required=True, metavar='NAME[:TYPE[:SCALE]]',
+                        help="one input stream per parameter, in order; TYPE is int, float or clock (default float)")
+    parser.add_argument('--input', default='exp_input.txt', help="the name of the input file of M-LOOP")
+    parser.add_argument('--latency', default=None, help="export the latency spans to this file on exit (.npz or text)")
+    parser.add_argument('--quiet', action='store_true', help="do not print the pushed values")
+    args = parser.parse_args(argv)
+
+    pusher = StreamPusher([parse_stream(spec) for spec in args.stream], patterns=[args.input], verbose=not args.quiet)
+    observer = Observer()
+    observer.schedule(pusher, path=args.directory, recursive=False)
+    observer.start()
+    print(f"Watching {os.path.join(args.directory, args.input)} (Ctrl-C to stop)")
+
+    def attach():
+        pusher.set_job(connect(args.host, args.port, args.qm_id))
+        print(f"Connected to the running job on {args.host}")
+    threading.Thread(target=attach, daemon=True).start()
+
+    # a parameter set written while the pusher was down
+    threading.Thread(target=pusher.push_file, args=(os.path.join(args.directory, args.input),), daemon=True).start()
+    try:
+        while observer.is_alive():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        if args.latency:
+            recorder.export(args.latency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+single asyncio runtime for the live optimization loop: FITS watcher, photometry, cost reporter and the optimizer
+which pushes the parameters to the input streams, linked by bounded queues.
+The photometry runs in a process pool, the results are reported in the order the images arrived.
+On Ctrl-C (cancellation) or at the end of the optimization everything is stopped, the job halted and the qm closed.
+version 1.0
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import time
+import warnings
+
+from .fits_arrival import FitsArrivalHandler, make_observer
+from .lattice_calibration import load_photometry
+from .latency import recorder
+from .run_log import run_number
+
+_photometry = None # the Photometry of a worker process, see _init_worker
+
+
+def _init_worker(photometry):
+    global _photometry
+    _photometry = photometry
+
+
+def _measure(path):
+    """
+    Photometry of an image in a worker process.
+    Returns (norm_fluo, sum_fluo, sum_bkg) and the times (start, end of the read, end) for the latency spans.
+    """
+    start = time.time()
+    pixels = _photometry.read(path)
+    read = time.time()
+    return _photometry.counts(pixels), (start, read, time.time())
+
+
+class _FileHandler(FitsArrivalHandler):
+    """Pass the completed images to the supervisor queue; blocks the dispatcher thread while the queue is full (backpressure)."""
+
+    def __init__(self, supervisor, patterns):
+        super().__init__(patterns=patterns)
+        self.supervisor = supervisor
+
+    def on_ready(self, path):
+        self.supervisor.submit(path)
+
+
+class Supervisor:
+    """
+    Usage (in a notebook, after job = qm.execute(...)):
+        interface = OPXInterface(job, streams)
+        supervisor = Supervisor(qm, job, interface, path_to_images, logs={'AndorAbs.fts': RunLog(...), 'AndorAbs2.fts': RunLog(...)})
+        await supervisor.run(lambda: run_optimization(interface, 'exp_config.txt'))
+    or supervisor.run_forever(optimize) in a script (asyncio.run, Ctrl-C stops it cleanly).
+
+    Tasks:
+    watcher: the watchdog observer puts the new images (each path once, when completely written) in the files queue
+    photometry: submits the images to the worker pool, the pending results go in the results queue
+    reporter: awaits the results in arrival order, appends them to the run logs and reports the cost to the interface,
+              both in a thread (one result at a time, in order), so that a slow disk or a report waiting for the
+              shot index does not block the loop and the watcher
+    optimizer: runs optimize() in a thread; the interface pushes the parameters to the input streams
+    The queues are bounded (queue_size): when the analysis is late, the watcher waits instead of piling up work.
+    The stages of every shot are recorded in latency.recorder (recorder.print_summary() after the run).
+    """
+
+    def __init__(self, qm, job, interface, path_to_watch, patterns=('R*_AndorAbs.fts', 'R*_AndorAbs2.fts'), photometry=None,
+                 cost_suffix='AndorAbs2.fts', tweezer=1, logs=None, workers=2, queue_size=8, polling=None):
+        """
+        Inputs:
+        qm, job: the QuantumMachine and the running job, closed and halted on shutdown (None to skip)
+        interface: the OPXInterface which receives the costs (object with report(cost, **extra) and stop())
+        path_to_watch: the directory of the images (str)
+        patterns: the images to analyse (list of str)
+        photometry: the Photometry of the images (default: the calibration of today, see lattice_calibration.load_photometry)
+        cost_suffix: the images which give a cost: cost = - raw counts of the tweezer (str)
+        tweezer: the index of the tweezer of the cost (int)
+        logs: optional dict image suffix -> RunLog, where the counts of each image are appended
+        workers: the number of processes for the photometry (int, 0 to run it in a thread of this process)
+        queue_size: the size of the bounded queues (int)
+        polling: interval in s to poll the directory instead of waiting for file system events, for network shares (float, None for the events)
+        """
+        self.qm = qm
+        self.job = job
+        self.interface = interface
+        self.path_to_watch = path_to_watch
+        self.patterns = list(patterns)
+        if photometry is None:
+            photometry = load_photometry() # read once at startup
+        self.photometry = photometry
+        self.cost_suffix = cost_suffix
+        self.tweezer = tweezer
+        self.logs = logs or {}
+        self.workers = workers
+        self.queue_size = queue_size
+        self.polling = polling
+        self.processed = 0
+        self.loop = None
+
+    def submit(self, path):
+        """Called from the dispatcher thread of the handler: put a new image in the files queue, waiting while the queue is full."""
+        try:
+            asyncio.run_coroutine_threadsafe(self.files.put(path), self.loop).result()
+        except (RuntimeError, concurrent.futures.CancelledError): # the supervisor is shutting down
+            pass
+
+    def _log(self, suffix, path, norm_fluo, sum_fluo, sum_bkg):
+        self.logs[suffix].append(path[:-4], norm_fluo, sum_fluo, sum_bkg, file_time=os.path.getmtime(path))
+
+    # --- tasks ---
+    async def _photometry(self, executor):
+        while True:
+            path = await self.files.get()
+            future = self.loop.run_in_executor(executor, _measure, path)
+            await self.results.put((path, future)) # waits when queue_size images are already in flight
+
+    async def _reporter(self):
+        while True:
+            path, future = await self.results.get()
+            run = run_number(path)
+            try:
+                (norm_fluo, sum_fluo, sum_bkg), (start, read, stop) = await future
+            except Exception as error: # a broken image must not stop the loop
+                warnings.warn(f"Analysis of {path} failed: {error!r}")
+                if path.endswith(self.cost_suffix):
+                    await asyncio.to_thread(self.interface.report, 0, bad=True, image=path)
+                continue
+            recorder.record('read', start, read, run=run)
+            recorder.record('photometry', read, stop, run=run)
+            suffix = next((suffix for suffix in self.logs if path.endswith(suffix)), None)
+            if suffix is not None:
+                with recorder.span('log', run=run):
+                    await asyncio.to_thread(self._log, suffix, path, norm_fluo, sum_fluo, sum_bkg)
+            if path.endswith(self.cost_suffix):
+                start = time.time()
+                # report can wait up to interface.timeout for the shot index: in a thread, the loop keeps running
+                index = await asyncio.to_thread(self.interface.report, -sum_fluo[self.tweezer], image=path,
+                                                counts=sum_fluo.tolist(), bkg=sum_bkg.tolist())
+                recorder.record('report', start, run=run, index=-1 if index is None else index)
+            self.processed += 1
+
+    async def run(self, optimize):
+        """
+        Run the loop until optimize() returns (in a thread) or the task is cancelled (Ctrl-C).
+        Returns the value of optimize().
+        """
+        self.loop = asyncio.get_running_loop()
+        self.files = asyncio.Queue(self.queue_size)
+        self.results = asyncio.Queue(self.queue_size)
+        if self.workers:
+            executor = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.photometry,))
+        else:
+            _init_worker(self.photometry)
+            executor = concurrent.futures.ThreadPoolExecutor(1)
+        observer = make_observer(self.polling is not None, self.polling)
+        observer.schedule(_FileHandler(self, self.patterns), path=self.path_to_watch, recursive=True)
+        observer.start()
+        tasks = [asyncio.create_task(self._photometry(executor), name='photometry'),
+                 asyncio.create_task(self._reporter(), name='reporter')]
+        optimizer = asyncio.create_task(asyncio.to_thread(optimize), name='optimizer')
+        try:
+            done, _ = await asyncio.wait([optimizer, *tasks], return_when=asyncio.FIRST_COMPLETED)
+            return await done.pop() # the result of optimize, or the exception of a failed task
+        finally:
+            self.interface.stop() # the optimizer thread ends at its next cost request
+            observer.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self.job is not None:
+                self.job.halt()
+            if self.qm is not None:
+                self.qm.close()
+            await asyncio.to_thread(observer.join)
+            await asyncio.gather(optimizer, return_exceptions=True)
+
+    def run_forever(self, optimize):
+        """Blocking version of run for scripts: asyncio.run, Ctrl-C shuts down cleanly."""
+        try:
+            return asyncio.run(self.run(optimize))
+        except KeyboardInterrupt:
+            print("Stopped.")
@@ -0,0 +1,69 @@
+import csv
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from eqm_opx.batch_reprocess import Reprocessor, find_runs
+from eqm_opx.image_utilities import Photometry, tweezer_rois
+
+PARAMETERS = {'rois': 'default'}
+
+
+def write_runs(directory, runs, suffixes=('AndorAbs', 'AndorAbs2')):
+    os.makedirs(directory, exist_ok=True)
+    for run in runs:
+        for suffix in suffixes:
+            image = np.full((40, 55), 100, dtype=np.uint16)
+            image[12:17, 20:25] += run + (suffix == 'AndorAbs2') # the roi of the tweezer 0
+            fits.PrimaryHDU(image).writeto(os.path.join(directory, f'R{run:05d}_{suffix}.fts'))
+
+
+def read_table(path):
+    with open(path, newline='') as file:
+        return list(csv.DictReader(file, delimiter='\t'))
+
+
+def reprocessor(output, parameters=PARAMETERS):
+    return Reprocessor(Photometry(*tweezer_rois()), str(output), parameters, workers=2, chunk_size=2)
+
+
+def test_find_runs_pairs_the_images_by_run(tmp_path):
+    write_runs(tmp_path/'scan', [10, 2])
+    write_runs(tmp_path/'scan', [11], suffixes=('AndorAbs2',))
+    assert [(name, first is not None, second is not None) for name, first, second in find_runs(str(tmp_path))] == \
+        [('scan/R00002', True, True), ('scan/R00010', True, True), ('scan/R00011', False, True)]
+
+
+def test_table_has_the_counts_of_every_run(tmp_path):
+    write_runs(tmp_path/'images', range(5))
+    write_runs(tmp_path/'images', [5], suffixes=('AndorAbs2',))
+    output = tmp_path/'fluo.csv'
+    with pytest.warns(UserWarning, match='1 runs have only one image'):
+        assert reprocessor(output).run(str(tmp_path/'images'), progress=False) == 6
+    rows = read_table(output)
+    assert [int(row['run']) for row in rows] == list(range(6))
+    for row in rows[:5]:
+        run = int(row['run'])
+        assert (float(row['net0_1']), float(row['net0_2']), float(row['raw1_2'])) == (25*run, 25*(run + 1), 2500)
+    assert np.isnan(float(rows[5]['net0_1'])) and float(rows[5]['net0_2']) == 25*6
+
+
+def test_interrupted_table_is_resumed(tmp_path):
+    write_runs(tmp_path/'images', range(4))
+    output = tmp_path/'fluo.csv'
+    assert reprocessor(output).run(str(tmp_path/'images'), progress=False) == 4
+    write_runs(tmp_path/'images', range(4, 7)) # more runs, e.g. the end of an interrupted reprocessing
+    assert reprocessor(output).run(str(tmp_path/'images'), progress=False) == 3
+    assert [int(row['run']) for row in read_table(output)] == list(range(7))
+    assert reprocessor(output).run(str(tmp_path/'images'), progress=False) == 0
+
+
+def test_table_of_other_parameters_is_not_resumed(tmp_path):
+    write_runs(tmp_path/'images', range(2))
+    output = tmp_path/'fluo.csv'
+    reprocessor(output).run(str(tmp_path/'images'), progress=False)
+    with pytest.raises(ValueError, match='different parameters'):
+        reprocessor(output, {'rois': 'shifted'}).run(str(tmp_path/'images'), progress=False)
+    assert len(read_table(output)) == 2
@@ -0,0 +1,66 @@
+import numpy as np
+
+from eqm_opx.cost_averaging import ShotAverager
+
+LOADED, EMPTY, BACKGROUND = 3000., 0., 12500.
+
+
+def bimodal_shots(n, fraction=0.3, seed=0):
+    """Counts of single atoms: each tweezer loaded (LOADED) or empty, with gaussian noise, and a steady background."""
+    rng = np.random.default_rng(seed)
+    loaded = rng.random((n, 2)) < fraction
+    counts = np.where(loaded, LOADED, EMPTY) + rng.normal(0, 50, (n, 2))
+    background = BACKGROUND + rng.normal(0, 50, (n, 2))
+    return counts, background
+
+
+def average(averager, counts, background=None):
+    averager.reset()
+    for i, shot in enumerate(counts):
+        averager.add(shot, None if background is None else background[i])
+    return averager.result()
+
+
+def test_bimodal_shots_are_not_outliers():
+    for fraction in (0.1, 0.3, 0.5, 0.8):
+        counts, background = bimodal_shots(40, fraction)
+        result = average(ShotAverager(min_shots=3, max_shots=40), counts, background)
+        assert result['outliers'] == 0
+        assert np.isclose(-result['cost'], counts[:, 1].mean())
+
+
+def test_first_shots_do_not_bias_the_cost():
+    # the first shots are all empty, then the tweezer is loaded half of the time
+    counts = np.zeros((30, 2))
+    counts[5::2, 1] = LOADED
+    counts += np.random.default_rng(1).normal(0, 50, counts.shape)
+    background = BACKGROUND + np.random.default_rng(2).normal(0, 50, counts.shape)
+    result = average(ShotAverager(min_shots=3, max_shots=30), counts, background)
+    assert result['outliers'] == 0
+    assert np.isclose(-result['cost'], counts[:, 1].mean())
+
+
+def test_background_outlier_is_rejected():
+    counts, background = bimodal_shots(20)
+    background[10] += 5000 # laser unlocked or cosmic ray during the shot
+    averager = ShotAverager(min_shots=3, max_shots=20)
+    result = average(averager, counts, background)
+    assert result['outliers'] == 1
+    assert np.isclose(-result['cost'], np.delete(counts[:, 1], 10).mean())
+
+
+def test_lost_shots_make_the_set_bad():
+    averager = ShotAverager(min_shots=3, max_shots=10, max_outliers=0.3)
+    for shot in range(10):
+        averager.add(None if shot % 2 else [LOADED, LOADED])
+    assert averager.result()['bad']
+
+
+def test_nan_background_does_not_disable_the_outlier_test():
+    averager = ShotAverager(min_shots=3, max_shots=20)
+    for shot in range(8):
+        averager.add([LOADED, LOADED], 100 + shot % 3)
+    assert not averager.add([LOADED, LOADED], np.nan)
+    assert not averager.add([LOADED, LOADED], 10000)
+    assert averager.outliers == 2
+    assert averager.n == 8
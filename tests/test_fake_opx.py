@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pytest
+
+from eqm_opx.fake_opx import FakeQuantumMachinesManager, FrameGenerator, gaussian_signal
+from eqm_opx.image_utilities import Photometry, RotatedCrop, tweezer_rois
+
+STREAM = 'cool_amp_imag_input_stream'
+
+
+@pytest.fixture
+def qmm(tmp_path):
+    return FakeQuantumMachinesManager(str(tmp_path), shot_period=0.01, signal=gaussian_signal({STREAM: 1.0}, {STREAM: 0.3}), first_run=12)
+
+
+def test_frames_put_the_spots_in_the_rois():
+    frames = FrameGenerator(seed=0)
+    rois, rois_bkg = tweezer_rois()
+    photometry = Photometry(rois, rois_bkg, RotatedCrop(-3, (slice(177, 217), slice(162, 217))))
+    norm_fluo, _, _ = photometry(np.stack([frames.frame([1, 0.5]), frames.frame([0, 0])]))
+    # most of the 3000 counts of a spot fall in its 5x5 roi, the noise of the background is ~ 25*sqrt(500)*sqrt(2)
+    assert np.all(norm_fluo[0] > [2000, 1000]) and np.all(np.abs(norm_fluo[1]) < 4*25*np.sqrt(1000))
+
+
+def test_job_takes_a_shot_per_complete_set(qmm):
+    qm = qmm.open_qm({})
+    job = qm.execute(None, streams=[STREAM, 'param_index_input_stream'], saves={'param_index': 'param_index_input_stream'})
+    for index, value in enumerate([0.5, 1.0, 1.5]):
+        job.push_to_input_stream(STREAM, value)
+        job.push_to_input_stream('param_index_input_stream', index)
+    job.push_to_input_stream(STREAM, 2.0) # incomplete set: no shot
+    handle = job.result_handles.get('param_index')
+    handle.wait_for_values(3, timeout=5)
+    qm.close()
+    assert [shot['run'] for shot in job.shots] == [12, 13, 14]
+    assert [shot['values'][STREAM] for shot in job.shots] == [0.5, 1.0, 1.5]
+    np.testing.assert_array_equal(handle.fetch(slice(1, 3), flat_struct=True), [1, 2])
+    assert sorted(os.listdir(qmm.image_dir)) == [f'R{run:05d}_{suffix}.fts' for run in (12, 13, 14) for suffix in ('AndorAbs', 'AndorAbs2')]
+    assert job.is_halted() and not job.result_handles.is_processing()
+
+
+def test_push_to_an_unknown_stream_is_rejected(qmm):
+    job = qmm.open_qm({}).execute(None, streams=[STREAM])
+    with pytest.raises(KeyError):
+        job.push_to_input_stream('missing_input_stream', 1.0)
+    job.halt()
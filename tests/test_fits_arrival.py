@@ -0,0 +1,91 @@
+import threading
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from eqm_opx.fits_arrival import BLOCK, FitsArrivalHandler, fits_complete, fits_expected_size
+
+
+def write_image(path, shape=(10, 13), size=None):
+    """Write an image with astropy, truncated to size bytes (None for the whole file)."""
+    fits.PrimaryHDU(np.zeros(shape, dtype=np.uint16)).writeto(path, overwrite=True)
+    if size is not None:
+        with open(path, 'r+b') as file:
+            file.truncate(size)
+    return str(path)
+
+
+def test_fits_complete_waits_for_the_data_and_the_padding(tmp_path):
+    path = write_image(tmp_path/'R00001_AndorAbs.fts')
+    assert fits_complete(path)
+    assert fits_expected_size(path) == 2*BLOCK
+    data = 10*13*2
+    assert fits_expected_size(path, padded=False) == BLOCK + data
+    write_image(path, size=BLOCK + data) # data written, padding missing
+    assert not fits_complete(path)
+    assert fits_complete(path, padded=False)
+    write_image(path, size=BLOCK - 1) # header incomplete
+    assert not fits_complete(path, padded=False)
+    assert not fits_complete(str(tmp_path/'missing.fts'))
+
+
+class Recorder(FitsArrivalHandler):
+    """Records the images and the pairs, and how many on_ready run at the same time."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.images, self.pairs = [], []
+        self.running = self.overlaps = 0
+
+    def on_ready(self, path):
+        self.running += 1
+        self.overlaps = max(self.overlaps, self.running)
+        time.sleep(0.005)
+        self.images.append(path)
+        self.running -= 1
+
+    def on_pair(self, first, second):
+        self.pairs.append((first, second))
+
+
+def wait_for(condition, timeout=5):
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_images_are_handled_once_one_at_a_time_in_order(tmp_path):
+    handler = Recorder()
+    paths = [write_image(tmp_path/f'R{run:05d}_{suffix}.fts') for run in range(10) for suffix in ('AndorAbs', 'AndorAbs2')]
+    threads = [threading.Thread(target=lambda: [handler.check(path) for path in paths]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wait_for(lambda: len(handler.images) == len(paths))
+    time.sleep(0.05)
+    assert sorted(handler.images) == sorted(paths) # each image once
+    assert handler.images == list(handler.ready) # in the order they were completed
+    assert handler.overlaps == 1
+    assert len(handler.pairs) == 10
+
+
+def test_incomplete_image_is_reported_when_written(tmp_path):
+    handler = Recorder(poll_interval=0.01)
+    path = write_image(tmp_path/'R00001_AndorAbs2.fts', size=BLOCK)
+    handler.check(path)
+    time.sleep(0.05)
+    assert handler.images == []
+    write_image(path) # the writer finishes, without any new event
+    wait_for(lambda: handler.images == [path])
+
+
+def test_reported_images_are_forgotten_after_keep(tmp_path):
+    handler = Recorder(keep=0)
+    first, second = write_image(tmp_path/'R00001_AndorAbs.fts'), write_image(tmp_path/'R00002_AndorAbs.fts')
+    handler.check(first)
+    time.sleep(0.01)
+    handler.check(second)
+    assert list(handler.ready) == [second]
@@ -0,0 +1,48 @@
+import numpy as np
+
+from eqm_opx.latency import SpanRecorder
+
+
+def test_ring_buffer_keeps_the_newest_spans_in_order():
+    recorder = SpanRecorder(size=4)
+    for n in range(6):
+        recorder.record('read', n, n + 0.001*n, run=n)
+    assert len(recorder) == 4
+    assert recorder.spans()['run'].tolist() == [2, 3, 4, 5]
+    summary = recorder.summary()['read']
+    assert summary['count'] == 4 and np.isclose(summary['max'], 5)
+
+
+def test_spans_of_a_shot_are_linked_by_the_index():
+    recorder = SpanRecorder()
+    recorder.record('push', 0.0, 0.1, index=3) # the push does not know the run
+    recorder.record('shot', 0.2, 0.5, run=12, index=3)
+    with recorder.span('photometry', run=12):
+        pass
+    recorder.record('push', 1.0, 1.1, index=4) # no shot yet
+    table = recorder.by_run()
+    assert list(table) == [12]
+    assert set(table[12]) == {'push', 'shot', 'photometry'}
+    assert table[12]['push'] == (0.0, 0.1)
+
+
+def test_export_and_load_merge_the_processes(tmp_path):
+    host, worker = SpanRecorder(), SpanRecorder()
+    host.record('push', 0.0, 0.1, index=0)
+    worker.record('read', 0.5, 0.6, run=7)
+    worker.record('photometry', 0.6, 0.7, run=7, index=0)
+    host.export(str(tmp_path/'host.npz'))
+    worker.export(str(tmp_path/'worker.npz'))
+    merged = SpanRecorder.load(str(tmp_path/'host.npz'), str(tmp_path/'worker.npz'))
+    assert merged.stages == ['push', 'read', 'photometry']
+    assert set(merged.by_run()[7]) == {'push', 'read', 'photometry'}
+    worker.export(str(tmp_path/'worker.txt'))
+    with open(tmp_path/'worker.txt') as file:
+        assert file.read().splitlines()[1] == 'read\t7\t-1\t0.500000\t100.000'
+
+
+def test_disabled_recorder_records_nothing():
+    recorder = SpanRecorder(enabled=False)
+    with recorder.span('read'):
+        pass
+    assert len(recorder) == 0 and recorder.summary() == {}
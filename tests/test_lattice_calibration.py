@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from eqm_opx.lattice_calibration import (calibrate, lattice_rois, load_calibration, overlapping_rois,
+                                         photometry_from_calibration, save_calibration)
+
+BACKGROUND, AMPLITUDE = 100., 400.
+
+
+def lattice_frames(rows=3, columns=4, angle=-3, spacing=8, n_frames=5, shape=(120, 120), seed=0):
+    """Frames with a gaussian spot on every site of a rows x columns lattice, rotated by angle degrees."""
+    grid = np.stack(np.meshgrid(np.arange(rows), np.arange(columns), indexing='ij'), -1).reshape(-1, 2)*spacing
+    theta = np.radians(angle)
+    rotation = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    sites = np.array(shape)/2 + (grid - grid.mean(axis=0)) @ rotation.T
+    y, x = np.mgrid[:shape[0], :shape[1]]
+    image = sum(AMPLITUDE*np.exp(-((y - row)**2 + (x - column)**2)/2) for row, column in sites)
+    return BACKGROUND + image + np.random.default_rng(seed).normal(0, 5, (n_frames,) + shape)
+
+
+def test_2d_lattice_net_counts_are_uniform():
+    frames = lattice_frames()
+    calibration = calibrate(frames, n_sites=12)
+    assert len(calibration['rois']) == 12
+    np.testing.assert_allclose(calibration['spacing'], [8, 8], atol=0.1)
+    net, raw, bkg = photometry_from_calibration(calibration)(frames[0])
+    # a spot of 400 counts and sigma 1 px gives about 2500 counts in a 5x5 roi, the background is subtracted
+    np.testing.assert_allclose(net, 2*np.pi*AMPLITUDE, rtol=0.1)
+    np.testing.assert_allclose(bkg, BACKGROUND*25, rtol=0.05)
+    assert not overlapping_rois(calibration['rois'], calibration['rois_bkg'])
+
+
+def test_background_on_a_tweezer_is_rejected():
+    with pytest.raises(ValueError):
+        calibrate(lattice_frames(), n_sites=12, bkg_shift=3)
+
+
+def test_single_row_background_below_its_site():
+    lattice = {'origin': [20., 10.], 'spacing': [0., 8.], 'indices': np.array([[0, 0], [0, 1]])}
+    crop, rois, rois_bkg = lattice_rois(lattice, lcrop=5)
+    for key in rois:
+        assert rois_bkg[key][0] == rois[key][0]
+        assert rois_bkg[key][1] == rois[key][1] + 15
+    assert crop[0].stop - crop[0].start >= rois_bkg['0'][1] + 5
+
+
+def test_calibration_file_keeps_one_entry_per_date(tmp_path):
+    path = str(tmp_path/'calibration.json')
+    save_calibration({'angle': 1}, path, '2024-12-17')
+    save_calibration({'angle': 2}, path, '2024-12-19')
+    assert load_calibration(path, '2024-12-16') is None
+    assert load_calibration(path, '2024-12-18')['angle'] == 1
+    assert load_calibration(path, '2024-12-19')['angle'] == 2
@@ -0,0 +1,50 @@
+import pytest
+from qm import generate_qua_script
+from qm.qua import declare_input_stream, program
+
+from eqm_opx.QuAM_utilities import MAX_PULSE_LENGTH, MIN_PULSE_CYCLES, long_pulse, solve_slices
+
+
+@pytest.mark.parametrize('time', [16, 1_000_000, MAX_PULSE_LENGTH, MAX_PULSE_LENGTH + 4, 150_150_000, 700_000_000])
+def test_slices_hit_the_time_with_the_fewest_slices(time):
+    slices, slice_cycles, last_cycles = solve_slices(time)
+    assert 4*((slices - 1)*slice_cycles + last_cycles) == time
+    assert MIN_PULSE_CYCLES <= slice_cycles and last_cycles*4 <= MAX_PULSE_LENGTH
+    assert slices == -(-time // MAX_PULSE_LENGTH) # each slice shorter than the maximum, no more slices than needed
+
+
+def test_given_number_of_slices():
+    assert solve_slices(1_000_000, 3) == (3, 83333, 83334)
+
+
+def test_time_off_the_clock_is_rounded_with_a_warning():
+    with pytest.warns(UserWarning):
+        slices, slice_cycles, last_cycles = solve_slices(1_000_006)
+    assert 4*((slices - 1)*slice_cycles + last_cycles) in (1_000_004, 1_000_008)
+
+
+@pytest.mark.parametrize('time, slices', [(12, None), (1000, 100), (10*MAX_PULSE_LENGTH, 2)])
+def test_impossible_slices_are_rejected(time, slices):
+    with pytest.raises(ValueError):
+        solve_slices(time, slices)
+
+
+def play_lines(build):
+    with program() as prog:
+        build()
+    script = generate_qua_script(prog)
+    return [line.strip() for line in script[script.index('with program()'):].splitlines() if 'play(' in line or 'with ' in line][1:]
+
+
+def test_long_pulse_loops_over_the_equal_slices():
+    lines = play_lines(lambda: long_pulse('const', 'ch', 1_000_000, slices=3))
+    assert lines == ['with for_(v1,0,(v1<2),(v1+1)):', 'play("const", "ch", duration=83333)', 'play("const", "ch", duration=83334)']
+
+
+def test_long_pulse_of_a_qua_time_plays_the_remainder_last():
+    def build():
+        time = declare_input_stream(int, name='time_input_stream')
+        long_pulse('const', 'ch', time)
+    lines = play_lines(build)
+    assert lines[0].startswith('with while_(')
+    assert len(lines) == 3 and lines[-1].startswith('play("const", "ch", duration=v')
@@ -0,0 +1,103 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from eqm_opx.mloop_interface import OPXInterface, OptimizationStopped
+
+
+class IndexResult:
+    """Result handle of the indices saved with the shots, recording the slices fetched."""
+
+    def __init__(self, values):
+        self.values = np.asarray(values)
+        self.fetched = []
+
+    def wait_for_values(self, count=1, timeout=10):
+        assert count <= len(self.values)
+
+    def count_so_far(self):
+        return len(self.values)
+
+    def fetch(self, item, flat_struct=False):
+        self.fetched.append((item.start, item.stop))
+        return self.values[item]
+
+
+class Job:
+    def __init__(self, saved):
+        self.result = IndexResult(saved)
+        self.result_handles = self
+        self.pushes = []
+
+    def get(self, name):
+        return self.result
+
+    def push_to_input_stream(self, name, value):
+        self.pushes.append((name, value))
+
+
+def test_lost_image_does_not_shift_the_next_shots():
+    saved = [0, 0, 1, 2, 2, 3] # the index of the set used by each shot
+    job = Job(saved)
+    interface = OPXInterface(job, [('amp_input_stream', float)], index_stream='param_index_input_stream', first_run=100)
+    runs = [100, 101, 102, 104, 105] # the image of the run 103 was lost
+    indices = [interface.report(-1., image=f'R{run:05d}_AndorAbs2.fts') for run in runs]
+    assert indices == [saved[run - 100] for run in runs]
+
+
+def test_indices_are_fetched_once():
+    job = Job(np.arange(50))
+    interface = OPXInterface(job, [('amp_input_stream', float)], index_stream='param_index_input_stream')
+    job.result.values = job.result.values[:10] # the shots saved so far
+    for run in range(10):
+        assert interface.report(-1., image=f'R{run + 7:05d}_AndorAbs2.fts') == run # first_run from the first image
+    job.result.values = np.arange(50)
+    assert interface.report(-1., image='R00030_AndorAbs2.fts') == 23
+    assert job.result.fetched == [(0, 10), (10, 50)]
+
+
+def report_when_pushed(interface, job, costs):
+    """Report the costs from another thread, as the image analysis does, once all the sets are pushed."""
+    def reporter():
+        while len(job.pushes) < len(costs):
+            time.sleep(0.001)
+        for cost in costs:
+            interface.report(cost)
+    thread = threading.Thread(target=reporter)
+    thread.start()
+    return thread
+
+
+def test_evaluate_pushes_the_sets_at_once_in_order():
+    job = Job([])
+    interface = OPXInterface(job, [('amp_input_stream', float), ('rf_input_stream', int)])
+    thread = report_when_pushed(interface, job, [-1., -2., -3.])
+    results = interface.evaluate([(0.1, 7.2), (0.2, 8.9), (0.3, 9.)])
+    thread.join()
+    assert job.pushes == [('amp_input_stream', 0.1), ('rf_input_stream', 7), ('amp_input_stream', 0.2),
+                          ('rf_input_stream', 8), ('amp_input_stream', 0.3), ('rf_input_stream', 9)]
+    assert [(result['index'], result['cost']) for result in results] == [(0, -1.), (1, -2.), (2, -3.)]
+
+
+def test_late_cost_of_a_timed_out_set_is_dropped():
+    job = Job([])
+    interface = OPXInterface(job, [('amp_input_stream', float)], timeout=0.05)
+    with pytest.warns(UserWarning, match='No cost received'):
+        assert interface.evaluate([(0.1,)]) == [{'bad': True, 'index': 0}]
+    thread = report_when_pushed(interface, job, [-1., -2.]) # the cost of the set 0 arrives with the one of the set 1
+    with pytest.warns(UserWarning, match='Discarded the cost of the parameter set 0'):
+        assert interface.population_map(None, [(0.2,)]) == [-2.]
+    thread.join()
+    with pytest.warns(UserWarning, match='No cost received'):
+        assert interface.population_map(None, [(0.3,)]) == [np.inf] # no cost: bad, infinite for scipy
+
+
+def test_stop_ends_the_waiting_optimizer():
+    interface = OPXInterface(Job([]), [('amp_input_stream', float)])
+    threading.Timer(0.05, interface.stop).start()
+    with pytest.raises(OptimizationStopped):
+        interface.get_next_cost_dict({'params': [0.1]})
+    with pytest.raises(OptimizationStopped):
+        interface.evaluate([(0.1,)])
@@ -0,0 +1,63 @@
+import warnings
+
+import numpy as np
+import pytest
+from qm.qua import program
+from quam.components import BasicQuAM, SingleChannel
+
+from eqm_opx.QuAM_utilities import add_multitone, long_multitone, multitone_waveform
+
+LENGTH = 2**12 # 244 kHz resolution
+
+
+def tones(n):
+    return (328 + 8*np.arange(n))*1e9/LENGTH, np.linspace(0.01, 0.02, n) # on the grid, from 80.08 MHz
+
+
+def test_waveform_holds_the_tones_and_loops_seamlessly():
+    frequencies, amplitudes = tones(10)
+    samples, realized, phases, _ = multitone_waveform(frequencies, amplitudes, LENGTH)
+    np.testing.assert_allclose(realized, frequencies)
+    spectrum = np.fft.rfft(samples)*2/LENGTH
+    bins = np.round(frequencies*LENGTH*1e-9).astype(int)
+    np.testing.assert_allclose(np.abs(spectrum[bins]), amplitudes)
+    np.testing.assert_allclose(np.angle(spectrum[bins]), np.angle(np.exp(1j*phases)), atol=1e-9)
+    assert np.abs(np.delete(spectrum, bins)).max() < 1e-12 # nothing else: the repetitions join without phase jumps
+
+
+def test_optimized_phases_lower_the_crest_factor():
+    frequencies, amplitudes = tones(50)
+    _, _, _, equal_phases = multitone_waveform(frequencies, amplitudes, LENGTH, phases=0)
+    _, _, _, schroeder = multitone_waveform(frequencies, amplitudes, LENGTH, iterations=0)
+    _, _, _, optimized = multitone_waveform(frequencies, amplitudes, LENGTH)
+    assert optimized <= schroeder < 3 < equal_phases
+
+
+def test_frequencies_off_the_grid_are_rounded_with_a_warning():
+    with pytest.warns(UserWarning, match='rounded'):
+        _, realized, _, _ = multitone_waveform([80e6 + 1e4], 0.1, LENGTH)
+    assert realized[0]*LENGTH*1e-9 == np.round(realized[0]*LENGTH*1e-9)
+    with pytest.raises(ValueError):
+        multitone_waveform([80e6, 80e6 + 1e4], 0.1, LENGTH, iterations=0) # closer than the resolution
+    with pytest.raises(ValueError):
+        multitone_waveform([80e6], 0.1, LENGTH + 2)
+
+
+def test_add_multitone_checks_the_output_range():
+    channel = SingleChannel(opx_output=('con1', 1), intermediate_frequency=0)
+    BasicQuAM().channels['AOM_tweez_mod'] = channel
+    frequencies, amplitudes = tones(10)
+    add_multitone(channel, 'tweez_array', frequencies, amplitudes, LENGTH)
+    assert len(channel.operations['tweez_array'].waveform_I) == LENGTH
+    with pytest.raises(ValueError):
+        add_multitone(channel, 'too_strong', frequencies, 10*amplitudes, LENGTH)
+    assert 'too_strong' not in channel.operations
+
+
+def test_long_multitone_plays_whole_repetitions():
+    with program():
+        assert long_multitone('tweez_array', 'AOM_tweez_mod', 10*LENGTH, LENGTH) == 10
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            assert long_multitone('tweez_array', 'AOM_tweez_mod', 10*LENGTH + 100, LENGTH) == 10
+        assert len(caught) == 1
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import pytest
+
+import eqm_opx
+
+HEAVY = ('qm', 'quam', 'matplotlib', 'mloop', 'scipy', 'astropy')
+
+
+def imported_after(statement):
+    """The heavy packages imported by a statement, in a fresh interpreter."""
+    code = f"import sys; {statement}; print(' '.join(sorted({{name.split('.')[0] for name in sys.modules}} & {set(HEAVY)!r})))"
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout.split()
+
+
+@pytest.mark.parametrize('module', ['', '.image_utilities', '.fits_arrival', '.run_log', '.latency', '.lattice_calibration',
+                                    '.image_watcher', '.stream_pusher', '.batch_reprocess'])
+def test_headless_modules_do_not_import_the_heavy_packages(module):
+    assert imported_after(f'import eqm_opx{module}') == []
+
+
+def test_submodules_are_loaded_on_first_access():
+    assert imported_after('import eqm_opx; eqm_opx.latency') == []
+    assert 'qm' in imported_after('import eqm_opx; eqm_opx.QuAM_sweep')
+    assert eqm_opx.QuAM_library.__name__ == 'eqm_opx.QuAM_library'
+    with pytest.raises(AttributeError):
+        eqm_opx.missing_module
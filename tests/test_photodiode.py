@@ -0,0 +1,50 @@
+import re
+
+import numpy as np
+import pytest
+from qm import generate_qua_script
+from qm.qua import declare_stream, program, stream_processing
+
+from eqm_opx.QuAM_utilities import photodiode_processing, photodiode_results, photodiode_shot
+
+EDGES = [0, 0.1, 0.2, 0.3]
+
+
+def processing_script(occupancy=True, **kwargs):
+    with program() as prog:
+        signal_stream, occupancy_stream = declare_stream(), declare_stream()
+        photodiode_shot('photodiode', 40_000, signal_stream, occupancy_stream if occupancy else None, threshold=0.1)
+        with stream_processing():
+            photodiode_processing(signal_stream, occupancy_stream if occupancy else None, **kwargs)
+    script = generate_qua_script(prog)
+    return script[script.index('with program()'):]
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'shots': 3}, {'edges': EDGES, 'name': 'pd'}, {'shots': 3, 'edges': EDGES, 'occupancy': False}])
+def test_results_have_the_names_of_the_stream_processing(kwargs):
+    script = processing_script(**kwargs)
+    saved = set(re.findall(r'\.save(?:_all)?\("(\w+)"\)', script))
+    assert set(photodiode_results([0.05, 0.15], threshold=0.1, **kwargs)) == saved
+
+
+def test_stream_processing_uses_the_bins_of_the_results():
+    script = processing_script(edges=EDGES)
+    assert 'histogram([[0.0, 0.1], [0.1, 0.2], [0.2, 0.3]])' in script
+    assert '(v1>0.1)' in script # the occupancy of the shot, before the average
+
+
+def test_results_reduce_the_shots():
+    signals = [0.05, 0.1, 0.25, 0.15, 0.3, 0.02, 0.2]
+    results = photodiode_results(signals, threshold=0.1, shots=3, edges=EDGES)
+    assert results['photodiode_mean'] == pytest.approx(np.mean(signals))
+    assert results['photodiode_histogram'].tolist() == [2, 2, 2] # lower edge included, 0.3 out of the last bin
+    assert results['photodiode_occupancy'] == pytest.approx(4/7) # 0.1 is not above the threshold
+    # the incomplete last set is not saved, as with buffer(shots)
+    np.testing.assert_allclose(results['photodiode_set_mean']['value'], [0.4/3, 0.47/3])
+    np.testing.assert_allclose(results['photodiode_set_occupancy']['value'], [1/3, 2/3])
+
+
+def test_results_without_shots():
+    results = photodiode_results([], shots=2)
+    assert np.isnan(results['photodiode_mean']) and np.isnan(results['photodiode_occupancy'])
+    assert len(results['photodiode_set_mean']) == 0
@@ -0,0 +1,49 @@
+import numpy as np
+from astropy.io import fits
+from scipy import ndimage
+
+from eqm_opx.image_utilities import Photometry, RotatedCrop, tweezer_rois
+
+CROP = (slice(177, 217), slice(162, 217))
+
+
+def naive_counts(image_rot, rois, rois_bkg):
+    """The roi sums of the original notebook, with numpy slicing."""
+    sum_fluo = np.array([image_rot[y:y+l, x:x+l].sum() for x, y, l in rois.values()])
+    sum_bkg = np.array([image_rot[y:y+l, x:x+l].sum() for x, y, l in rois_bkg.values()])
+    return sum_fluo - sum_bkg, sum_fluo, sum_bkg
+
+
+def frames(n=3):
+    rng = np.random.default_rng(1)
+    return ndimage.gaussian_filter(rng.random((n, 256, 300))*1000, (0, 2, 2))
+
+
+def test_counts_equal_the_roi_sums():
+    rois, rois_bkg = tweezer_rois(n_tweezers=3, lcrop=5)
+    rois['edge'], rois_bkg['edge'] = [52, 37, 5], [0, 0, 5] # clipped by the border of the crop
+    image = frames(1)[0]
+    for expected, counts in zip(naive_counts(image, rois, rois_bkg), Photometry(rois, rois_bkg)(image)):
+        np.testing.assert_allclose(counts, expected)
+
+
+def test_counts_with_the_rotation_equal_the_sums_on_the_rotated_image():
+    rois, rois_bkg = tweezer_rois()
+    photometry = Photometry(rois, rois_bkg, RotatedCrop(-3, CROP))
+    stack = frames()
+    counts = photometry(stack)
+    assert counts[0].shape == (3, 2)
+    for k, image in enumerate(stack):
+        image_rot = ndimage.rotate(image, -3)[CROP]
+        for expected, result in zip(naive_counts(image_rot, rois, rois_bkg), counts):
+            np.testing.assert_allclose(result[k], expected, atol=0.5) # the weights under 1e-6 are dropped: less than a count
+
+
+def test_load_equals_the_counts_of_the_image(tmp_path):
+    rois, rois_bkg = tweezer_rois()
+    image = np.round(frames(1)[0])
+    path = str(tmp_path/'R00001_AndorAbs2.fts')
+    fits.PrimaryHDU(image.astype(np.uint16)).writeto(path)
+    expected = Photometry(rois, rois_bkg, RotatedCrop(-3, CROP))(image)
+    for counts, result in zip(expected, Photometry(rois, rois_bkg, RotatedCrop(-3, CROP)).load(path)):
+        np.testing.assert_allclose(result, counts)
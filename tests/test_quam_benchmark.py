@@ -0,0 +1,36 @@
+from qm import generate_qua_script
+from qm.qua import declare, for_, infinite_loop_, play, program
+
+from eqm_opx.QuAM_benchmark import compare, count_statements, program_body
+
+
+def counts(build):
+    with program() as prog:
+        build()
+    return count_statements(program_body(generate_qua_script(prog)))
+
+
+def test_counts_of_nested_loops():
+    def build():
+        i, j = declare(int), declare(int)
+        with for_(i, 0, i < 10, i + 1):
+            play('high', 'ch')
+            with for_(j, 0, j < 3, j + 1):
+                play('low', 'ch')
+        play('high', 'ch')
+    assert counts(build) == {'statements': 5, 'loops': 2, 'plays': 3, 'executed_plays': 10 + 30 + 1}
+
+
+def test_unbounded_loop_has_no_executed_plays():
+    def build():
+        with infinite_loop_():
+            play('high', 'ch')
+    assert counts(build)['executed_plays'] is None
+
+
+def test_compare_reports_the_metrics_which_grew():
+    case = {'macro': 'long_pulse', 'parameters': {'time': 1000}}
+    old = {'results': [{**case, 'build_time': 1.0, 'statements': 4, 'plays': 2}]}
+    new = {'results': [{**case, 'build_time': 1.1, 'statements': 5, 'plays': 2}]}
+    regressions = compare(old, new, tolerance=0.2)
+    assert [regression['metric'] for regression in regressions] == ['statements']
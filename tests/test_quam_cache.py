@@ -0,0 +1,68 @@
+import os
+
+from qm.qua import program
+from quam.components import BasicQuAM, SingleChannel
+from quam.components.pulses import SquarePulse
+
+from eqm_opx import QuAM_cache
+from eqm_opx.QuAM_cache import QuAMCache
+from eqm_opx.QuAM_utilities import long_pulse
+
+
+def machine(amplitude=0.3):
+    machine = BasicQuAM()
+    channel = SingleChannel(opx_output=('con1', 1), intermediate_frequency=80e6)
+    machine.channels['AOM_tweez_mod'] = channel
+    channel.operations['tweez_pulse'] = SquarePulse(length=1000, amplitude=amplitude)
+    return machine
+
+
+def build(time):
+    with program() as prog:
+        long_pulse('tweez_pulse', 'AOM_tweez_mod', time)
+    return prog
+
+
+def body(script):
+    """The program part of a script of generate_qua_script, without the header with the date."""
+    return script[script.index('with program()'):]
+
+
+def test_config_hit_and_miss(tmp_path):
+    cache = QuAMCache(str(tmp_path))
+    config = cache.config(machine())
+    assert cache.config(machine()) == config
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.config(machine(amplitude=0.2)) # another machine, another entry
+    assert cache.misses == 2
+
+
+def test_program_is_rebuilt_from_the_cached_script(tmp_path):
+    cache = QuAMCache(str(tmp_path))
+    config = cache.config(machine())
+    cache.program(build, config, 100_000)
+    cached = cache.program(build, config, 100_000)
+    assert (cache.hits, cache.misses) == (1, 2) # the config and the program written, then the program read
+    assert body(QuAM_cache.generate_qua_script(cached, config)) == body(cache.script(build, config, 100_000))
+    cache.program(build, config, 200_000) # other arguments, other entry
+    assert cache.misses == 3
+
+
+def test_script_miss_builds_the_program_once(tmp_path, monkeypatch):
+    cache = QuAMCache(str(tmp_path))
+    config = cache.config(machine())
+    calls = []
+    generate = QuAM_cache.generate_qua_script
+    monkeypatch.setattr(QuAM_cache, 'generate_qua_script', lambda *args: calls.append(args) or generate(*args))
+    script = cache.script(build, config, 100_000)
+    assert len(calls) == 1 and cache.misses == 2 # the config and the program
+    assert cache.script(build, config, 100_000) == script
+    assert len(calls) == 1
+
+
+def test_eviction_keeps_the_entry_just_written(tmp_path):
+    cache = QuAMCache(str(tmp_path), max_size=10)
+    config = cache.config(machine())
+    cache.program(build, config, 100_000)
+    entries = os.listdir(tmp_path)
+    assert len(entries) == 1 and entries[0].endswith('.qua.py')
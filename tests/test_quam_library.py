@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from quam.components import BasicQuAM, SingleChannel
+
+from eqm_opx.QuAM_library import add_pulses, config_size, dedupe_config, pulse_table
+
+CHANNELS = ('AOM_double_cooler', 'AOM_double_repumper', 'AOM_single_cooler')
+
+
+def machine_config():
+    machine = BasicQuAM()
+    for port, name in enumerate(CHANNELS, start=1):
+        machine.channels[name] = SingleChannel(opx_output=('con1', port), intermediate_frequency=80e6)
+    add_pulses(machine, [(channel, 'low_pulse', 1000, 0) for channel in CHANNELS] + [
+        ('AOM_double_cooler', 'cool_high_pulse', 400, 0.2),
+        ('AOM_double_cooler', 'cool_high_pulse_debug', 400, 0.2), # debug copy
+        ('AOM_double_repumper', 'repump_high_pulse', 400, 0.2), # same content on another channel
+        ('AOM_single_cooler', 'cool_pulse', 400, 0.3), # same length, other amplitude
+        ('AOM_single_cooler', 'zero_pulse', 400, 0)]) # same amplitude as the lows, other length
+    return machine.generate_config()
+
+
+def resolved(config, element, operation):
+    """The content played by an operation of an element: the pulse with its waveforms in place of their names."""
+    pulse = dict(config['pulses'][config['elements'][element]['operations'][operation]])
+    pulse['waveforms'] = {port: config['waveforms'][name] for port, name in pulse['waveforms'].items()}
+    return pulse
+
+
+def test_dedupe_keeps_what_every_operation_plays():
+    config = machine_config()
+    deduped = dedupe_config(config)
+    for element, values in config['elements'].items():
+        assert deduped['elements'][element]['operations'].keys() == values['operations'].keys()
+        for operation in values['operations']:
+            assert resolved(deduped, element, operation) == resolved(config, element, operation)
+
+
+def test_dedupe_stores_each_content_once():
+    config = machine_config()
+    deduped = dedupe_config(config)
+    operations = {element: values['operations'] for element, values in deduped['elements'].items()}
+    assert len({operations[channel]['low_pulse'] for channel in CHANNELS}) == 1
+    assert operations['AOM_double_cooler']['cool_high_pulse'] == operations['AOM_double_cooler']['cool_high_pulse_debug'] \
+        == operations['AOM_double_repumper']['repump_high_pulse']
+    assert len({operations['AOM_single_cooler'][name] for name in ('low_pulse', 'cool_pulse', 'zero_pulse')}) == 3
+    # pulses: the low (1000 ns, 0 V), the high (400 ns, 0.2 V), the cool pulse and the zero pulse (plus the const pulses of QuAM)
+    assert config_size(deduped)['pulses'] == config_size(config)['pulses'] - 4
+    assert sorted(config['waveforms'][name]['sample'] for name in deduped['waveforms']) == sorted({waveform['sample'] for waveform in config['waveforms'].values()})
+    assert config['pulses'] == machine_config()['pulses'] # the input is not modified
+
+
+def test_pulse_table_rounds_to_the_clock_cycle():
+    table = pulse_table([('AOM_double_cooler', 'cool_high_pulse', 401.9, 0.2), ('AOM_double_cooler', 'low_pulse', 1002.1, 0)])
+    np.testing.assert_array_equal(table['length'], [400, 1004])
+    for rows in ([('AOM_double_cooler', 'short_pulse', 12, 0.2)], [('AOM_double_cooler', 'strong_pulse', 400, 0.6)],
+                 [('AOM_double_cooler', 'low_pulse', 400, 0)]*2):
+        with pytest.raises(ValueError):
+            pulse_table(rows)
+    with pytest.raises(ValueError):
+        add_pulses(BasicQuAM(), [('AOM_missing', 'low_pulse', 400, 0)])
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from eqm_opx.QuAM_utilities import ramp_table
+
+
+@pytest.mark.parametrize('time', [10_000, 1_000_004, 52])
+def test_ramp_lasts_the_requested_time(time):
+    factors, step_cycles, last_cycles = ramp_table(time, shape='linear')
+    assert 4*(step_cycles*(len(factors) - 1) + last_cycles) == time
+    assert np.all(np.diff(factors) > 0)
+    assert factors[0] == 0
+
+
+@pytest.mark.parametrize('time, n_steps, step_duration', [(12, None, None), (0, None, None), (100, None, 400), (100, 0, None)])
+def test_ramp_without_steps_is_rejected(time, n_steps, step_duration):
+    with pytest.raises(ValueError):
+        ramp_table(time, n_steps, step_duration)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from astropy.io import fits
+from scipy import ndimage
+
+from eqm_opx.image_utilities import RotatedCrop, get_image_from_file, to_rotated
+
+CROP = (slice(177, 217), slice(162, 217))
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return ndimage.gaussian_filter(rng.random((256, 300))*1000, 2)
+
+
+@pytest.mark.parametrize('order', [1, 3])
+def test_rotated_crop_equals_the_rotation_of_the_full_frame(image, order):
+    expected = ndimage.rotate(image, -3, order=order)[CROP]
+    # order 3: the spline prefilter of the window differs from the one of the frame by far less than a count
+    np.testing.assert_allclose(RotatedCrop(-3, CROP, order=order)(image), expected, atol=1e-3)
+
+
+def test_load_reads_the_window_with_the_scaling(image, tmp_path):
+    path = str(tmp_path/'R00001_AndorAbs2.fts')
+    counts = np.round(image).astype(np.uint16)
+    fits.PrimaryHDU(counts).writeto(path) # stored as int16 with BZERO = 32768
+    np.testing.assert_array_equal(get_image_from_file(path), counts)
+    rotate_crop = RotatedCrop(-3, CROP, order=1)
+    np.testing.assert_allclose(rotate_crop.load(path), ndimage.rotate(counts.astype(float), -3, order=1)[CROP], atol=1e-9)
+    assert np.prod(rotate_crop.window_shape) < counts.size # only the window is read
+
+
+def test_matrix_applies_the_interpolation(image):
+    rotate_crop = RotatedCrop(-3, CROP)
+    expected = rotate_crop(image)
+    window = image[rotate_crop.window]
+    np.testing.assert_allclose(rotate_crop.matrix() @ window.ravel(), expected.ravel(), atol=1e-2)
+
+
+def test_to_rotated_follows_a_pixel():
+    spot = np.zeros((256, 300))
+    spot[190, 180] = 1
+    rotated = ndimage.rotate(spot, -3, order=1)
+    np.testing.assert_array_equal(np.round(to_rotated([[190, 180]], -3, spot.shape)[0]), np.unravel_index(rotated.argmax(), rotated.shape))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from eqm_opx.run_log import HEADER_SIZE, LivePlot, RunLog
+
+
+def fill(log, runs, start=0):
+    for run in range(start, start + runs):
+        net = np.array([run, 2.*run])
+        log.append(f'R{run:05d}_AndorAbs', net, net + 10, np.full(2, 10.), timestamp=1.7e9 + run, file_time=1.7e9 + run)
+
+
+def test_records_round_trip_and_reopen(tmp_path):
+    path = str(tmp_path/'scan_1.runlog')
+    fill(RunLog(path), 5)
+    log = RunLog(path) # reopened to continue the scan
+    fill(log, 3, start=5)
+    records = log.read()
+    assert len(log) == 8
+    np.testing.assert_array_equal(records['run'], np.arange(8))
+    np.testing.assert_array_equal(records['net'][:, 1], 2.*np.arange(8))
+    np.testing.assert_array_equal(records['raw'] - records['bkg'], records['net'])
+    assert records['name'][3] == b'R00003_AndorAbs'
+    np.testing.assert_array_equal(log.read(6)['run'], [6, 7])
+
+
+def test_interrupted_record_is_dropped(tmp_path):
+    path = str(tmp_path/'scan_1.runlog')
+    log = RunLog(path)
+    fill(log, 2)
+    with open(path, 'ab') as file:
+        file.write(b'\0'*10)
+    with pytest.warns(UserWarning):
+        log = RunLog(path)
+    assert len(log) == 2
+    assert (len(log)*log.dtype.itemsize + HEADER_SIZE) == (tmp_path/'scan_1.runlog').stat().st_size
+
+
+def test_other_number_of_tweezers_is_rejected(tmp_path):
+    path = str(tmp_path/'scan_1.runlog')
+    fill(RunLog(path), 1)
+    with pytest.raises(ValueError):
+        RunLog(path, n_tweezers=3)
+
+
+def test_csv_has_the_columns_of_the_image_handler(tmp_path):
+    log = RunLog(str(tmp_path/'scan_1.runlog'))
+    fill(log, 2)
+    log.to_csv(str(tmp_path/'scan_1.csv'))
+    rows = (tmp_path/'scan_1.csv').read_text().splitlines()
+    assert len(rows) == 2
+    assert rows[1].split('\t')[0] == 'R00001_AndorAbs' and len(rows[1].split('\t')) == 2 + 3*2
+
+
+def test_live_plot_draws_a_bounded_number_of_points(tmp_path):
+    pytest.importorskip('matplotlib')
+    log = RunLog(str(tmp_path/'scan_1.runlog'))
+    live = LivePlot(log, window=100)
+    fill(log, 50)
+    live.update()
+    assert len(live.lines[0].get_xdata()) == 50
+    fill(log, 5000, start=50)
+    live.update()
+    x, y = live.lines[1].get_data()
+    assert len(x) <= 2*100
+    assert x[0] == 0 and x[-1] == 5049 # the whole scan, the last runs point by point
+    np.testing.assert_array_equal(y, 2.*x + 10)
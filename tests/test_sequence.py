@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from qm import generate_qua_script
+from qm.qua import declare_input_stream, fixed, program
+from quam.components import BasicQuAM, SingleChannel
+
+from eqm_opx.QuAM_sequence import Constant, Ramp, ShotSequence, Strobe
+
+ELEMENTS = ('AOM_tweez_mod', 'AOM_double_cooler', 'AOM_single_cooler')
+
+
+def sequence():
+    machine = BasicQuAM()
+    for port, name in enumerate(ELEMENTS, start=1):
+        machine.channels[name] = SingleChannel(opx_output=('con1', port), intermediate_frequency=80e6)
+    seq = ShotSequence(machine)
+    seq.phase('loading', 100_000, {'AOM_tweez_mod': Ramp(0.07, n_steps=50)})
+    seq.phase('plateau', 50_002, {'AOM_tweez_mod': Constant(0.07)})
+    seq.phase('collision', 1_000_000, {
+        'AOM_tweez_mod': Strobe(1.7e6, 0.6, 0, 0.15),
+        'AOM_double_cooler': Strobe(1.7e6, 0.3, 0.38, delay_fraction=0.65),
+        'AOM_single_cooler': Constant(0.08, amp_mod='cool_amp')})
+    return machine, seq
+
+
+def test_timing_table_of_the_strobes():
+    _, seq = sequence()
+    table = seq.timing_table()
+    assert list(table['duration']) == [100_000, 50_000, 1_000_000, 1_000_000, 1_000_000]
+    cooler = table[table['element'] == 'AOM_double_cooler'][0]
+    assert (cooler['high'], cooler['delay'], cooler['low']) == (176, 384, 28) # period of 588 ns
+    assert cooler['periods']*588 + cooler['residual'] == 1_000_000
+    assert cooler['residual'] == 0 or cooler['residual'] >= 16
+
+
+def test_rendered_channels_stay_aligned():
+    _, seq = sequence()
+    timeline = seq.render({'cool_amp': 0.5})
+    assert {timeline.duration(element) for element in ELEMENTS} == {1_150_000}
+    assert timeline.check_alignment() == {}
+    np.testing.assert_allclose(timeline.sample('AOM_single_cooler', [149_999, 150_000, 1_149_999]), [0, 0.04, 0.04])
+    np.testing.assert_allclose(timeline.sample('AOM_tweez_mod', [100_000, 149_999]), [0.07, 0.07])
+
+
+def test_identical_pulses_are_shared():
+    machine, seq = sequence()
+    seq.build()
+    # tweezer: ramp and constant share the 16 ns pulse of 0.07, plus the high, low and rest of the strobe
+    assert len(machine.channels['AOM_tweez_mod'].operations) == 4
+
+
+def test_emitted_program_is_valid_qua():
+    machine, seq = sequence()
+    seq.build()
+    config = machine.generate_config()
+    with program() as prog:
+        seq.emit({'cool_amp': declare_input_stream(fixed, name='cool_amp_input_stream')})
+    script = generate_qua_script(prog, config)
+    assert 'SERIALIZATION' not in script
+    assert script.count('play(') >= 5
+
+
+def test_strobe_too_fast_is_rejected():
+    _, seq = sequence()
+    seq.phase('imaging', 1_000_000, {'AOM_double_cooler': Strobe(40e6, 0.3, 0.38)})
+    with pytest.raises(ValueError):
+        seq.build()
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+from quam.components import BasicQuAM, SingleChannel
+from quam.components.pulses import SquarePulse
+
+from eqm_opx.QuAM_timeline import Timeline
+from eqm_opx.QuAM_utilities import add_stroboscopic_chunk
+
+HIGH, LOW = 0.3, 0.05
+OPERATIONS = ('cool_high_pulse', 'cool_low_pulse')
+
+
+def cooler_machine():
+    machine = BasicQuAM()
+    channel = SingleChannel(opx_output=('con1', 1), intermediate_frequency=80e6)
+    machine.channels['AOM_double_cooler'] = channel
+    channel.operations['cool_high_pulse'] = SquarePulse(length=200, amplitude=HIGH)
+    channel.operations['cool_low_pulse'] = SquarePulse(length=388, amplitude=LOW)
+    return machine, channel
+
+
+def render(periods, delay=0, amp_mod=None, chunked=False):
+    machine, channel = cooler_machine()
+    periods_per_chunk = add_stroboscopic_chunk(channel, 'cool_chunk', OPERATIONS, periods, delay, max_samples=2000)
+    timeline = Timeline(machine)
+    if chunked:
+        timeline.stroboscopic_chunked('cool_chunk', 'AOM_double_cooler', periods, periods_per_chunk, amp_mod=amp_mod)
+    else:
+        timeline.stroboscopic(OPERATIONS, 'AOM_double_cooler', periods, delay, amp_mod=amp_mod)
+    return timeline
+
+
+@pytest.mark.parametrize('periods, delay', [(7, 0), (7, 40), (3, 0), (1, 16)])
+def test_chunked_plays_the_same_envelope(periods, delay):
+    plain = render(periods, delay)
+    chunked = render(periods, delay, chunked=True)
+    element = 'AOM_double_cooler'
+    assert plain.duration(element) == chunked.duration(element)
+    for a, b in zip(plain.envelope(element), chunked.envelope(element)):
+        np.testing.assert_allclose(a, b)
+
+
+def test_chunked_amp_mod_scales_the_low_pulse_too():
+    element = 'AOM_double_cooler'
+    plain = render(5, amp_mod=0.5)
+    chunked = render(5, amp_mod=0.5, chunked=True)
+    times = np.arange(0, plain.duration(element), 4)
+    high = render(5).sample(element, times) == HIGH
+    np.testing.assert_allclose(plain.sample(element, times)[high], chunked.sample(element, times)[high])
+    np.testing.assert_allclose(plain.sample(element, times)[~high], LOW)
+    np.testing.assert_allclose(chunked.sample(element, times)[~high], LOW*0.5)
+
+
+def test_zero_periods_is_rejected():
+    _, channel = cooler_machine()
+    with pytest.raises(ValueError):
+        add_stroboscopic_chunk(channel, 'cool_chunk', OPERATIONS, 0)
+
+
+def test_short_delay_is_rejected():
+    from qm.qua import program
+    from eqm_opx.QuAM_utilities import stroboscopic
+    with pytest.raises(ValueError), program():
+        stroboscopic(OPERATIONS, 'AOM_double_cooler', 5, 8)
+
+
+def test_python_times_set_the_period():
+    machine, _ = cooler_machine()
+    timeline = Timeline(machine)
+    timeline.stroboscopic(OPERATIONS, 'AOM_double_cooler', 4, delay=40, high_time=100, period_time=588)
+    assert timeline.duration('AOM_double_cooler') == 4*588
+    np.testing.assert_allclose(timeline.sample('AOM_double_cooler', [0, 39, 40, 139, 140, 587, 588]), [LOW, LOW, HIGH, HIGH, LOW, LOW, LOW])
+    from qm.qua import program
+    from eqm_opx.QuAM_utilities import stroboscopic
+    with pytest.raises(ValueError), program():
+        stroboscopic(OPERATIONS, 'AOM_double_cooler', 4, 40, high_time=540, period_time=588) # 8 ns of low time
+    with pytest.raises(ValueError), program():
+        stroboscopic(OPERATIONS, 'AOM_double_cooler', 4, period_time=588) # no high_time
+
+
+def test_real_time_delay_and_low_time_are_clamped():
+    from qm import generate_qua_script
+    from qm.qua import declare_input_stream, program
+    from eqm_opx.QuAM_utilities import stroboscopic
+    with program() as prog:
+        delay = declare_input_stream(int, name='delay_input_stream')
+        high_time = declare_input_stream(int, name='high_input_stream')
+        stroboscopic(OPERATIONS, 'AOM_double_cooler', 5, delay, high_time=high_time, period_time=588)
+    lines = [line.strip() for line in generate_qua_script(prog).splitlines()]
+    assert 'assign(v1, (input_stream_delay_input_stream>>2))' in lines # ns -> clock cycles
+    assert lines[lines.index('with if_(((v1>0)&(v1<4))):') + 1] == 'assign(v1, 4)'
+    assert 'assign(v3, ((147-v2)-v1))' in lines
+    assert lines[lines.index('with if_((v3<4)):') + 1] == 'assign(v3, 4)'
+    # the delay is checked once, outside of the loops of the periods
+    assert sum(line.startswith('with for_(') for line in lines) == 2 and lines.index('with if_((v1>0)):') < lines.index('with else_():')
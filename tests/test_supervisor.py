@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import numpy as np
+
+from eqm_opx.supervisor import Supervisor
+
+
+class SlowInterface:
+    """report blocks as OPXInterface.report does while it waits for the shot index."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.costs = []
+
+    def report(self, cost, **extra):
+        time.sleep(self.delay)
+        self.costs.append(cost)
+        return len(self.costs) - 1
+
+    def stop(self):
+        pass
+
+
+def test_blocking_report_does_not_stall_the_loop():
+    async def scenario():
+        supervisor = Supervisor(None, None, SlowInterface(0.5), '.', photometry=object())
+        supervisor.loop = asyncio.get_running_loop()
+        supervisor.results = asyncio.Queue()
+        for run in range(2):
+            future = supervisor.loop.create_future()
+            future.set_result(((np.zeros(2), np.array([0., 100.*run]), np.zeros(2)), (0, 0, 0)))
+            await supervisor.results.put((f'R{run}_AndorAbs2.fts', future))
+        reporter = asyncio.create_task(supervisor._reporter())
+        ticks = 0
+        while supervisor.processed < 2 and not reporter.done() and ticks < 1000:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        reporter.cancel()
+        assert supervisor.processed == 2
+        return supervisor, ticks
+
+    supervisor, ticks = asyncio.run(scenario())
+    assert ticks > 50 # the loop ran during the two reports of 0.5 s
+    assert supervisor.interface.costs == [0, -100] # in arrival order
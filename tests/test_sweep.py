@@ -0,0 +1,62 @@
+import re
+
+import numpy as np
+import pytest
+from qm import generate_qua_script
+from qm.qua import amp, declare_stream, play, program, stream_processing
+
+from eqm_opx.QuAM_sweep import Sweep
+
+
+def axes():
+    return {'frequency': np.arange(10000, 30001, 10000), 'amp_mod': np.linspace(0.5, 1.5, 2)}
+
+
+def script(sweep):
+    with program() as prog:
+        index_stream = declare_stream()
+        with sweep.loop(index_stream) as point:
+            play('high_pulse'*amp(point['amp_mod']), 'test')
+        with stream_processing():
+            index_stream.save_all('sweep_index')
+    script = generate_qua_script(prog)
+    return script[script.index('with program()'):]
+
+
+def test_points_are_in_row_major_order():
+    sweep = Sweep(**axes())
+    table = sweep.points()
+    assert table['index'].tolist() == list(range(6))
+    assert table['frequency'].tolist() == [10000, 10000, 20000, 20000, 30000, 30000] # the first axis is the slowest
+    assert table['amp_mod'].tolist() == [0.5, 1.5]*3
+    assert all(sweep.point(row['index']) == {'frequency': row['frequency'], 'amp_mod': row['amp_mod']} for row in table)
+
+
+def test_nested_loops_follow_the_axes():
+    lines = [line.strip() for line in script(Sweep(**axes())).splitlines()]
+    assert 'a1 = declare(int, value=[10000, 20000, 30000])' in lines
+    assert 'a2 = declare(fixed, value=[0.5, 1.5])' in lines
+    loops = [line for line in lines if line.startswith('with for_(')]
+    assert [re.search(r'<(\d+)\)', line).group(1) for line in loops] == ['3', '2'] # frequency outside, amp_mod inside
+    body = lines[lines.index(loops[1]):]
+    # index saved before the block of the point and incremented after it
+    assert [line.split('(')[0] for line in body[1:] if line.split('(')[0] in ('save', 'play', 'assign')] == ['assign', 'save', 'play', 'assign']
+
+
+def test_ordered_sweep_plays_the_permutation():
+    order = [3, 0, 5, 1, 4, 2]
+    sweep = Sweep(order=order, **axes())
+    table = sweep.points()
+    assert table['index'].tolist() == order
+    lines = [line.strip() for line in script(sweep).splitlines()]
+    assert f'a1 = declare(int, value={order})' in lines
+    assert f"a2 = declare(int, value={table['frequency'].tolist()})" in lines
+    assert f"a3 = declare(fixed, value={table['amp_mod'].tolist()})" in lines
+    assert any(line.startswith('with for_each_(') for line in lines)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'amp_mod': []}, {'delay': np.zeros((2, 2))}, {'frequency': [1e4, 2e4]},
+                                    {'order': [0, 6], 'frequency': np.arange(6)}])
+def test_invalid_sweeps_are_rejected(kwargs):
+    with pytest.raises(ValueError):
+        Sweep(**kwargs)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from quam.components import BasicQuAM, SingleChannel
+from quam.components.pulses import SquarePulse
+
+from eqm_opx.QuAM_timeline import Timeline
+
+
+def aom_machine():
+    machine = BasicQuAM()
+    for port, name in ((1, 'AOM_tweez_mod'), (2, 'AOM_double_cooler'), (3, 'AOM_double_repumper')):
+        channel = SingleChannel(opx_output=('con1', port), intermediate_frequency=80e6)
+        machine.channels[name] = channel
+        channel.operations['const'] = SquarePulse(length=100, amplitude=0.2)
+    return machine
+
+
+@pytest.fixture
+def timeline():
+    return Timeline(aom_machine())
+
+
+def test_long_pulse_is_one_segment_of_the_exact_time(timeline):
+    timeline.long_pulse('const', 'AOM_tweez_mod', 150_150_000)
+    assert timeline.duration('AOM_tweez_mod') == 150_150_000
+    starts, amplitudes = timeline.envelope('AOM_tweez_mod') # the slices are merged
+    np.testing.assert_array_equal(starts, [0])
+    np.testing.assert_allclose(amplitudes, [0.2])
+
+
+def test_long_ramp_rises_over_the_requested_time(timeline):
+    duration = timeline.long_ramp('const', 'AOM_tweez_mod', 10_000, n_steps=100)
+    assert duration == timeline.duration('AOM_tweez_mod') == 10_000
+    _, amplitudes = timeline.envelope('AOM_tweez_mod')
+    assert np.all(np.diff(amplitudes) > 0) and amplitudes[-1] < 0.2
+
+
+def test_align_pads_the_played_elements_and_delays_the_others(timeline):
+    timeline.play('const', 'AOM_tweez_mod')
+    timeline.play('const', 'AOM_double_cooler', duration=100) # 400 ns
+    assert timeline.check_alignment() == {'AOM_tweez_mod': 100, 'AOM_double_cooler': 400}
+    timeline.align()
+    assert timeline.check_alignment() == {}
+    timeline.play('const', 'AOM_double_repumper') # first play after the align: starts at 400 ns
+    assert timeline.duration('AOM_double_repumper') == 500
+    np.testing.assert_allclose(timeline.sample('AOM_double_repumper', [0, 399, 400, 499, 500]), [0, 0, 0.2, 0.2, 0])
+    np.testing.assert_allclose(timeline.sample('AOM_tweez_mod', [50, 150]), [0.2, 0])
+
+
+def test_zero_length_segments_do_not_split_the_envelope(timeline):
+    timeline.play('const', 'AOM_tweez_mod')
+    timeline.wait(0, 'AOM_tweez_mod')
+    timeline.play('const', 'AOM_tweez_mod')
+    starts, amplitudes = timeline.envelope('AOM_tweez_mod')
+    np.testing.assert_array_equal(starts, [0])
+    assert timeline.duration('AOM_tweez_mod') == 200
+
+
+def test_unknown_operation_is_reported(timeline):
+    with pytest.raises(KeyError):
+        timeline.play('missing', 'AOM_tweez_mod')